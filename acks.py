@@ -0,0 +1,218 @@
+import time
+import logging
+import threading
+
+from metrics import Counter
+
+# Coalesced score acknowledgements.
+#
+# During a burst every recorded score used to get its own confirmation
+# message, which floods the channel and spends the rate-limit budget the
+# winner announcement needs. Acknowledgements are now collected per channel
+# for a short window and sent as one "Recorded: A (3), B (5), C (7)" message.
+# A lone acknowledgement keeps the old wording. The buffer is sent early once
+# it holds the maximum number of entries or its text would pass Discord's
+# length limit, before the channel's winner announcement, and on shutdown.
+# The gateway bot's reaction on the score message stays immediate.
+
+# Default seconds acknowledgements are collected before they are sent
+ACK_WINDOW = 3.0
+# Default most acknowledgements merged into one message
+ACK_MAX_ENTRIES = 25
+# Discord's message length limit
+MAX_MESSAGE_LENGTH = 2000
+
+log = logging.getLogger(__name__)
+
+ACKS = Counter('globle_acks_total', 'Score acknowledgements queued for sending')
+ACK_MESSAGES = Counter('globle_ack_messages_total', 'Messages sent to acknowledge scores')
+
+
+# Text acknowledging a list of (name, guesses, first) entries
+def ack_text(entries):
+    if len(entries) == 1:
+        name, guesses, first = entries[0]
+        if first:
+            return f"Recorded your Globle score of {guesses} guesses, {name}! You're the first to submit today."
+        return f"Recorded your Globle score of {guesses} guesses, {name}!"
+    return "Recorded: " + ", ".join(_entry_text(entry) for entry in entries)
+
+
+def _entry_text(entry):
+    name, guesses, first = entry
+    return f"{name} ({guesses}, first today)" if first else f"{name} ({guesses})"
+
+
+# Pending acknowledgements per key, shared by the threaded and asyncio aggregators
+class _AckBuffer:
+    def __init__(self, window, max_entries):
+        self.window = window
+        self.max_entries = max_entries
+        # key -> {user_id: (name, guesses, first)} in the order scores arrived
+        self._pending = {}
+        self.stats = {'acks': 0, 'messages': 0}
+
+    # Add an entry. Returns the batches that are ready to send and whether
+    # the key's window has just started.
+    def _add(self, key, user_id, name, guesses, first):
+        ACKS.inc()
+        self.stats['acks'] += 1
+        entry = (name, guesses, first)
+        if self.window <= 0:
+            return [(key, [entry])], False
+        ready = []
+        entries = self._pending.get(key)
+        if entries is not None:
+            previous = entries.pop(user_id, None)
+            if previous is not None:
+                # An improved score replaces the user's earlier one in the same message
+                entry = (name, guesses, first or previous[2])
+            if entries and len(ack_text(list(entries.values()) + [entry])) > MAX_MESSAGE_LENGTH:
+                ready.append((key, list(entries.values())))
+                entries = None
+        started = entries is None
+        if started:
+            entries = self._pending[key] = {}
+        entries[user_id] = entry
+        if len(entries) >= self.max_entries:
+            ready.append((key, list(self._pending.pop(key).values())))
+        return ready, started and key in self._pending
+
+    def _pop(self, key):
+        entries = self._pending.pop(key, None)
+        return (key, list(entries.values())) if entries else None
+
+    def _counted(self, entries):
+        ACK_MESSAGES.inc()
+        self.stats['messages'] += 1
+        return ack_text(entries)
+
+
+# For threaded callers: send(key, content) is called from a timer thread,
+# or from the caller's thread for a batch flushed early
+class AckAggregator(_AckBuffer):
+    def __init__(self, send, window=ACK_WINDOW, max_entries=ACK_MAX_ENTRIES):
+        super().__init__(window, max_entries)
+        self.send = send
+        self._cond = threading.Condition()
+        # key -> monotonic time its window closes
+        self._deadlines = {}
+        self._thread = None
+        self._closed = False
+
+    # Acknowledge a recorded score
+    def add(self, key, user_id, name, guesses, first=False):
+        with self._cond:
+            if self._closed:
+                ready = [(key, [(name, guesses, first)])]
+            else:
+                ready, started = self._add(key, user_id, name, guesses, first)
+                if started:
+                    self._deadlines[key] = time.monotonic() + self.window
+                    self._start()
+                    self._cond.notify()
+        self._send(ready)
+
+    # Send a key's pending acknowledgements now, or every key's if key is None
+    def flush(self, key=None):
+        with self._cond:
+            keys = list(self._pending) if key is None else [key]
+            ready = [batch for batch in map(self._pop, keys) if batch]
+            for flushed, _ in ready:
+                self._deadlines.pop(flushed, None)
+        self._send(ready)
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self.flush()
+
+    def _start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='ack-aggregator')
+            self._thread.daemon = True
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._closed:
+                    now = time.monotonic()
+                    due = [key for key, deadline in self._deadlines.items() if deadline <= now]
+                    if due:
+                        break
+                    self._cond.wait(min(self._deadlines.values()) - now if self._deadlines else None)
+                if self._closed:
+                    return
+                ready = []
+                for key in due:
+                    del self._deadlines[key]
+                    batch = self._pop(key)
+                    if batch:
+                        ready.append(batch)
+            self._send(ready)
+
+    def _send(self, ready):
+        for key, entries in ready:
+            try:
+                self.send(key, self._counted(entries))
+            except Exception:
+                log.exception("Error sending score acknowledgements")
+
+
+# For the event loop: `await send(key, content)` runs as a task
+class AsyncAckAggregator(_AckBuffer):
+    def __init__(self, send, window=ACK_WINDOW, max_entries=ACK_MAX_ENTRIES):
+        super().__init__(window, max_entries)
+        self.send = send
+        self._timers = {}
+        self._tasks = set()
+
+    # Acknowledge a recorded score; must be called on the event loop
+    def add(self, key, user_id, name, guesses, first=False):
+        ready, started = self._add(key, user_id, name, guesses, first)
+        for flushed, _ in ready:
+            timer = self._timers.pop(flushed, None)
+            if timer is not None:
+                timer.cancel()
+        if started:
+            import asyncio
+            self._timers[key] = asyncio.get_running_loop().call_later(self.window, self._expire, key)
+        for batch in ready:
+            self._spawn(batch)
+
+    # Send a key's pending acknowledgements (every key's if None). With wait,
+    # also wait for all acknowledgement sends in flight.
+    async def flush(self, key=None, wait=True):
+        keys = list(self._pending) if key is None else [key]
+        for flushed in keys:
+            timer = self._timers.pop(flushed, None)
+            if timer is not None:
+                timer.cancel()
+            batch = self._pop(flushed)
+            if batch:
+                self._spawn(batch)
+        if wait and self._tasks:
+            import asyncio
+            await asyncio.gather(*list(self._tasks), return_exceptions=True)
+
+    close = flush
+
+    def _expire(self, key):
+        self._timers.pop(key, None)
+        batch = self._pop(key)
+        if batch:
+            self._spawn(batch)
+
+    def _spawn(self, batch):
+        import asyncio
+        task = asyncio.get_running_loop().create_task(self._deliver(*batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _deliver(self, key, entries):
+        try:
+            await self.send(key, self._counted(entries))
+        except Exception:
+            log.exception("Error sending score acknowledgements")
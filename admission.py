@@ -0,0 +1,101 @@
+import os
+import math
+import threading
+
+from metrics import Counter, Gauge
+
+# Admission control for the webhook bot's ingress.
+#
+# Every message event is put in a class before any work is done on it:
+# score submissions (and other chatter that has to be parsed), commands that
+# read or write the disk, and read commands answered from memory, such as
+# !score. Each class may have a limited number of events queued or being
+# processed. An event over its class's budget is turned away straight away,
+# with 429 and a Retry-After estimated from how fast the class is draining,
+# instead of piling up behind disk and outbound HTTP until requests time out.
+# Because the budgets are separate, a flood of scores can't starve commands,
+# and reads keep being answered while writes are being shed.
+
+SCORE = 'score'
+COMMAND = 'command'
+READ = 'read'
+CLASSES = (SCORE, COMMAND, READ)
+
+# Commands answered from memory without touching the disk
+READ_COMMANDS = frozenset({'!score', '!leaderboard', '!help'})
+
+# Default events per class that may be queued or in progress
+BUDGETS = {
+    SCORE: int(os.getenv('WEBHOOK_SCORE_BUDGET', '64')),
+    COMMAND: int(os.getenv('WEBHOOK_COMMAND_BUDGET', '16')),
+    READ: int(os.getenv('WEBHOOK_READ_BUDGET', '64')),
+}
+
+# Bounds of the Retry-After sent with a shed event, in seconds
+MIN_RETRY_AFTER = 1
+MAX_RETRY_AFTER = 60
+# Weight of the latest event in the moving average of processing time
+SMOOTHING = 0.1
+
+INGRESS_DEPTH = Gauge('globle_ingress_depth', 'Webhook events queued or being processed, by class', ['class'])
+INGRESS_SHED = Counter('globle_ingress_shed_total', 'Webhook events turned away because their class was over budget', ['class'])
+
+
+# Raised when an event is over its class's budget; the caller answers 429
+class Overloaded(Exception):
+    def __init__(self, kind, retry_after):
+        super().__init__(f"{kind} events over budget")
+        self.kind = kind
+        self.retry_after = retry_after
+
+
+# Class of a message, from its content alone
+def classify(content):
+    if not content.startswith('!'):
+        return SCORE
+    if content.strip() in READ_COMMANDS:
+        return READ
+    return COMMAND
+
+
+class IngressBudget:
+    # `concurrency` is how many events of a class are processed at once (e.g.
+    # the async mode's workers); None when every admitted event runs at once
+    def __init__(self, budgets=None, concurrency=None):
+        self.budgets = dict(BUDGETS if budgets is None else budgets)
+        self.concurrency = concurrency
+        self._lock = threading.Lock()
+        self._outstanding = dict.fromkeys(self.budgets, 0)
+        # Moving average of seconds spent processing one event, per class
+        self._seconds = dict.fromkeys(self.budgets, 0.0)
+        self.stats = {'admitted': 0, 'shed': 0}
+        for kind in self.budgets:
+            INGRESS_DEPTH.labels(kind).set_function(lambda kind=kind: self._outstanding[kind])
+
+    # Take a slot for an event of this class, or raise Overloaded
+    def admit(self, kind):
+        with self._lock:
+            if self._outstanding[kind] < self.budgets[kind]:
+                self._outstanding[kind] += 1
+                self.stats['admitted'] += 1
+                return
+            self.stats['shed'] += 1
+            retry_after = self._retry_after(kind)
+        INGRESS_SHED.labels(kind).inc()
+        raise Overloaded(kind, retry_after)
+
+    # Give the slot back once the event is done; `seconds` is how long it took to process
+    def release(self, kind, seconds=None):
+        with self._lock:
+            self._outstanding[kind] -= 1
+            if seconds is not None:
+                self._seconds[kind] += (seconds - self._seconds[kind]) * SMOOTHING
+
+    def depth(self, kind):
+        return self._outstanding[kind]
+
+    # Seconds until the events ahead of a new one should have drained
+    def _retry_after(self, kind):
+        parallel = self.concurrency or self.budgets[kind]
+        drain = self._outstanding[kind] * self._seconds[kind] / max(1, parallel)
+        return min(MAX_RETRY_AFTER, max(MIN_RETRY_AFTER, math.ceil(drain)))
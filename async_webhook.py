@@ -0,0 +1,151 @@
+import os
+import socket
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from aiohttp import web
+
+from metrics import REGISTRY, CONTENT_TYPE
+from admission import Overloaded
+
+# asyncio serving mode for the webhook bot.
+#
+# The request handler only parses and validates the event, puts it on a
+# bounded queue and answers right away. A pool of workers takes events off
+# the queue and runs the existing command and score handlers in threads, so
+# slow Discord responses and disk work never hold up the acknowledgement.
+# Events over their class's budget are turned away with 429 (see
+# admission.py); cheap reads answered from memory skip the queue, so they
+# aren't stuck behind a backlog of writes. They still run in threads of
+# their own, never on the event loop: the first event for a channel opens
+# its files.
+
+# Number of workers processing queued events
+WORKERS = int(os.getenv('WEBHOOK_WORKERS', '4'))
+# Maximum number of events waiting to be processed
+QUEUE_SIZE = int(os.getenv('WEBHOOK_QUEUE_SIZE', '1000'))
+# Number of threads handling reads that skip the queue
+READERS = int(os.getenv('WEBHOOK_READERS', '4'))
+
+EVENTS_KEY = web.AppKey('events', asyncio.Queue)
+READERS_KEY = web.AppKey('readers', ThreadPoolExecutor)
+
+log = logging.getLogger(__name__)
+
+
+# Take events off the queue and process them in the thread pool
+async def worker(events, executor, handle_message):
+    loop = asyncio.get_running_loop()
+    while True:
+        message = await events.get()
+        try:
+            await loop.run_in_executor(executor, handle_message, message)
+        except Exception:
+            log.exception("Error processing queued event")
+        finally:
+            events.task_done()
+
+
+# Build the aiohttp application around the bot's event handlers.
+# read_event(data) returns (response, message) or raises Overloaded; with
+# blocking_read (e.g. when it checks a database other workers write to), it
+# is called on the reader threads. handle_message(message) does the work. Messages for which inline(message)
+# is true are handled while the request waits instead of being queued, and
+# on_shed(message) is called for a message dropped because the queue is full.
+# read_interaction(body, signature, timestamp) answers slash commands at
+# /interactions with (status, response); it only defers slow work, so it is
+# called in the request handler.
+def create_app(read_event, handle_message, workers=WORKERS, queue_size=QUEUE_SIZE, inline=None, on_shed=None,
+               read_interaction=None, readers=READERS, blocking_read=False):
+    app = web.Application()
+
+    # Route to handle Discord webhook events
+    async def discord_webhook(request):
+        try:
+            data = await request.json()
+        except (ValueError, UnicodeDecodeError):
+            return web.json_response({'status': 'invalid json'}, status=400)
+        if not isinstance(data, dict):
+            return web.json_response({'status': 'invalid event'}, status=400)
+
+        try:
+            if blocking_read:
+                response, message = await asyncio.get_running_loop().run_in_executor(request.app[READERS_KEY],
+                                                                                     read_event, data)
+            else:
+                response, message = read_event(data)
+        except Overloaded as e:
+            return web.json_response({'status': 'busy'}, status=429, headers={'Retry-After': str(e.retry_after)})
+        if message is not None and inline is not None and inline(message):
+            await asyncio.get_running_loop().run_in_executor(request.app[READERS_KEY], handle_message, message)
+        elif message is not None:
+            try:
+                request.app[EVENTS_KEY].put_nowait(message)
+            except asyncio.QueueFull:
+                if on_shed is not None:
+                    on_shed(message)
+                return web.json_response({'status': 'busy'}, status=503, headers={'Retry-After': '1'})
+
+        return web.json_response(response)
+
+    # Route to handle slash-command interactions
+    async def discord_interactions(request):
+        body = await request.read()
+        status, response = read_interaction(body, request.headers.get('X-Signature-Ed25519'),
+                                            request.headers.get('X-Signature-Timestamp'))
+        return web.json_response(response, status=status)
+
+    # Metrics in the Prometheus text format
+    async def metrics(request):
+        return web.Response(body=REGISTRY.render().encode(), headers={'Content-Type': CONTENT_TYPE})
+
+    async def start_workers(app):
+        events = asyncio.Queue(maxsize=queue_size)
+        executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='webhook-worker')
+        tasks = [asyncio.create_task(worker(events, executor, handle_message)) for _ in range(workers)]
+        app[EVENTS_KEY] = events
+        app[READERS_KEY] = ThreadPoolExecutor(max_workers=readers, thread_name_prefix='webhook-reader')
+        yield
+        # Finish what was already acknowledged before shutting down
+        try:
+            await asyncio.wait_for(events.join(), timeout=10)
+        except asyncio.TimeoutError:
+            log.warning("Shutting down with %d unprocessed events", events.qsize())
+        for task in tasks:
+            task.cancel()
+        executor.shutdown(wait=True)
+        app[READERS_KEY].shutdown(wait=True)
+
+    app.router.add_post('/discord-webhook', discord_webhook)
+    if read_interaction is not None:
+        app.router.add_post('/interactions', discord_interactions)
+    app.router.add_get('/metrics', metrics)
+    app.cleanup_ctx.append(start_workers)
+    return app
+
+
+# Serve until interrupted. on_listening(port) is called once the port accepts
+# connections, so slower startup work can wait until then. With `fd`, accept
+# on that already listening socket (e.g. one shared by several workers)
+# instead of binding host and port.
+def run(read_event, handle_message, host='0.0.0.0', port=8080, on_listening=None, fd=None, inline=None, on_shed=None,
+        read_interaction=None, blocking_read=False):
+    app = create_app(read_event, handle_message, inline=inline, on_shed=on_shed, read_interaction=read_interaction,
+                     blocking_read=blocking_read)
+    asyncio.run(_serve(app, host, port, on_listening, fd))
+
+
+async def _serve(app, host, port, on_listening, fd=None):
+    runner = web.AppRunner(app)
+    await runner.setup()
+    try:
+        if fd is not None:
+            await web.SockSite(runner, socket.socket(fileno=fd)).start()
+        else:
+            await web.TCPSite(runner, host, port).start()
+        if on_listening is not None:
+            on_listening(runner.addresses[0][1])
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
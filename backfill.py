@@ -0,0 +1,212 @@
+import os
+import json
+import asyncio
+import logging
+import argparse
+import datetime
+
+import pytz
+
+from score_parser import parse_globle_score
+from score_store import write_json_atomic
+from score_history import ScoreHistory
+
+# Backfill of Globle results that were posted before the bot joined a channel.
+#
+# Messages are consumed oldest first, either from channel.history() as an
+# async stream or from an exported JSON dump. They are parsed in batches, and
+# each batch's best score per user and day is merged into the history database
+# in one transaction. Scores from the current day go to the live score store,
+# through the partition's state writer when one is given.
+# A checkpoint with the last processed message ID is written after every
+# batch, so an interrupted backfill resumes where it stopped. The aggregate
+# stats are rebuilt once at the end rather than after every batch.
+#
+#   python backfill.py <dump.json> --db globle.db [--timezone UTC] [--checkpoint FILE]
+
+# Messages parsed and written per transaction
+BATCH_SIZE = 1000
+# Messages per channel.history() request, and the pause after each, to leave
+# rate-limit headroom for live traffic
+PAGE_SIZE = 100
+PAGE_DELAY = 0.25
+
+log = logging.getLogger(__name__)
+
+
+# A message reduced to what the backfill needs
+def message_record(message_id, author_id, content, created_at, bot=False):
+    return {
+        "id": int(message_id),
+        "author_id": str(author_id),
+        "content": content or "",
+        "created_at": created_at,
+        "bot": bool(bot),
+    }
+
+
+def record_from_message(message):
+    return message_record(message.id, message.author.id, message.content, message.created_at, message.author.bot)
+
+
+# Accepts Discord API message objects and DiscordChatExporter-style entries
+def record_from_dump(entry):
+    author = entry.get("author", {})
+    created_at = datetime.datetime.fromisoformat(entry["timestamp"].replace('Z', '+00:00'))
+    return message_record(entry["id"], author["id"], entry.get("content"), created_at,
+                          author.get("bot", author.get("isBot", False)))
+
+
+# Message records from an exported JSON dump, oldest first
+def load_dump(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    entries = data["messages"] if isinstance(data, dict) else data
+    return sorted((record_from_dump(entry) for entry in entries), key=lambda record: record["id"])
+
+
+class Backfill:
+    def __init__(self, history, timezone, store=None, checkpoint_path=None, batch_size=BATCH_SIZE, writer=None):
+        self.history = history
+        self.tz = pytz.timezone(timezone) if isinstance(timezone, str) else timezone
+        self.store = store
+        self.writer = writer
+        self.checkpoint_path = checkpoint_path
+        self.batch_size = batch_size
+        self.checkpoint = self._load_checkpoint()
+        self.stats = {'messages': 0, 'scores': 0, 'days': 0, 'today': 0}
+        self._days = set()
+
+    # ID of the last message already processed, or None
+    @property
+    def last_message_id(self):
+        return self.checkpoint.get("last_message_id")
+
+    # Backfill from an iterable of message records, oldest first
+    def run(self, records):
+        batch = []
+        for record in records:
+            if self.last_message_id is not None and record["id"] <= self.last_message_id:
+                continue
+            batch.append(record)
+            if len(batch) >= self.batch_size:
+                self.process_batch(batch)
+                batch = []
+        if batch:
+            self.process_batch(batch)
+        return self.finish()
+
+    # Backfill a channel through channel.history(), optionally stopping after `limit` messages
+    async def run_channel(self, channel, limit=None, page_size=PAGE_SIZE, page_delay=PAGE_DELAY, after=None):
+        loop = asyncio.get_running_loop()
+        if after is None and self.last_message_id is not None:
+            after = _Snowflake(self.last_message_id)
+        batch = []
+        fetched = 0
+        async for message in channel.history(limit=limit, after=after, oldest_first=True):
+            batch.append(record_from_message(message))
+            fetched += 1
+            if len(batch) >= self.batch_size:
+                # Parsing and the database write run off the event loop
+                await loop.run_in_executor(None, self.process_batch, batch)
+                batch = []
+            if page_delay and fetched % page_size == 0:
+                await asyncio.sleep(page_delay)
+        if batch:
+            await loop.run_in_executor(None, self.process_batch, batch)
+        return await loop.run_in_executor(None, self.finish)
+
+    # Parse a batch, merge its scores into history, and advance the checkpoint
+    def process_batch(self, batch):
+        today = None
+        if self.store is not None:
+            today = self._write(self._start_day)
+        days = {}
+        today_scores = []
+        for record in batch:
+            if record["bot"]:
+                continue
+            guesses = parse_globle_score(record["content"])
+            if guesses is None:
+                continue
+            self.stats['scores'] += 1
+            day = record["created_at"].astimezone(self.tz).strftime('%Y-%m-%d')
+            if day == today:
+                today_scores.append((record["author_id"], guesses))
+                continue
+            scores = days.setdefault(day, {})
+            if record["author_id"] not in scores or guesses < scores[record["author_id"]]:
+                # Keep the order in which each best score was reached, for tie-breaks
+                scores.pop(record["author_id"], None)
+                scores[record["author_id"]] = guesses
+
+        self.history.record_days(days, merge=True, defer_stats=True)
+        if today_scores:
+            self._write(self._record_today, today_scores)
+
+        self.stats['messages'] += len(batch)
+        self._days.update(days)
+        self.stats['days'] = len(self._days)
+        self.stats['today'] += len(today_scores)
+        self.checkpoint["last_message_id"] = batch[-1]["id"]
+        self.checkpoint["messages"] = self.checkpoint.get("messages", 0) + len(batch)
+        self._save_checkpoint()
+
+    # Rebuild the aggregates once everything is in; returns the run's stats
+    def finish(self):
+        self.history.rebuild_stats()
+        self.checkpoint["finished_at"] = datetime.datetime.now(datetime.timezone.utc).isoformat()
+        self._save_checkpoint()
+        log.info("Backfill finished", extra=dict(self.stats))
+        return dict(self.stats)
+
+    # Run a change to the live store on the writer if there is one
+    def _write(self, fn, *args):
+        if self.writer is not None:
+            return self.writer.call(fn, *args)
+        return fn(*args)
+
+    def _start_day(self):
+        self.store.ensure_today()
+        return self.store.date
+
+    def _record_today(self, scores):
+        for user_id, guesses in scores:
+            self.store.record(user_id, guesses)
+
+    def _load_checkpoint(self):
+        if self.checkpoint_path and os.path.exists(self.checkpoint_path):
+            with open(self.checkpoint_path, 'r') as f:
+                return json.load(f)
+        return {}
+
+    def _save_checkpoint(self):
+        if self.checkpoint_path:
+            write_json_atomic(self.checkpoint_path, self.checkpoint)
+
+
+# Minimal stand-in for nextcord.Object, which history(after=...) accepts
+class _Snowflake:
+    def __init__(self, id):
+        self.id = id
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Import Globle scores from an exported JSON message dump')
+    parser.add_argument('dump', help='JSON file: a list of Discord message objects or a DiscordChatExporter export')
+    parser.add_argument('--db', default='globle.db', help='history database to import into')
+    parser.add_argument('--timezone', default='UTC', help='timezone whose days the scores belong to')
+    parser.add_argument('--checkpoint', help='checkpoint file for resuming an interrupted import')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    args = parser.parse_args()
+
+    history = ScoreHistory(args.db)
+    try:
+        stats = Backfill(history, args.timezone, checkpoint_path=args.checkpoint, batch_size=args.batch_size).run(load_dump(args.dump))
+    finally:
+        history.close()
+    print(f"Scanned {stats['messages']} messages: imported {stats['scores']} scores over {stats['days']} days")
+
+
+if __name__ == '__main__':
+    main()
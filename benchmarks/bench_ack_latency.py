@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+# Webhook acknowledgement latency: Flask path vs async serving mode.
+#
+# Starts the stub Discord endpoint, points the bot at it, serves the same
+# globle_webhook handlers through Flask and through async_webhook, and fires
+# concurrent score and command events at each. Reports p50/p99 time until
+# the HTTP response. Runs in a temporary directory so no real data is touched.
+#
+#   python benchmarks/bench_ack_latency.py [--requests 2000] [--concurrency 32]
+#       [--discord-latency 0.15] [--blocking-sends]
+import os
+import sys
+import time
+import random
+import asyncio
+import logging
+import argparse
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import requests
+
+from stub_discord import StubDiscord
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def make_events(count, seed=1):
+    rng = random.Random(seed)
+    events = []
+    for i in range(count):
+        user_id = str(10 ** 17 + rng.randrange(count))
+        if rng.random() < 0.1:
+            content = rng.choice(["!leaderboard", "!score", "!help"])
+        else:
+            content = f"Globle: I got it in {rng.randint(1, 20)} guesses"
+        events.append({"type": 0, "message": {"id": str(i), "content": content,
+                                              "author": {"id": user_id, "username": f"user{user_id[-4:]}"}}})
+    return events
+
+
+def fire(url, events, concurrency):
+    local = threading.local()
+
+    def post(event):
+        session = getattr(local, 'session', None)
+        if session is None:
+            session = local.session = requests.Session()
+        start = time.perf_counter()
+        response = session.post(url, json=event)
+        return time.perf_counter() - start, response.status_code
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(post, events))
+    return results, time.perf_counter() - start
+
+
+def report(name, results, elapsed):
+    latencies = [latency for latency, _ in results]
+    errors = sum(1 for _, status in results if status != 200)
+    print(f"{name:<8} p50 {percentile(latencies, 50) * 1000:8.2f} ms   p99 {percentile(latencies, 99) * 1000:8.2f} ms   "
+          f"{len(results) / elapsed:8.0f} req/s   non-200: {errors}")
+
+
+def serve_flask(app):
+    from werkzeug.serving import make_server
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, f"http://127.0.0.1:{server.server_port}/discord-webhook"
+
+
+def serve_async(app):
+    from aiohttp import web
+    loop = asyncio.new_event_loop()
+    runner = web.AppRunner(app)
+    ready = threading.Event()
+    address = {}
+
+    def run():
+        asyncio.set_event_loop(loop)
+        loop.run_until_complete(runner.setup())
+        site = web.TCPSite(runner, '127.0.0.1', 0)
+        loop.run_until_complete(site.start())
+        address['port'] = site._server.sockets[0].getsockname()[1]
+        ready.set()
+        loop.run_forever()
+
+    threading.Thread(target=run, daemon=True).start()
+    ready.wait()
+
+    def stop():
+        asyncio.run_coroutine_threadsafe(runner.cleanup(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+
+    return stop, f"http://127.0.0.1:{address['port']}/discord-webhook"
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare webhook ack latency between Flask and async modes')
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--discord-latency', type=float, default=0.15, help='stub Discord response delay in seconds')
+    parser.add_argument('--blocking-sends', action='store_true',
+                        help='send replies with a blocking requests.post, like the original bot')
+    args = parser.parse_args()
+
+    stub = StubDiscord(limit=10 ** 9, latency=args.discord_latency).start()
+    os.environ['DISCORD_WEBHOOK_URL'] = stub.url
+    os.chdir(tempfile.mkdtemp(prefix='globle-bench-'))
+
+    import globle_webhook
+    import async_webhook
+    from dedupe import MessageDedupe
+
+    if args.blocking_sends:
+        def blocking_send(content, partition=None):
+            return requests.post(stub.url, json={"content": content}).status_code == 204
+        globle_webhook.send_discord_message = blocking_send
+
+    events = make_events(args.requests)
+    print(f"{args.requests} events, concurrency {args.concurrency}, Discord latency {args.discord_latency * 1000:.0f} ms, "
+          f"{'blocking' if args.blocking_sends else 'queued'} sends\n")
+
+    server, url = serve_flask(globle_webhook.create_app())
+    results, elapsed = fire(url, events, args.concurrency)
+    server.shutdown()
+    report("flask", results, elapsed)
+
+    # Same event IDs again, so start with an empty dedupe cache
+    globle_webhook.reset_daily_scores()
+    globle_webhook.message_dedupe = MessageDedupe()
+    app = async_webhook.create_app(globle_webhook.read_event, globle_webhook.handle_message,
+                                   inline=globle_webhook.is_read, on_shed=globle_webhook.shed_message)
+    stop, url = serve_async(app)
+    results, elapsed = fire(url, events, args.concurrency)
+    report("async", results, elapsed)
+    stop()
+
+    stub.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+# Backfill importer throughput and resume check, fully offline.
+#
+# Builds a synthetic channel export from the parser corpus and imports it
+# three ways: from the JSON dump, through Backfill.run_channel() against a
+# fake channel whose history() pages like Discord's, and as an interrupted
+# dump import resumed from its checkpoint. The resumed import must produce
+# the same history database as the uninterrupted one.
+#
+#   python benchmarks/bench_backfill.py [--messages 50000] [--days 90] [--users 200]
+#       [--batch-size 1000] [--page-latency 0.0]
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+import datetime
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from backfill import Backfill, load_dump
+from score_history import ScoreHistory
+
+CORPUS_FILE = os.path.join(BENCH_DIR, 'parser_corpus.json')
+# Discord's epoch for snowflake IDs, in milliseconds
+DISCORD_EPOCH = 1420070400000
+
+
+def snowflake(moment, sequence):
+    return ((int(moment.timestamp() * 1000) - DISCORD_EPOCH) << 22) | (sequence & 0x3FFFFF)
+
+
+# An export in the shape of Discord API message objects, oldest first
+def make_dump(count, days, users, seed=1):
+    rng = random.Random(seed)
+    with open(CORPUS_FILE, encoding='utf-8') as f:
+        corpus = json.load(f)
+    texts = [entry["text"] for entry in corpus]
+    start = datetime.datetime(2025, 1, 1, tzinfo=datetime.timezone.utc)
+    span = days * 86400
+    moments = sorted(start + datetime.timedelta(seconds=rng.uniform(0, span)) for _ in range(count))
+    messages = []
+    for i, moment in enumerate(moments):
+        user = rng.randrange(users)
+        messages.append({
+            "id": str(snowflake(moment, i)),
+            "timestamp": moment.isoformat(),
+            "content": rng.choice(texts),
+            "author": {"id": str(10 ** 17 + user), "username": f"player{user}", "bot": rng.random() < 0.02},
+        })
+    return messages
+
+
+class FakeMessage:
+    def __init__(self, entry):
+        self.id = int(entry["id"])
+        self.content = entry["content"]
+        self.created_at = datetime.datetime.fromisoformat(entry["timestamp"])
+        self.author = FakeAuthor(entry["author"])
+
+
+class FakeAuthor:
+    def __init__(self, author):
+        self.id = int(author["id"])
+        self.bot = author["bot"]
+
+
+# Serves history() in pages of 100 with a configurable delay per page, like the REST API
+class FakeChannel:
+    def __init__(self, messages, page_latency):
+        self.messages = [FakeMessage(entry) for entry in messages]
+        self.page_latency = page_latency
+        self.pages = 0
+
+    async def history(self, limit=None, after=None, oldest_first=True):
+        after_id = after.id if after is not None else 0
+        remaining = [message for message in self.messages if message.id > after_id][:limit]
+        for i in range(0, len(remaining), 100):
+            self.pages += 1
+            await asyncio.sleep(self.page_latency)
+            for message in remaining[i:i + 100]:
+                yield message
+
+
+def dump_scores(path):
+    history = ScoreHistory(path)
+    try:
+        with history._lock:
+            scores = history._conn.execute("SELECT day, user_id, guesses FROM scores ORDER BY day, user_id").fetchall()
+            winners = history._conn.execute("SELECT day, user_id, guesses FROM winners ORDER BY day").fetchall()
+            stats = history._conn.execute("SELECT * FROM user_stats ORDER BY user_id").fetchall()
+        return scores, winners, stats
+    finally:
+        history.close()
+
+
+def report(name, stats, elapsed):
+    print(f"{name:<22} {stats['messages']:>7} messages in {elapsed:7.3f} s   {stats['messages'] / elapsed:9.0f} msg/s   "
+          f"{stats['scores']} scores over {stats['days']} days")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the backfill importer offline')
+    parser.add_argument('--messages', type=int, default=50000)
+    parser.add_argument('--days', type=int, default=90)
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--page-latency', type=float, default=0.0, help='simulated delay per 100-message history page')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='globle-backfill-')
+    messages = make_dump(args.messages, args.days, args.users)
+    dump_path = os.path.join(workdir, 'dump.json')
+    with open(dump_path, 'w', encoding='utf-8') as f:
+        json.dump({"messages": messages}, f)
+
+    # Offline dump import
+    start = time.perf_counter()
+    records = load_dump(dump_path)
+    history = ScoreHistory(os.path.join(workdir, 'dump.db'))
+    stats = Backfill(history, 'UTC', batch_size=args.batch_size).run(records)
+    history.close()
+    report("dump import", stats, time.perf_counter() - start)
+
+    # Streaming import through history()
+    channel = FakeChannel(messages, args.page_latency)
+    history = ScoreHistory(os.path.join(workdir, 'stream.db'))
+    start = time.perf_counter()
+    stats = asyncio.run(Backfill(history, 'UTC', batch_size=args.batch_size).run_channel(channel, page_delay=0))
+    history.close()
+    report("channel.history()", stats, time.perf_counter() - start)
+    print(f"  {channel.pages} history pages")
+
+    # Interrupted after half the dump, then resumed from the checkpoint
+    checkpoint = os.path.join(workdir, 'checkpoint.json')
+    history = ScoreHistory(os.path.join(workdir, 'resumed.db'))
+    start = time.perf_counter()
+    Backfill(history, 'UTC', checkpoint_path=checkpoint, batch_size=args.batch_size).run(records[:len(records) // 2])
+    stats = Backfill(history, 'UTC', checkpoint_path=checkpoint, batch_size=args.batch_size).run(records)
+    history.close()
+    report("resumed import", stats, time.perf_counter() - start)
+
+    same = dump_scores(os.path.join(workdir, 'dump.db')) == dump_scores(os.path.join(workdir, 'resumed.db')) \
+        == dump_scores(os.path.join(workdir, 'stream.db'))
+    print(f"\nAll three imports produced the same history: {'yes' if same else 'NO'}")
+    if not same:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+# Columnar scores vs the dict layout: memory and aggregation speed.
+#
+# Builds a day of scores and a few days of history for 10k and 100k users in
+# the layout the score store uses ({user_id string: guesses}, one dict per
+# day) and as ScoreColumns, then times the guess distribution, percentiles
+# and per-user averages across the history on each. Columns are timed with
+# the pure-Python aggregations and, when NumPy is installed, with NumPy.
+# Every run checks that all layouts give the same answers.
+#
+#   python benchmarks/bench_columns.py [--users 10000 100000] [--days 7] [--repeat 3]
+import os
+import sys
+import math
+import time
+import random
+import argparse
+import datetime
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import score_columns
+from score_columns import ScoreColumns
+
+PERCENTILES = (50, 75, 90)
+
+
+def make_days(users, days, seed=1):
+    rng = random.Random(seed)
+    start = datetime.date(2026, 1, 1)
+    history = {}
+    for offset in range(days):
+        day = (start + datetime.timedelta(days=offset)).isoformat()
+        # Most players show up on most days
+        history[day] = {str(10 ** 17 + user): max(1, int(rng.lognormvariate(2.2, 0.6)))
+                        for user in range(users) if rng.random() < 0.8}
+    return history
+
+
+# Memory allocated while building a structure, in bytes, and the structure
+def traced(build):
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        value = build()
+        return tracemalloc.get_traced_memory()[0] - before, value
+    finally:
+        tracemalloc.stop()
+
+
+def best_time(fn, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+# The dict layout's versions of the aggregations
+def dict_distribution(scores):
+    counts = {}
+    for guesses in scores.values():
+        counts[guesses] = counts.get(guesses, 0) + 1
+    return sorted(counts.items())
+
+
+def dict_percentiles(scores, qs):
+    ordered = sorted(scores.values())
+    result = []
+    for q in qs:
+        position = (len(ordered) - 1) * q / 100
+        low = math.floor(position)
+        high = min(low + 1, len(ordered) - 1)
+        result.append(ordered[low] + (ordered[high] - ordered[low]) * (position - low))
+    return result
+
+
+def dict_user_averages(history):
+    totals = {}
+    counts = {}
+    for scores in history.values():
+        for user_id, guesses in scores.items():
+            totals[user_id] = totals.get(user_id, 0) + guesses
+            counts[user_id] = counts.get(user_id, 0) + 1
+    return {int(user_id): totals[user_id] / counts[user_id] for user_id in totals}
+
+
+def same_averages(a, b):
+    return a.keys() == b.keys() and all(abs(a[key] - b[key]) < 1e-9 for key in a)
+
+
+def run(users, days, repeat):
+    history = make_days(users, days)
+    today_day = max(history)
+    rows = [(day, user_id, guesses) for day, scores in history.items() for user_id, guesses in scores.items()]
+
+    # Fresh copies so the memory figures include the key strings the dicts own
+    dict_today_bytes, today = traced(lambda: {str(int(user_id)): guesses for user_id, guesses in history[today_day].items()})
+    dict_history_bytes, _ = traced(lambda: {day: {str(int(user_id)): guesses for user_id, guesses in scores.items()}
+                                             for day, scores in history.items()})
+    columns_today_bytes, today_columns = traced(lambda: ScoreColumns.from_scores(today, today_day))
+    columns_history_bytes, history_columns = traced(lambda: ScoreColumns.from_rows(rows))
+
+    print(f"{users} users, {len(today)} scores today, {len(rows)} scores over {days} days")
+    print(f"  memory     dict today {dict_today_bytes / 2 ** 20:8.2f} MB ({dict_today_bytes / len(today):6.1f} B/score)"
+          f"   columns {columns_today_bytes / 2 ** 20:8.2f} MB ({columns_today_bytes / len(today):5.1f} B/score)")
+    print(f"             dict hist  {dict_history_bytes / 2 ** 20:8.2f} MB ({dict_history_bytes / len(rows):6.1f} B/score)"
+          f"   columns {columns_history_bytes / 2 ** 20:8.2f} MB ({columns_history_bytes / len(rows):5.1f} B/score)")
+
+    layouts = [
+        ('dict', lambda: dict_distribution(today), lambda: dict_percentiles(today, PERCENTILES),
+         lambda: dict_user_averages(history)),
+    ]
+    score_columns.USE_NUMPY = False
+    columns_fns = (today_columns.distribution, lambda: today_columns.percentiles(PERCENTILES),
+                   history_columns.user_averages)
+    layouts.append(('columns',) + columns_fns)
+    score_columns.USE_NUMPY = True
+    numpy_installed = score_columns.using_numpy()
+    if numpy_installed:
+        layouts.append(('numpy',) + columns_fns)
+
+    expected = None
+    ok = True
+    for name, distribution, percentiles, averages in layouts:
+        score_columns.USE_NUMPY = name == 'numpy'
+        dist_time, dist = best_time(distribution, repeat)
+        pct_time, pct = best_time(percentiles, repeat)
+        avg_time, avg = best_time(averages, repeat)
+        print(f"  {name:<8}  distribution {dist_time * 1000:8.2f} ms   percentiles {pct_time * 1000:8.2f} ms"
+              f"   user averages {avg_time * 1000:8.2f} ms")
+        if expected is None:
+            expected = (dist, pct, avg)
+        elif dist != expected[0] or pct != expected[1] or not same_averages(avg, expected[2]):
+            ok = False
+    if not numpy_installed:
+        print("  numpy     not installed; only the pure-Python aggregations were timed")
+    score_columns.USE_NUMPY = True
+    print(f"  same results: {'yes' if ok else 'NO'}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Columnar scores vs the dict layout')
+    parser.add_argument('--users', type=int, nargs='+', default=[10000, 100000])
+    parser.add_argument('--days', type=int, default=7)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    ok = True
+    for users in args.users:
+        ok = run(users, args.days, args.repeat) and ok
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+# Load test for the outbound webhook dispatcher against the local stub.
+#
+# Compares the time callers spend in send_discord_message with the old
+# blocking requests.post path, and reports how the queue drains under the
+# stub's rate limits.
+#
+#   python benchmarks/bench_dispatcher.py [--messages 200] [--limit 50] [--window 1.0]
+import os
+import sys
+import time
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import requests
+
+from webhook_dispatcher import WebhookDispatcher
+from stub_discord import StubDiscord
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def report(name, caller_times, total):
+    print(f"{name}")
+    print(f"  caller p50 {percentile(caller_times, 50) * 1000:8.3f} ms   p99 {percentile(caller_times, 99) * 1000:8.3f} ms")
+    print(f"  total      {total:8.3f} s")
+
+
+# The old path: one blocking requests.post per message, no rate-limit handling
+def run_blocking(url, count):
+    caller_times = []
+    failures = 0
+    start = time.perf_counter()
+    for i in range(count):
+        t0 = time.perf_counter()
+        response = requests.post(url, json={"content": f"message {i}"})
+        caller_times.append(time.perf_counter() - t0)
+        if response.status_code != 204:
+            failures += 1
+    return caller_times, time.perf_counter() - start, failures
+
+
+def run_dispatcher(url, count):
+    dispatcher = WebhookDispatcher(url, max_queue=count)
+    caller_times = []
+    start = time.perf_counter()
+    for i in range(count):
+        t0 = time.perf_counter()
+        dispatcher.send({"content": f"message {i}"})
+        caller_times.append(time.perf_counter() - t0)
+    enqueued = time.perf_counter() - start
+    dispatcher.flush()
+    total = time.perf_counter() - start
+    dispatcher.stop()
+    return caller_times, enqueued, total, dispatcher.stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load-test the webhook dispatcher offline')
+    parser.add_argument('--messages', type=int, default=200)
+    parser.add_argument('--limit', type=int, default=50, help='stub requests allowed per window')
+    parser.add_argument('--window', type=float, default=1.0, help='stub rate-limit window in seconds')
+    parser.add_argument('--latency', type=float, default=0.02, help='stub response delay in seconds')
+    args = parser.parse_args()
+
+    stub = StubDiscord(limit=args.limit, window=args.window, latency=args.latency).start()
+    try:
+        caller_times, total, failures = run_blocking(stub.url, args.messages)
+        report("blocking requests.post", caller_times, total)
+        print(f"  delivered  {args.messages - failures}/{args.messages} (429s are lost)\n")
+
+        time.sleep(args.window)
+        before = stub.stats['accepted']
+        caller_times, enqueued, total, stats = run_dispatcher(stub.url, args.messages)
+        report("WebhookDispatcher", caller_times, total)
+        print(f"  enqueue    {enqueued:8.3f} s")
+        print(f"  delivered  {stub.stats['accepted'] - before}/{args.messages}, "
+              f"429s {stats['rate_limited']}, retries {stats['retries']}, failed {stats['failed']}")
+        print(f"  mean send  {statistics.mean(caller_times) * 1e6:8.1f} us")
+    finally:
+        stub.stop()
+
+
+if __name__ == '__main__':
+    main()
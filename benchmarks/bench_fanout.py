@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+# Reminder fan-out of the gateway bot for hundreds of users in one timezone.
+#
+# Drives bot.remind() against a fake channel and fake users that answer
+# after a delay, reject messages over Discord's 2000 character limit, and
+# fail a fraction of sends once (as a transient 5xx would). Reports, for
+# channel mentions and for direct messages with 1, 4 and 16 workers, how long
+# the reminder took, how many messages were sent and retried, and checks
+# that every user was reminded exactly once. Users with direct messages
+# closed must be mentioned in the channel instead. For comparison it also
+# tries the old single message with every mention in it.
+#
+#   python benchmarks/bench_fanout.py [--users 500] [--latency 0.05] [--failure-rate 0.1]
+#       [--closed-dms 0.05] [--send-rate 50]
+import os
+import re
+import sys
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+from types import SimpleNamespace
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+CHANNEL_ID = 900000000000000002
+MENTION = re.compile(r"<@(\d+)>")
+
+
+class FakeDiscord:
+    def __init__(self, latency, failure_rate, closed_dms, seed=1):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.rng = random.Random(seed)
+        self.closed = set()
+        self.closed_rate = closed_dms
+        # user ID -> number of times they were reminded
+        self.reminded = {}
+        self.messages = 0
+        self.failures = 0
+        self.rejected = 0
+
+    async def deliver(self, content, user_id=None):
+        import nextcord
+        await asyncio.sleep(self.latency)
+        if len(content) > 2000:
+            self.rejected += 1
+            raise nextcord.HTTPException(SimpleNamespace(status=400, reason='Bad Request'),
+                                         'Must be 2000 or fewer in length.')
+        if user_id is not None and user_id in self.closed:
+            raise nextcord.Forbidden(SimpleNamespace(status=403, reason='Forbidden'),
+                                     'Cannot send messages to this user')
+        if self.rng.random() < self.failure_rate:
+            self.failures += 1
+            raise nextcord.HTTPException(SimpleNamespace(status=503, reason='Service Unavailable'), 'upstream error')
+        self.messages += 1
+        for mentioned in MENTION.findall(content):
+            self.reminded[mentioned] = self.reminded.get(mentioned, 0) + 1
+
+
+class FakeChannel:
+    def __init__(self, discord):
+        self.id = CHANNEL_ID
+        self.discord = discord
+
+    async def send(self, content):
+        await self.discord.deliver(content)
+
+
+class FakeUser:
+    def __init__(self, discord, user_id):
+        self.id = user_id
+        self.discord = discord
+
+    async def send(self, content):
+        await self.discord.deliver(content, str(self.id))
+
+
+async def run_case(bot_module, name, users, args, dms=False, workers=1, single=False):
+    import fanout
+
+    discord = FakeDiscord(args.latency, args.failure_rate, args.closed_dms if dms else 0)
+    discord.closed = {user_id for user_id in users if discord.rng.random() < discord.closed_rate}
+    channel = FakeChannel(discord)
+    bot_module.bot.get_user = lambda user_id: FakeUser(discord, user_id)
+    bot_module.REMINDER_DMS = dms
+    bot_module.REMINDER_DM_WORKERS = workers
+    text = bot_module.REMINDER_TEXTS["morning"]
+
+    start = time.perf_counter()
+    if single:
+        # Every mention in one message, as before the fan-out
+        try:
+            await bot_module.send(channel, text.format(mentions=" ".join(f"<@{user_id}>" for user_id in users)),
+                                  bot_module.REMINDER)
+        except Exception:
+            pass
+    else:
+        await bot_module.remind(channel, f"morning:{name}", text, users)
+    elapsed = time.perf_counter() - start
+
+    once = all(discord.reminded.get(user_id) == 1 for user_id in users) and len(discord.reminded) == len(users)
+    reminded = sum(1 for user_id in users if user_id in discord.reminded)
+    print(f"  {name:<18} {elapsed:7.2f} s   messages {discord.messages:5d}   failed and retried {discord.failures:4d}"
+          f"   rejected as too long {discord.rejected}   reminded {reminded}/{len(users)}"
+          + (f" ({len(discord.closed)} DMs closed, mentioned in the channel)" if discord.closed else "")
+          + ("" if single else f"   {'each once' if once else 'NOT EACH ONCE'}"))
+    return once or single
+
+
+async def main_async(bot_module, args):
+    users = [str(10 ** 17 + index) for index in range(args.users)]
+    print(f"{args.users} users due, {args.latency * 1000:.0f} ms per send, {args.failure_rate:.0%} of sends fail once, "
+          f"channel pacing {args.send_rate:g}/s\n")
+    ok = await run_case(bot_module, 'single message', users, args, single=True)
+    ok = await run_case(bot_module, 'channel', users, args) and ok
+    for workers in (1, 4, 16):
+        ok = await run_case(bot_module, f'dm, {workers} workers', users, args, dms=True, workers=workers) and ok
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Reminder fan-out to many users')
+    parser.add_argument('--users', type=int, default=500)
+    parser.add_argument('--latency', type=float, default=0.05, help='seconds per fake Discord send')
+    parser.add_argument('--failure-rate', type=float, default=0.1, help='fraction of sends that fail once')
+    parser.add_argument('--closed-dms', type=float, default=0.05, help='fraction of users not accepting DMs')
+    parser.add_argument('--send-rate', type=float, default=50,
+                        help='channel messages per second allowed by the send queue')
+    args = parser.parse_args()
+
+    os.chdir(tempfile.mkdtemp(prefix='globle-fanout-'))
+    os.environ['DEDUPE_FILE'] = ''
+    os.environ['SEND_RATE'] = str(args.send_rate)
+    os.environ['SEND_BURST'] = str(max(1, int(args.send_rate)))
+    import fanout
+    import bot as bot_module
+
+    # Retry quickly; the default waits are sized for Discord outages
+    fanout.RETRY_DELAY = 0.1
+    ok = asyncio.run(main_async(bot_module, args))
+    bot_module.partitions.close()
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
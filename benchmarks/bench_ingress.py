@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+# Webhook ingress under a spike of score submissions, with and without admission control.
+#
+# Serves globle_webhook through Flask and through async_webhook, with writes
+# slowed down and serialized as if the disk were busy, and fires a burst of
+# score events far larger than can be written in time. Meanwhile a probe
+# sends `!score` every few milliseconds and times how long its reply takes to
+# be sent. Each mode runs once with the default budgets and once with budgets
+# large enough to admit everything (and, in the async mode, reads queued
+# with everything else), as before admission control. Reports how score events were answered
+# (200, 429/503 with Retry-After, or client timeout), how long those answers
+# took, the probe's reply latency and the deepest the score class got.
+# Senders that are turned away wait for the Retry-After before their next event.
+#
+#   python benchmarks/bench_ingress.py [--requests 2000] [--concurrency 256]
+#       [--write-latency 0.01] [--timeout 5]
+import os
+import sys
+import time
+import asyncio
+import logging
+import argparse
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import requests
+
+from stub_discord import StubDiscord
+
+PROBE_INTERVAL = 0.02
+UNLIMITED = 10 ** 9
+
+
+def percentile(samples, pct):
+    if not samples:
+        return float('nan')
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def serve_flask(app):
+    from werkzeug.serving import make_server
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server.shutdown, f"http://127.0.0.1:{server.socket.getsockname()[1]}/discord-webhook"
+
+
+def serve_async(app):
+    from aiohttp import web
+    loop = asyncio.new_event_loop()
+    runner = web.AppRunner(app)
+    ready = threading.Event()
+    address = {}
+
+    def run():
+        asyncio.set_event_loop(loop)
+        loop.run_until_complete(runner.setup())
+        site = web.TCPSite(runner, '127.0.0.1', 0)
+        loop.run_until_complete(site.start())
+        address['port'] = site._server.sockets[0].getsockname()[1]
+        ready.set()
+        loop.run_forever()
+
+    threading.Thread(target=run, daemon=True).start()
+    ready.wait()
+
+    def stop():
+        asyncio.run_coroutine_threadsafe(runner.cleanup(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+
+    return stop, f"http://127.0.0.1:{address['port']}/discord-webhook"
+
+
+def score_events(count, offset):
+    return [{"type": 0, "message": {"id": str(offset + i), "content": f"Globle: I got it in {i % 20 + 1} guesses",
+                                    "author": {"id": str(10 ** 17 + i), "username": f"user{i}"}}}
+            for i in range(count)]
+
+
+def run(name, serve, globle_webhook, args, offset):
+    import async_webhook
+    from admission import IngressBudget, SCORE, BUDGETS
+    from dedupe import MessageDedupe
+
+    budgets = BUDGETS if name.endswith('budgets') else dict.fromkeys(BUDGETS, UNLIMITED)
+    globle_webhook.ingress = IngressBudget(budgets, concurrency=async_webhook.WORKERS if 'async' in name else None)
+    globle_webhook.message_dedupe = MessageDedupe()
+    globle_webhook.reset_daily_scores()
+    stop, url = serve()
+
+    # Replies to the probe, by probe number: time the reply was sent
+    replies = {}
+    sends = globle_webhook.send_discord_message
+
+    def send(content, partition=None):
+        # The reply to a probe starts with its username
+        if content.startswith('probe'):
+            replies[int(content.split(',')[0][5:])] = time.perf_counter()
+        return sends(content, partition)
+
+    globle_webhook.send_discord_message = send
+
+    deepest = [0]
+    done = threading.Event()
+
+    def probe():
+        session = requests.Session()
+        sent = {}
+        number = 0
+        while not done.is_set():
+            sent[number] = time.perf_counter()
+            event = {"type": 0, "message": {"id": str(offset + 10 ** 6 + number), "content": "!score",
+                                            "author": {"id": "1", "username": f"probe{number}"}}}
+            try:
+                session.post(url, json=event, timeout=args.timeout)
+            except requests.RequestException:
+                pass
+            deepest[0] = max(deepest[0], globle_webhook.ingress.depth(SCORE))
+            number += 1
+            time.sleep(PROBE_INTERVAL)
+        return sent
+
+    local = threading.local()
+
+    def post(event):
+        session = getattr(local, 'session', None)
+        if session is None:
+            session = local.session = requests.Session()
+        start = time.perf_counter()
+        try:
+            response = session.post(url, json=event, timeout=args.timeout)
+            status = response.status_code
+            retry_after = response.headers.get('Retry-After')
+        except requests.RequestException:
+            status, retry_after = 'timeout', None
+        elapsed = time.perf_counter() - start
+        # A sender turned away waits as asked before sending anything else
+        if retry_after:
+            time.sleep(float(retry_after))
+        return status, elapsed, retry_after
+
+    with ThreadPoolExecutor(max_workers=1) as prober:
+        probes = prober.submit(probe)
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            results = list(pool.map(post, score_events(args.requests, offset)))
+        elapsed = time.perf_counter() - start
+        done.set()
+        sent = probes.result()
+
+    # Give replies to the last probes a moment to go out
+    deadline = time.monotonic() + args.timeout
+    while len(replies) < len(sent) and time.monotonic() < deadline:
+        time.sleep(0.05)
+    globle_webhook.send_discord_message = sends
+    stop()
+
+    statuses = {}
+    for status, _, _ in results:
+        statuses[status] = statuses.get(status, 0) + 1
+    answered = [seconds for status, seconds, _ in results if status != 'timeout']
+    retry_afters = sorted({int(value) for _, _, value in results if value})
+    latencies = [replies[number] - sent[number] for number in sent if number in replies]
+    print(f"{name:<15} {elapsed:6.2f} s   scores: " + ", ".join(f"{status}: {count}" for status, count in sorted(statuses.items(), key=str))
+          + (f" (Retry-After {retry_afters[0]}-{retry_afters[-1]} s)" if retry_afters else ""))
+    print(f"{'':<15} score answer p50 {percentile(answered, 50) * 1000:8.1f} ms  p99 {percentile(answered, 99) * 1000:8.1f} ms"
+          f"   !score reply p50 {percentile(latencies, 50) * 1000:8.1f} ms  p99 {percentile(latencies, 99) * 1000:8.1f} ms"
+          f"  ({len(latencies)}/{len(sent)} answered)   deepest score class {deepest[0]}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Webhook ingress under a score spike')
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=256)
+    parser.add_argument('--write-latency', type=float, default=0.01,
+                        help='seconds each score write holds the (simulated) disk')
+    parser.add_argument('--timeout', type=float, default=5.0, help='client timeout in seconds')
+    args = parser.parse_args()
+
+    stub = StubDiscord(limit=10 ** 9).start()
+    os.environ['DISCORD_WEBHOOK_URL'] = stub.url
+    os.environ['DEDUPE_FILE'] = ''
+    os.chdir(tempfile.mkdtemp(prefix='globle-ingress-'))
+
+    import globle_webhook
+    import async_webhook
+
+    # Score writes take turns on a slow disk
+    disk = threading.Lock()
+    process_message = globle_webhook.process_message
+
+    def slow_process_message(user_id, username, content, partition=None):
+        if not content.startswith('!'):
+            with disk:
+                time.sleep(args.write_latency)
+        return process_message(user_id, username, content, partition)
+
+    globle_webhook.process_message = slow_process_message
+
+    print(f"{args.requests} score events, concurrency {args.concurrency}, {args.write_latency * 1000:.0f} ms per write, "
+          f"client timeout {args.timeout:g} s, !score probe every {PROBE_INTERVAL * 1000:.0f} ms\n")
+
+    def flask():
+        return serve_flask(globle_webhook.create_app())
+
+    # Without budgets, reads are queued behind the writes as before
+    def async_():
+        return serve_async(async_webhook.create_app(globle_webhook.read_event, globle_webhook.handle_message,
+                                                    on_shed=globle_webhook.shed_message))
+
+    def async_budgets():
+        return serve_async(async_webhook.create_app(globle_webhook.read_event, globle_webhook.handle_message,
+                                                    inline=globle_webhook.is_read, on_shed=globle_webhook.shed_message))
+
+    for offset, (name, serve) in enumerate([('flask', flask), ('flask budgets', flask),
+                                            ('async', async_), ('async budgets', async_budgets)]):
+        run(name, serve, globle_webhook, args, offset * 10 ** 7)
+
+    stub.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+# Member caching modes of the gateway bot on synthetic large guilds.
+#
+# Feeds a GUILD_CREATE for a guild of 10k or 100k members into the bot's
+# own nextcord connection state, with a fake gateway that answers member
+# requests from the synthetic member list. In the full mode the library
+# chunks the whole guild, as it does at startup; in the lean mode
+# (MEMBER_CACHE=lean) only today's players are requested. Each
+# (mode, guild size) runs in its own process and reports the resident
+# memory added, the time until the guild is ready (chunked, or players'
+# names loaded) and the time to resolve the names for a leaderboard.
+#
+#   python benchmarks/bench_member_cache.py [--members 10000 100000] [--players 300]
+#       [--chunk-latency 0.0]
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import resource
+import tempfile
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+GUILD_ID = 900000000000000001
+CHANNEL_ID = 900000000000000002
+BOT_ID = 900000000000000003
+# Discord sends at most this many members per GUILD_MEMBERS_CHUNK
+CHUNK_SIZE = 1000
+
+
+def member_id(index):
+    return 10 ** 17 + index
+
+
+def member_data(index):
+    user_id = member_id(index)
+    return {
+        "user": {"id": str(user_id), "username": f"member{index}", "global_name": f"Member {index}",
+                 "discriminator": "0", "avatar": None},
+        "nick": f"Nick {index}" if index % 3 == 0 else None,
+        "roles": [],
+        "joined_at": "2024-01-01T00:00:00+00:00",
+        "deaf": False,
+        "mute": False,
+        "flags": 0,
+    }
+
+
+def guild_create(members):
+    return {
+        "id": str(GUILD_ID),
+        "name": "Synthetic guild",
+        "owner_id": str(member_id(0)),
+        "member_count": members + 1,
+        "large": True,
+        "roles": [{"id": str(GUILD_ID), "name": "@everyone", "permissions": "0", "position": 0,
+                   "color": 0, "hoist": False, "managed": False, "mentionable": False}],
+        "channels": [{"id": str(CHANNEL_ID), "type": 0, "name": "globle", "position": 0,
+                      "permission_overwrites": []}],
+        # Large guilds only come with the bot's own member
+        "members": [{"user": {"id": str(BOT_ID), "username": "globle", "discriminator": "0",
+                              "avatar": None, "bot": True},
+                     "roles": [], "joined_at": "2024-01-01T00:00:00+00:00", "deaf": False, "mute": False}],
+        "emojis": [],
+        "stickers": [],
+        "features": [],
+        "threads": [],
+        "stage_instances": [],
+        "guild_scheduled_events": [],
+        "voice_states": [],
+        "presences": [],
+    }
+
+
+# Answers member requests the way the gateway does, in chunks
+class FakeGateway:
+    def __init__(self, state, members, latency):
+        self.state = state
+        self.members = members
+        self.latency = latency
+        self.requests = 0
+
+    async def request_chunks(self, guild_id, query=None, *, limit=None, user_ids=None, presences=False, nonce=None):
+        self.requests += 1
+        if user_ids:
+            indexes = [user_id - 10 ** 17 for user_id in user_ids if 0 <= user_id - 10 ** 17 < self.members]
+        else:
+            indexes = range(self.members)
+        asyncio.get_running_loop().create_task(self._send_chunks(guild_id, list(indexes), nonce))
+
+    async def _send_chunks(self, guild_id, indexes, nonce):
+        count = max(1, -(-len(indexes) // CHUNK_SIZE))
+        for chunk in range(count):
+            await asyncio.sleep(self.latency)
+            self.state.parse_guild_members_chunk({
+                "guild_id": str(guild_id),
+                "members": [member_data(index) for index in indexes[chunk * CHUNK_SIZE:(chunk + 1) * CHUNK_SIZE]],
+                "chunk_index": chunk,
+                "chunk_count": count,
+                "nonce": nonce,
+            })
+
+
+def rss_mb():
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+async def measure(bot_module, members, players, latency):
+    import nextcord
+
+    bot = bot_module.bot
+    state = bot._connection
+    # Normally set when the bot logs in
+    bot.loop = state.loop = asyncio.get_running_loop()
+    gateway = FakeGateway(state, members, latency)
+    state._get_websocket = lambda guild_id=None, shard_id=None: gateway
+    state.user = nextcord.ClientUser(state=state, data={"id": str(BOT_ID), "username": "globle",
+                                                          "discriminator": "0", "avatar": None, "bot": True})
+
+    rng = random.Random(1)
+    player_ids = [str(member_id(index)) for index in rng.sample(range(members), players)]
+    partition = bot_module.partitions.default
+    for user_id in player_ids:
+        partition.record_score(user_id, rng.randrange(1, 40)).result()
+
+    rss_before = rss_mb()
+    start = time.perf_counter()
+    state.parse_guild_create(guild_create(members))
+    guild = bot.get_guild(GUILD_ID)
+    if bot_module.LEAN_MEMBERS:
+        await bot_module.warm_member_names()
+    else:
+        while not guild.chunked:
+            await asyncio.sleep(0.001)
+    ready = time.perf_counter() - start
+    rss_after = rss_mb()
+
+    # A leaderboard of today's players plus a few who haven't been seen yet
+    board = player_ids + [str(member_id(index)) for index in rng.sample(range(members), 20)]
+    start = time.perf_counter()
+    names = await bot_module.user_resolver.display_names(board, guild)
+    lookup = time.perf_counter() - start
+
+    return {
+        "cached_members": len(guild._members),
+        "cached_names": len(bot_module.user_resolver),
+        "ready_s": ready,
+        "lookup_s": lookup,
+        # Names that couldn't be resolved come back as "User <id>"
+        "resolved": sum(1 for user_id in board if names.get(user_id) != f"User {user_id}"),
+        "board": len(board),
+        "requests": gateway.requests,
+        "rss_mb": rss_after - rss_before,
+        "peak_rss_mb": rss_after,
+    }
+
+
+def run_one(mode, members, players, latency):
+    os.chdir(tempfile.mkdtemp(prefix='globle-members-'))
+    os.environ['MEMBER_CACHE'] = mode
+    os.environ['GLOBLE_CHANNEL_ID'] = str(CHANNEL_ID)
+    os.environ['DEDUPE_FILE'] = ''
+    import bot as bot_module
+
+    result = asyncio.run(measure(bot_module, members, players, latency))
+    bot_module.partitions.close()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Gateway bot member caching modes on synthetic guilds')
+    parser.add_argument('--members', type=int, nargs='+', default=[10000, 100000])
+    parser.add_argument('--players', type=int, default=300)
+    parser.add_argument('--chunk-latency', type=float, default=0.0,
+                        help='seconds before each member chunk arrives from the fake gateway')
+    parser.add_argument('--mode', choices=['full', 'lean'], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        result = run_one(args.mode, args.members[0], args.players, args.chunk_latency)
+        print(json.dumps(result))
+        return
+
+    for members in args.members:
+        print(f"{members} members, {args.players} players today")
+        for mode in ('full', 'lean'):
+            output = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), '--mode', mode, '--members', str(members),
+                 '--players', str(args.players), '--chunk-latency', str(args.chunk_latency)],
+                check=True, stdout=subprocess.PIPE, universal_newlines=True).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            print(f"  {mode:<5} rss +{result['rss_mb']:7.1f} MB (peak {result['peak_rss_mb']:6.1f} MB)"
+                  f"   ready {result['ready_s'] * 1000:8.1f} ms   board lookup {result['lookup_s'] * 1000:7.1f} ms"
+                  f"   cached members {result['cached_members']:6d}, names {result['cached_names']:5d}"
+                  f"   gateway requests {result['requests']:3d}   resolved {result['resolved']}/{result['board']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+# Microbenchmark for the Globle score parser.
+#
+# Runs the shared parser and the two parsers it replaced over the share-text
+# corpus mixed with ordinary chatter, and reports messages/sec and accuracy.
+#
+#   python benchmarks/bench_parser.py [--messages 200000] [--chatter 0.9]
+import os
+import re
+import sys
+import json
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from score_parser import parse_globle_score
+
+CORPUS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'parser_corpus.json')
+
+CHATTER = [
+    "good morning!",
+    "anyone up for lunch at 12?",
+    "lol",
+    "that game last night was wild",
+    "I think the answer was Mongolia",
+    "brb",
+    "Wordle 1,219 4/6",
+    "who's hosting on the 14th?",
+    "🎉🎉🎉",
+    "can't believe it's already October",
+]
+
+
+# The parser globle_webhook.py used before score_parser
+def legacy_webhook_parse(content):
+    content = content.lower()
+    if "globle" not in content:
+        return None
+    match = re.search(r'(?:got|solved|finished)(?:\s+it)?\s+in\s+(\d+)', content)
+    if match:
+        return int(match.group(1))
+    match = re.search(r'(\d+)\s*\/\s*\d+', content)
+    if match:
+        return int(match.group(1))
+    match = re.search(r'(\d+)\s+guess(?:es)?', content)
+    if match:
+        return int(match.group(1))
+    if "globle" in content:
+        numbers = re.findall(r'\b(\d+)\b', content)
+        if numbers:
+            for num in numbers:
+                if int(num) < 100:
+                    return int(num)
+    return None
+
+
+# The parser bot.on_message used before score_parser
+def legacy_bot_parse(content):
+    if not ("Globle" in content and "guesses" in content.lower()):
+        return None
+    content = content.lower()
+    guesses = None
+    if "i got it in " in content:
+        parts = content.split("i got it in ")
+        if len(parts) > 1:
+            num_part = parts[1].split()[0]
+            if num_part.isdigit():
+                guesses = int(num_part)
+    elif "/" in content:
+        for word in content.split():
+            if "/" in word:
+                num_part = word.split("/")[0]
+                if num_part.isdigit():
+                    guesses = int(num_part)
+    return guesses
+
+
+PARSERS = [
+    ("score_parser", parse_globle_score),
+    ("legacy webhook", legacy_webhook_parse),
+    ("legacy bot", legacy_bot_parse),
+]
+
+
+def load_corpus(path=CORPUS_FILE):
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+# Fraction of corpus entries parsed to the expected value, and the misses
+def accuracy(parser, corpus):
+    misses = []
+    for entry in corpus:
+        result = parser(entry["text"])
+        if result != entry["expected"]:
+            misses.append((entry["note"], entry["expected"], result))
+    return 1 - len(misses) / len(corpus), misses
+
+
+# Build a message stream where `chatter` of the messages aren't Globle results
+def build_workload(corpus, count, chatter, seed=1):
+    rng = random.Random(seed)
+    texts = [entry["text"] for entry in corpus]
+    return [rng.choice(CHATTER) if rng.random() < chatter else rng.choice(texts) for _ in range(count)]
+
+
+def throughput(parser, workload, repeat=3):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for text in workload:
+            parser(text)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return len(workload) / best
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the Globle score parsers')
+    parser.add_argument('--messages', type=int, default=200000, help='messages per timing run')
+    parser.add_argument('--chatter', type=float, default=0.9, help='fraction of non-Globle messages')
+    parser.add_argument('--show-misses', action='store_true', help='list corpus entries each parser gets wrong')
+    args = parser.parse_args()
+
+    corpus = load_corpus()
+    workload = build_workload(corpus, args.messages, args.chatter)
+    results_only = build_workload(corpus, args.messages, 0.0)
+
+    print(f"Corpus: {len(corpus)} messages, workload: {args.messages} messages ({args.chatter:.0%} chatter)\n")
+    print(f"{'parser':<16} {'accuracy':>9} {'mixed msg/s':>14} {'results msg/s':>14}")
+    for name, parse in PARSERS:
+        acc, misses = accuracy(parse, corpus)
+        print(f"{name:<16} {acc:>9.1%} {throughput(parse, workload):>14,.0f} {throughput(parse, results_only):>14,.0f}")
+        if args.show_misses:
+            for note, expected, got in misses:
+                print(f"    miss: {note}: expected {expected}, got {got}")
+
+
+if __name__ == '__main__':
+    main()
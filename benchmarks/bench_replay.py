@@ -0,0 +1,480 @@
+#!/usr/bin/env python3
+# Replay load test for the two entry points: bot.on_message and the
+# globle_webhook /discord-webhook route.
+#
+# Replays a synthetic (or recorded) message stream at a configurable rate.
+# The gateway bot gets fake message, channel and guild objects; the webhook
+# bot gets events through Flask's test client and sends its replies to the
+# local stub Discord endpoint, so nothing touches the network. Reports
+# throughput, per-stage latency (parse, store, send) and memory, and can save
+# or compare against a baseline for use as a regression check. Baselines are
+# machine-specific, so record one on the machine that runs the check. Only
+# throughput and median latencies are compared; tail latency and memory vary
+# too much from run to run.
+#
+#   python benchmarks/bench_replay.py [--target all|bot|webhook] [--messages 5000]
+#       [--rate 0] [--users 500] [--channels 1] [--stream FILE] [--speed 1.0]
+#       [--save-stream FILE] [--send-latency 0.0] [--send-rate 0] [--concurrency 8] [--tracemalloc]
+#       [--save-baseline FILE] [--baseline FILE] [--tolerance 0.5] [--json]
+#
+# Recorded streams are JSON lines with content, author_id, username,
+# guild_id, channel_id and an optional t (seconds since the first message).
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import datetime
+import argparse
+import resource
+import tempfile
+import threading
+import subprocess
+import tracemalloc
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, ROOT)
+
+from stub_discord import StubDiscord
+
+CORPUS_FILE = os.path.join(BENCH_DIR, 'parser_corpus.json')
+COMMANDS = ["!score", "!leaderboard", "!history", "!winners", "!settz Europe/London"]
+
+# Noise floor below which a change is not reported as a regression
+MIN_LATENCY_DELTA_MS = 1.0
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+# Build a morning-burst style stream: mostly scores, some chatter and commands
+def make_stream(count, users, channels, seed=1):
+    rng = random.Random(seed)
+    with open(CORPUS_FILE, encoding='utf-8') as f:
+        corpus = json.load(f)
+    scores = [entry["text"] for entry in corpus if entry["expected"] is not None]
+    chatter = [entry["text"] for entry in corpus if entry["expected"] is None]
+    stream = []
+    for i in range(count):
+        user = rng.randrange(users)
+        channel = rng.randrange(channels)
+        roll = rng.random()
+        if roll < 0.05:
+            content = rng.choice(COMMANDS)
+        elif roll < 0.25:
+            content = rng.choice(chatter)
+        else:
+            content = rng.choice(scores)
+        stream.append({
+            "content": content,
+            "author_id": str(10 ** 17 + user),
+            "username": f"player{user}",
+            "guild_id": str(9 * 10 ** 17 + channel),
+            "channel_id": str(8 * 10 ** 17 + channel),
+        })
+    return stream
+
+
+def load_stream(path):
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def save_stream(path, stream):
+    with open(path, 'w', encoding='utf-8') as f:
+        for record in stream:
+            f.write(json.dumps(record) + "\n")
+
+
+# Seconds after the start at which each message is delivered
+def offsets(stream, rate, speed):
+    if rate > 0:
+        return [i / rate for i in range(len(stream))]
+    if speed > 0 and stream and "t" in stream[0]:
+        return [record.get("t", 0) / speed for record in stream]
+    return [0.0] * len(stream)
+
+
+# Latency samples per stage, collected from patched functions
+class Stages:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.samples = defaultdict(list)
+
+    def add(self, stage, seconds):
+        with self.lock:
+            self.samples[stage].append(seconds)
+
+    def wrap(self, stage, fn):
+        if asyncio.iscoroutinefunction(fn):
+            async def timed_async(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return await fn(*args, **kwargs)
+                finally:
+                    self.add(stage, time.perf_counter() - start)
+            return timed_async
+
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.add(stage, time.perf_counter() - start)
+        return timed
+
+    def summary(self):
+        result = {}
+        for stage, samples in self.samples.items():
+            result[stage] = {
+                "count": len(samples),
+                "mean_ms": sum(samples) / len(samples) * 1000,
+                "p50_ms": percentile(samples, 50) * 1000,
+                "p99_ms": percentile(samples, 99) * 1000,
+            }
+        return result
+
+
+# Point both bots at a scratch directory, the stub webhook and the stream's channels
+def prepare_environment(stream, webhook_url, send_rate):
+    os.chdir(tempfile.mkdtemp(prefix='globle-replay-'))
+    channels = []
+    for record in stream:
+        key = (record["guild_id"], record["channel_id"])
+        if key not in channels:
+            channels.append(key)
+    os.environ['DISCORD_WEBHOOK_URL'] = webhook_url
+    os.environ['DATA_DIR'] = 'data'
+    os.environ['GLOBLE_CHANNEL_ID'] = channels[0][1]
+    if send_rate:
+        os.environ['SEND_RATE'] = str(send_rate)
+    else:
+        # The fake channels have no rate limit, so don't pace the bot's sends
+        os.environ['SEND_RATE'] = os.environ['SEND_BURST'] = str(10 ** 9)
+    os.makedirs('data', exist_ok=True)
+    with open(os.path.join('data', 'partitions.json'), 'w') as f:
+        json.dump([{"guild_id": guild_id, "channel_id": channel_id} for guild_id, channel_id in channels[1:]], f)
+
+
+def patch_store(stages):
+    from score_store import ScoreStore
+    ScoreStore.record = stages.wrap('store', ScoreStore.record)
+
+
+def run_webhook(stream, schedule, stages, args):
+    import globle_webhook
+    globle_webhook.parse_globle_score = stages.wrap('parse', globle_webhook.parse_globle_score)
+    globle_webhook.send_discord_message = stages.wrap('send', globle_webhook.send_discord_message)
+    patch_store(stages)
+
+    app = globle_webhook.create_app()
+    local = threading.local()
+
+    def post(scheduled, event):
+        client = getattr(local, 'client', None)
+        if client is None:
+            client = local.client = app.test_client()
+        start = time.perf_counter()
+        response = client.post('/discord-webhook', json=event)
+        done = time.perf_counter()
+        stages.add('handler', done - start)
+        stages.add('lag', done - scheduled)
+        return response.status_code
+
+    events = [{"type": 0, "message": {
+        "id": str(i), "content": record["content"], "guild_id": record["guild_id"], "channel_id": record["channel_id"],
+        "author": {"id": record["author_id"], "username": record["username"]},
+    }} for i, record in enumerate(stream)]
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        futures = []
+        for offset, event in zip(schedule, events):
+            delay = start + offset - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            futures.append(pool.submit(post, start + offset, event))
+        errors = sum(1 for future in futures if future.result() != 200)
+    elapsed = time.perf_counter() - start
+
+    # Send the confirmations still being collected, then let the dispatchers
+    # drain so delivery counts are complete
+    globle_webhook.acks.flush()
+    sent = failed = rate_limited = 0
+    for dispatcher in globle_webhook.dispatchers.values():
+        dispatcher.flush(timeout=30)
+        sent += dispatcher.stats['sent']
+        failed += dispatcher.stats['failed'] + dispatcher.stats['dropped']
+        rate_limited += dispatcher.stats['rate_limited']
+    return elapsed, {"non_200": errors, "delivered": sent, "failed": failed, "rate_limited": rate_limited}
+
+
+class FakeUser:
+    def __init__(self, user_id, name):
+        self.id = int(user_id)
+        self.name = name
+        self.display_name = name
+        self.bot = False
+
+
+class FakeGuild:
+    def __init__(self, guild_id):
+        self.id = int(guild_id)
+
+    def get_member(self, user_id):
+        return None
+
+
+class FakeChannel:
+    def __init__(self, channel_id, guild, stages, latency):
+        self.id = int(channel_id)
+        self.guild = guild
+        self.stages = stages
+        self.latency = latency
+        self.sent = 0
+
+    async def send(self, content):
+        start = time.perf_counter()
+        await asyncio.sleep(self.latency)
+        self.sent += 1
+        self.stages.add('send', time.perf_counter() - start)
+
+
+class FakeMessage:
+    def __init__(self, message_id, content, author, channel, stages, latency):
+        self.id = message_id
+        self.content = content
+        self.author = author
+        self.channel = channel
+        self.guild = channel.guild
+        self.created_at = datetime.datetime.now(datetime.timezone.utc)
+        self.stages = stages
+        self.latency = latency
+
+    async def add_reaction(self, emoji):
+        start = time.perf_counter()
+        await asyncio.sleep(self.latency)
+        self.stages.add('react', time.perf_counter() - start)
+
+
+# Context handed to command callbacks in place of nextcord's
+class FakeContext:
+    def __init__(self, message):
+        self.message = message
+        self.author = message.author
+        self.channel = message.channel
+        self.guild = message.guild
+
+    async def send(self, content):
+        await self.channel.send(content)
+
+
+def run_bot(stream, schedule, stages, args):
+    import bot as bot_module
+    bot_module.parse_globle_score = stages.wrap('parse', bot_module.parse_globle_score)
+    patch_store(stages)
+
+    # Commands are invoked directly; nextcord's own dispatch needs a live connection
+    async def process_commands(message):
+        if not message.content.startswith('!'):
+            return
+        name, _, rest = message.content[1:].partition(' ')
+        command = bot_module.bot.all_commands.get(name)
+        if command is not None:
+            await command.callback(FakeContext(message), *rest.split())
+    bot_module.bot.process_commands = process_commands
+
+    guilds = {}
+    channels = {}
+    users = {}
+    messages = []
+    for i, record in enumerate(stream):
+        guild = guilds.get(record["guild_id"]) or guilds.setdefault(record["guild_id"], FakeGuild(record["guild_id"]))
+        channel = channels.get(record["channel_id"])
+        if channel is None:
+            channel = channels[record["channel_id"]] = FakeChannel(record["channel_id"], guild, stages, args.send_latency)
+        author = users.get(record["author_id"])
+        if author is None:
+            author = users[record["author_id"]] = FakeUser(record["author_id"], record["username"])
+        messages.append(FakeMessage(i, record["content"], author, channel, stages, args.send_latency))
+
+    async def handle(scheduled, message):
+        start = time.perf_counter()
+        await bot_module.on_message(message)
+        done = time.perf_counter()
+        stages.add('handler', done - start)
+        stages.add('lag', done - scheduled)
+
+    # Like the gateway, every message is handled in its own task
+    async def replay():
+        start = time.perf_counter()
+        tasks = []
+        for offset, message in zip(schedule, messages):
+            delay = start + offset - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            tasks.append(asyncio.ensure_future(handle(start + offset, message)))
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - start
+        # Send the confirmations still being collected so send counts are complete
+        await bot_module.acks.flush()
+        return elapsed
+
+    elapsed = asyncio.run(replay())
+    return elapsed, {"channel_sends": sum(channel.sent for channel in channels.values())}
+
+
+def run_target(target, args):
+    stream = load_stream(args.stream) if args.stream else make_stream(args.messages, args.users, args.channels)
+    schedule = offsets(stream, args.rate, args.speed)
+    stub = StubDiscord(limit=args.stub_limit, window=1.0).start()
+    prepare_environment(stream, stub.url, args.send_rate)
+
+    if args.tracemalloc:
+        tracemalloc.start()
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    stages = Stages()
+    try:
+        if target == 'bot':
+            elapsed, extra = run_bot(stream, schedule, stages, args)
+        else:
+            elapsed, extra = run_webhook(stream, schedule, stages, args)
+    finally:
+        stub.stop()
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # ru_maxrss is in kilobytes on Linux
+    memory = {"rss_peak_mb": rss_after / 1024, "rss_growth_mb": (rss_after - rss_before) / 1024}
+    if args.tracemalloc:
+        memory["traced_peak_mb"] = tracemalloc.get_traced_memory()[1] / 2 ** 20
+        tracemalloc.stop()
+    return {
+        "target": target,
+        "messages": len(stream),
+        "elapsed_s": elapsed,
+        "throughput": len(stream) / elapsed,
+        "stages": stages.summary(),
+        "memory": memory,
+        "extra": extra,
+    }
+
+
+# Run each target in its own process so state files and memory don't mix
+def run_child(target, argv):
+    output = subprocess.run([sys.executable, os.path.abspath(__file__)] + argv + ['--target', target, '--json'],
+                            check=True, stdout=subprocess.PIPE, universal_newlines=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def report(result):
+    print(f"{result['target']:<8} {result['messages']} messages in {result['elapsed_s']:.3f} s   "
+          f"{result['throughput']:10.0f} msg/s")
+    for stage in ('handler', 'lag', 'parse', 'store', 'send', 'react'):
+        summary = result['stages'].get(stage)
+        if summary:
+            print(f"  {stage:<8} n={summary['count']:<7} mean {summary['mean_ms']:9.3f} ms   "
+                  f"p50 {summary['p50_ms']:9.3f} ms   p99 {summary['p99_ms']:9.3f} ms")
+    memory = result['memory']
+    line = f"  memory   peak RSS {memory['rss_peak_mb']:.1f} MB, growth {memory['rss_growth_mb']:.1f} MB"
+    if 'traced_peak_mb' in memory:
+        line += f", traced peak {memory['traced_peak_mb']:.1f} MB"
+    print(line)
+    print("  " + ", ".join(f"{key} {value}" for key, value in result['extra'].items()))
+
+
+# Regressions of `result` against `base`, as printable strings
+def compare(result, base, tolerance):
+    problems = []
+    target = result['target']
+    if result['throughput'] < base['throughput'] * (1 - tolerance):
+        problems.append(f"{target}: throughput {result['throughput']:.0f} msg/s < baseline {base['throughput']:.0f}")
+    for stage in ('handler', 'parse', 'store', 'send'):
+        now, then = result['stages'].get(stage), base['stages'].get(stage)
+        if not now or not then:
+            continue
+        limit = max(then['p50_ms'] * (1 + tolerance), then['p50_ms'] + MIN_LATENCY_DELTA_MS)
+        if now['p50_ms'] > limit:
+            problems.append(f"{target}: {stage} p50 {now['p50_ms']:.3f} ms > baseline {then['p50_ms']:.3f} ms")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay message streams into bot.on_message and the webhook endpoint')
+    parser.add_argument('--target', choices=['all', 'bot', 'webhook'], default='all')
+    parser.add_argument('--messages', type=int, default=5000, help='synthetic stream length')
+    parser.add_argument('--users', type=int, default=500, help='distinct users in the synthetic stream')
+    parser.add_argument('--channels', type=int, default=1, help='Globle channels in the synthetic stream')
+    parser.add_argument('--stream', help='replay a recorded JSON-lines stream instead')
+    parser.add_argument('--save-stream', help='write the stream being replayed to a JSON-lines file')
+    parser.add_argument('--rate', type=float, default=0, help='messages per second (0 = as fast as possible)')
+    parser.add_argument('--speed', type=float, default=1.0, help='speed-up for recorded timestamps when --rate is 0')
+    parser.add_argument('--send-latency', type=float, default=0.0, help='simulated Discord latency for bot sends')
+    parser.add_argument('--send-rate', type=float, default=0, help="bot sends per second per channel (0 = don't pace sends)")
+    parser.add_argument('--concurrency', type=int, default=8, help='concurrent webhook requests')
+    parser.add_argument('--stub-limit', type=int, default=10 ** 9, help='stub webhook requests allowed per second')
+    parser.add_argument('--tracemalloc', action='store_true', help='also report traced Python allocations (slower)')
+    parser.add_argument('--save-baseline', help='save the results as a baseline file')
+    parser.add_argument('--baseline', help='compare against a baseline file and exit 1 on regression')
+    parser.add_argument('--tolerance', type=float, default=0.5, help='allowed relative regression')
+    parser.add_argument('--json', action='store_true', help='print results as JSON')
+    args = parser.parse_args()
+
+    if args.save_stream:
+        stream = load_stream(args.stream) if args.stream else make_stream(args.messages, args.users, args.channels)
+        save_stream(args.save_stream, stream)
+
+    if args.target != 'all':
+        if args.stream:
+            args.stream = os.path.abspath(args.stream)
+        result = run_target(args.target, args)
+        if args.json:
+            print(json.dumps(result))
+            return
+        results = [result]
+    else:
+        argv = ['--messages', str(args.messages), '--users', str(args.users), '--channels', str(args.channels),
+                '--rate', str(args.rate), '--speed', str(args.speed), '--send-latency', str(args.send_latency),
+                '--send-rate', str(args.send_rate), '--concurrency', str(args.concurrency), '--stub-limit', str(args.stub_limit)]
+        if args.stream:
+            argv += ['--stream', os.path.abspath(args.stream)]
+        if args.tracemalloc:
+            argv.append('--tracemalloc')
+        results = [run_child(target, argv) for target in ('bot', 'webhook')]
+        if args.json:
+            print(json.dumps(results))
+
+    if not args.json:
+        for result in results:
+            report(result)
+
+    settings = {key: getattr(args, key) for key in ('messages', 'users', 'channels', 'stream', 'rate', 'send_latency', 'concurrency')}
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as f:
+            json.dump({"settings": settings, "results": {result['target']: result for result in results}}, f, indent=2)
+        print(f"Saved baseline to {args.save_baseline}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get("settings") != settings:
+            print(f"Warning: baseline was recorded with {baseline.get('settings')}")
+        problems = []
+        for result in results:
+            base = baseline["results"].get(result['target'])
+            if base is not None:
+                problems += compare(result, base, args.tolerance)
+        for problem in problems:
+            print(f"REGRESSION {problem}")
+        if problems:
+            sys.exit(1)
+        print("No regressions against baseline")
+
+
+if __name__ == '__main__':
+    main()
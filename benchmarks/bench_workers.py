@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+# Multi-process webhook workers: throughput, shared dedupe and leader failover.
+#
+# Runs webhook_workers.py with 1 and then several worker processes in a
+# temporary directory, pointed at the stub Discord endpoint, and fires score
+# events at the shared port, a fraction of them sent twice with the same
+# message ID. Reports requests per second and checks that every unique score
+# was confirmed exactly once, whichever workers the copies landed on. With
+# more than one worker it then checks that exactly one worker was elected to
+# run the scheduled tasks, kills that worker and times how long it takes
+# another worker to take over.
+#
+#   python benchmarks/bench_workers.py [--processes 1 4] [--requests 2000] [--concurrency 32]
+#       [--duplicates 0.2] [--lease 3] [--server flask]
+import os
+import sys
+import json
+import time
+import random
+import signal
+import socket
+import argparse
+import tempfile
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import requests
+
+from stub_discord import StubDiscord
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+# Score events from distinct users, so each one is confirmed, plus resent copies
+def make_events(count, duplicates, seed=1):
+    rng = random.Random(seed)
+    events = [{"type": 0, "message": {"id": str(10 ** 18 + i), "content": f"Globle: I got it in {rng.randint(1, 20)} guesses",
+                                      "author": {"id": str(10 ** 17 + i), "username": f"user{i}"}}}
+              for i in range(count)]
+    resent = [event for event in events if rng.random() < duplicates]
+    events += resent
+    rng.shuffle(events)
+    return events, count
+
+
+def fire(url, events, concurrency):
+    local = threading.local()
+
+    def post(event):
+        session = getattr(local, 'session', None)
+        if session is None:
+            session = local.session = requests.Session()
+        return session.post(url, json=event).status_code
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        statuses = list(pool.map(post, events))
+    return statuses, time.perf_counter() - start
+
+
+class Supervisor:
+    def __init__(self, processes, port, stub_url, lease, server):
+        env = dict(os.environ)
+        env.update({
+            'DISCORD_WEBHOOK_URL': stub_url,
+            'PORT': str(port),
+            'WEBHOOK_PROCESSES': str(processes),
+            'WEBHOOK_SERVER': server,
+            'LEADER_LEASE_SECONDS': str(lease),
+            'ACK_WINDOW': '0',
+            'DEDUPE_FILE': '',
+            'GLOBLE_CHANNEL_ID': '',
+            'PYTHONUNBUFFERED': '1',
+        })
+        self.lines = []
+        self.changed = threading.Condition()
+        self.process = subprocess.Popen([sys.executable, os.path.join(ROOT, 'webhook_workers.py')], env=env,
+                                        cwd=tempfile.mkdtemp(prefix='globle-workers-'),
+                                        stdout=subprocess.PIPE, universal_newlines=True)
+        threading.Thread(target=self._read, daemon=True).start()
+
+    def _read(self):
+        for line in self.process.stdout:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            with self.changed:
+                self.lines.append((time.perf_counter(), entry))
+                self.changed.notify_all()
+
+    # Log entries with this message
+    def logged(self, msg):
+        with self.changed:
+            return [(at, entry) for at, entry in self.lines if entry.get('msg') == msg]
+
+    # Wait until `count` entries with this message have been logged
+    def wait_for(self, msg, count=1, timeout=60):
+        deadline = time.monotonic() + timeout
+        with self.changed:
+            while len(self.logged(msg)) < count:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise RuntimeError(f"timed out waiting for {count} x {msg!r}")
+                self.changed.wait(remaining)
+        return self.logged(msg)
+
+    def stop(self):
+        self.process.send_signal(signal.SIGINT)
+        self.process.wait(30)
+
+
+def wait_for_messages(stub, expected, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        confirmations = [message for _, message in stub.messages if message.get('content', '').startswith('Recorded')]
+        if len(confirmations) >= expected:
+            time.sleep(0.5)
+            break
+        time.sleep(0.1)
+    return [message for _, message in stub.messages if message.get('content', '').startswith('Recorded')]
+
+
+def run(processes, args):
+    stub = StubDiscord(limit=10 ** 9).start()
+    port = free_port()
+    supervisor = Supervisor(processes, port, stub.url, args.lease, args.server)
+    ok = True
+    try:
+        supervisor.wait_for("Listening for webhook events", processes)
+        events, unique = make_events(args.requests, args.duplicates)
+        statuses, elapsed = fire(f"http://127.0.0.1:{port}/discord-webhook", events, args.concurrency)
+        confirmations = wait_for_messages(stub, unique)
+        errors = sum(1 for status in statuses if status != 200)
+        once = len(confirmations) == unique
+        ok = ok and once and not errors
+        print(f"{processes} worker{'s' if processes != 1 else ''}: {len(events)} events ({len(events) - unique} resent) "
+              f"in {elapsed:.2f} s, {len(events) / elapsed:7.0f} req/s, non-200: {errors}, "
+              f"confirmations {len(confirmations)}/{unique} ({'each once' if once else 'MISMATCH'})")
+
+        if processes > 1:
+            elected = supervisor.wait_for("Elected leader")
+            time.sleep(args.lease)
+            leaders = supervisor.logged("Elected leader")
+            single = len(leaders) == 1
+            owner = leaders[-1][1]['owner']
+            pid = int(owner.split(':')[1])
+            killed = time.perf_counter()
+            os.kill(pid, signal.SIGKILL)
+            new_leader = supervisor.wait_for("Elected leader", 2, timeout=args.lease * 5)[-1]
+            failover = new_leader[0] - killed
+            took_over = new_leader[1]['owner'] != owner and new_leader[1]['term'] > elected[0][1]['term']
+            ok = ok and single and took_over
+            print(f"  leaders before failover: {len(leaders)}; killed pid {pid}, "
+                  f"term {new_leader[1]['term']} began {failover:.2f} s later "
+                  f"(lease {args.lease:g} s) {'' if took_over else 'NOT TAKEN OVER'}")
+    finally:
+        supervisor.stop()
+        stub.stop()
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Multi-process webhook workers')
+    parser.add_argument('--processes', type=int, nargs='+', default=[1, 4])
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--duplicates', type=float, default=0.2, help='fraction of events sent twice')
+    parser.add_argument('--lease', type=float, default=3, help='leader lease in seconds')
+    parser.add_argument('--server', choices=['flask', 'async'], default='flask')
+    args = parser.parse_args()
+
+    ok = True
+    for processes in args.processes:
+        ok = run(processes, args) and ok
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
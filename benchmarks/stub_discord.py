@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+# Local stand-in for Discord's webhook endpoint, for offline load tests.
+#
+# Accepts POSTs (and PATCHes, as sent to edit an interaction response) on
+# any path, answers 204 with Discord-style X-RateLimit-* headers, and answers
+# 429 with Retry-After once a path exceeds its bucket.
+#
+#   python benchmarks/stub_discord.py [--port 8099] [--limit 5] [--window 2.0]
+import json
+import time
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StubDiscord:
+    def __init__(self, host='127.0.0.1', port=0, limit=5, window=2.0, latency=0.0):
+        self.limit = limit
+        self.window = window
+        self.latency = latency
+        self.lock = threading.Lock()
+        # Path -> (window start, requests in window)
+        self.buckets = {}
+        self.messages = []
+        self.stats = {'requests': 0, 'accepted': 0, 'rate_limited': 0}
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/api/webhooks/1/stub-token"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, name='stub-discord')
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    # Count a request against its path's bucket; returns (allowed, remaining, reset_after)
+    def _take(self, path):
+        now = time.monotonic()
+        with self.lock:
+            start, used = self.buckets.get(path, (now, 0))
+            if now - start >= self.window:
+                start, used = now, 0
+            reset_after = self.window - (now - start)
+            if used >= self.limit:
+                self.buckets[path] = (start, used)
+                return False, 0, reset_after
+            used += 1
+            self.buckets[path] = (start, used)
+            return True, self.limit - used, reset_after
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                if stub.latency:
+                    time.sleep(stub.latency)
+                allowed, remaining, reset_after = stub._take(self.path)
+                with stub.lock:
+                    stub.stats['requests'] += 1
+                if not allowed:
+                    with stub.lock:
+                        stub.stats['rate_limited'] += 1
+                    payload = json.dumps({"message": "You are being rate limited.", "retry_after": reset_after, "global": False}).encode()
+                    self.send_response(429)
+                    self.send_header('Content-Type', 'application/json')
+                    self.send_header('Content-Length', str(len(payload)))
+                    self.send_header('Retry-After', f"{reset_after:.3f}")
+                    self._rate_limit_headers(0, reset_after)
+                    self.end_headers()
+                    self.wfile.write(payload)
+                    return
+                with stub.lock:
+                    stub.stats['accepted'] += 1
+                    stub.messages.append((self.path, json.loads(body or b'{}')))
+                self.send_response(204)
+                self.send_header('Content-Length', '0')
+                self._rate_limit_headers(remaining, reset_after)
+                self.end_headers()
+
+            do_PATCH = do_POST
+
+            def _rate_limit_headers(self, remaining, reset_after):
+                self.send_header('X-RateLimit-Bucket', 'stub-' + self.path.rsplit('/', 1)[-1])
+                self.send_header('X-RateLimit-Limit', str(stub.limit))
+                self.send_header('X-RateLimit-Remaining', str(remaining))
+                self.send_header('X-RateLimit-Reset-After', f"{reset_after:.3f}")
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run a local stub of the Discord webhook API')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8099)
+    parser.add_argument('--limit', type=int, default=5, help='requests allowed per window per path')
+    parser.add_argument('--window', type=float, default=2.0, help='rate-limit window in seconds')
+    parser.add_argument('--latency', type=float, default=0.0, help='artificial response delay in seconds')
+    args = parser.parse_args()
+
+    stub = StubDiscord(args.host, args.port, args.limit, args.window, args.latency)
+    print(f"Stub Discord webhook listening at {stub.url}")
+    try:
+        stub.server.serve_forever()
+    except KeyboardInterrupt:
+        print(f"Stopped: {stub.stats}")
+
+
+if __name__ == '__main__':
+    main()
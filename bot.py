@@ -2,85 +2,212 @@ import os
 import nextcord
 from nextcord.ext import commands
 import datetime
-import json
 import pytz
 import asyncio
+import atexit
+import logging
 from dotenv import load_dotenv
+from score_parser import parse_globle_score
+from partitions import PartitionRegistry
+from user_resolver import UserResolver, MAX_NAMES
+from leaderboard import paginate
+from score_columns import distribution_text
+from backfill import Backfill
+from dedupe import MessageDedupe, DEDUPE_TTL
+from acks import AsyncAckAggregator, ACK_WINDOW, ACK_MAX_ENTRIES
+from send_scheduler import SendScheduler, ANNOUNCEMENT, REPLY, ACK, REMINDER, CHANNEL_RATE, CHANNEL_BURST, MAX_QUEUE
+from logs import setup_logging
+from scheduler import DeadlineScheduler
+import fanout
+import metrics
+from metrics import MESSAGES, DUPLICATES, PARSE_SECONDS, STORE_SECONDS, SENDS, SEND_SECONDS, RATE_LIMITED, RETRIES, ACK_DELAY, message_age
 
 # Load environment variables
 load_dotenv()
 TOKEN = os.getenv('DISCORD_TOKEN')
 GLOBLE_CHANNEL_ID = int(os.getenv('GLOBLE_CHANNEL_ID', 0))
+# Port for the /metrics exporter; unset disables it
+METRICS_PORT = os.getenv('METRICS_PORT')
+
+log = logging.getLogger('bot')
 
 # Bot setup with intents
 intents = nextcord.Intents.default()
 intents.message_content = True
 intents.members = True
-bot = commands.Bot(command_prefix='!', intents=intents)
 
-# Data storage
-SCORES_FILE = 'scores.json'
-USER_TIMEZONES_FILE = 'user_timezones.json'
-
-# Load scores from file
-def load_scores():
-    if os.path.exists(SCORES_FILE):
-        with open(SCORES_FILE, 'r') as f:
-            return json.load(f)
-    return {"date": datetime.datetime.now().strftime('%Y-%m-%d'), "scores": {}}
-
-# Save scores to file
-def save_scores(scores):
-    with open(SCORES_FILE, 'w') as f:
-        json.dump(scores, f)
-
-# Load user timezones from file
-def load_user_timezones():
-    if os.path.exists(USER_TIMEZONES_FILE):
-        with open(USER_TIMEZONES_FILE, 'r') as f:
-            return json.load(f)
+# Member caching: 'full' downloads and keeps every member of every server at
+# startup. 'lean' skips that and keeps only the names of members seen in a
+# Globle channel or in its score store, up to MEMBER_CACHE_SIZE; anyone else
+# is looked up when a leaderboard needs them. Use 'lean' on large servers.
+MEMBER_CACHE = os.getenv('MEMBER_CACHE', 'full')
+LEAN_MEMBERS = MEMBER_CACHE == 'lean'
+MEMBER_CACHE_SIZE = int(os.getenv('MEMBER_CACHE_SIZE', MAX_NAMES))
+
+# Client options for the member caching mode
+def member_cache_options(lean):
+    if lean:
+        return {'chunk_guilds_at_startup': False, 'member_cache_flags': nextcord.MemberCacheFlags.none()}
     return {}
 
-# Save user timezones to file
-def save_user_timezones(timezones):
-    with open(USER_TIMEZONES_FILE, 'w') as f:
-        json.dump(timezones, f)
+class GlobleBot(commands.Bot):
+    # Send pending score confirmations and queued messages before disconnecting
+    async def close(self):
+        await acks.close()
+        await outbound.drain(timeout=SHUTDOWN_DRAIN_SECONDS)
+        await super().close()
+
+bot = GlobleBot(command_prefix='!', intents=intents, **member_cache_options(LEAN_MEMBERS))
+
+# Display names for leaderboards, cached and fetched concurrently
+user_resolver = UserResolver(bot, max_size=MEMBER_CACHE_SIZE, query_members=LEAN_MEMBERS)
+
+# Timezone whose midnight closes the day, unless a channel sets its own
+DEFAULT_TIMEZONE = 'UTC'
+
+# Data storage
+# The original Globle channel keeps its files in the working directory;
+# channels set up with !setupgloble get their own directory under DATA_DIR
+DATA_DIR = os.getenv('DATA_DIR', 'data')
+PARTITIONS_FILE = os.getenv('PARTITIONS_FILE', os.path.join(DATA_DIR, 'partitions.json'))
+
+# Message IDs already handled are remembered so messages replayed after a
+# reconnect are skipped. Set DEDUPE_FILE to an empty string to keep them in memory only.
+DEDUPE_FILE = os.getenv('DEDUPE_FILE', 'seen_messages.json')
+DEDUPE_MEMORY_MB = float(os.getenv('DEDUPE_MEMORY_MB', '4'))
+
+# Score confirmations within this many seconds are merged into one message
+# (0 sends each one on its own), up to ACK_BATCH_SIZE per message
+ACK_WINDOW_SECONDS = float(os.getenv('ACK_WINDOW', ACK_WINDOW))
+ACK_BATCH_SIZE = int(os.getenv('ACK_BATCH_SIZE', ACK_MAX_ENTRIES))
+
+# Outgoing channel messages per second and burst size, per channel, and how
+# many may wait in one channel before confirmations and reminders are merged or dropped
+SEND_RATE = float(os.getenv('SEND_RATE', CHANNEL_RATE))
+SEND_BURST = int(os.getenv('SEND_BURST', CHANNEL_BURST))
+SEND_QUEUE_SIZE = int(os.getenv('SEND_QUEUE_SIZE', MAX_QUEUE))
+# Seconds allowed on shutdown for queued messages to go out
+SHUTDOWN_DRAIN_SECONDS = 10
+
+# Reminders are posted in the channel as mentions, or with REMINDER_DMS=1 sent
+# to each user as a direct message, REMINDER_DM_WORKERS at a time. Users who
+# don't accept direct messages are mentioned in the channel instead.
+REMINDER_DMS = os.getenv('REMINDER_DMS', '0') == '1'
+REMINDER_DM_WORKERS = int(os.getenv('REMINDER_DM_WORKERS', '4'))
+
+# Last completed rollover per partition, for catching up after a restart
+SCHEDULE_FILE = os.getenv('SCHEDULE_FILE', os.path.join(DATA_DIR, 'schedule.json'))
+# Seconds between saves of the handled message IDs
+DEDUPE_SAVE_INTERVAL = 60
+
+# Number of days shown by !history
+HISTORY_DAYS = 30
+
+# Rolling boards: (window in days, days played needed to be ranked)
+WEEKLY_BOARD = (7, 3)
+MONTHLY_BOARD = (30, 10)
+# Number of users shown on the weekly and monthly boards
+BOARD_SIZE = 10
 
-# Reset scores for a new day
-def reset_daily_scores():
-    scores = {"date": datetime.datetime.now().strftime('%Y-%m-%d'), "scores": {}}
-    save_scores(scores)
-    return scores
+# Archived days summarised by !distribution
+DISTRIBUTION_DAYS = 30
+
+# Scores, timezones and history are kept per (guild, channel) partition
+partitions = PartitionRegistry(DATA_DIR, {"morning": 8, "evening": 21}, DEFAULT_TIMEZONE, PARTITIONS_FILE)
+partitions.set_default('.', channel_id=GLOBLE_CHANNEL_ID or None)
+atexit.register(partitions.close)
+
+message_dedupe = MessageDedupe(
+    ttl=int(os.getenv('DEDUPE_TTL', DEDUPE_TTL)),
+    memory_budget=int(DEDUPE_MEMORY_MB * 1024 * 1024),
+    path=DEDUPE_FILE or None,
+)
+atexit.register(message_dedupe.close)
+
+# Timed work, run from on_ready
+scheduler = DeadlineScheduler(SCHEDULE_FILE)
+scheduler_task = None
+
+# Reset scores for a new day, unless the scores have already moved past
+# `day` (the current day by default)
+async def reset_daily_scores(partition, day=None):
+    return await asyncio.wrap_future(partition.reset_scores(day or partition.scores.date))
+
+# Partition serving a command's channel, or None if Globle isn't set up there
+def partition_for(ctx):
+    return partitions.for_channel(ctx.guild.id if ctx.guild else None, ctx.channel.id)
+
+# Channel a partition posts its announcements to
+def partition_channel(partition):
+    return bot.get_channel(int(partition.channel_id)) if partition.channel_id else None
+
+# Send a message to a channel or command context now, recording send metrics
+async def deliver(target, content):
+    try:
+        with SEND_SECONDS.time():
+            await target.send(content)
+    except Exception:
+        SENDS.labels('failed').inc()
+        raise
+    SENDS.labels('sent').inc()
+
+# Channel messages are queued per channel by priority and paced to the channel's rate limit
+outbound = SendScheduler(deliver, SEND_RATE, SEND_BURST, SEND_QUEUE_SIZE)
+
+# Queue a message and wait for it to be sent (False if it was dropped under load)
+async def send(target, content, priority=REPLY):
+    return await outbound.send(target, content, priority)
+
+# Score confirmations, merged per channel during bursts
+acks = AsyncAckAggregator(lambda channel, content: send(channel, content, ACK), ACK_WINDOW_SECONDS, ACK_BATCH_SIZE)
+
+NOT_SET_UP = "Globle isn't set up for this channel. A server manager can run `!setupgloble` in the Globle channel."
 
 # Bot events
 @bot.event
 async def on_ready():
-    print(f'{bot.user.name} has connected to Discord!')
+    log.info("Connected to Discord", extra={'user': bot.user.name})
+    
+    # Start background tasks (on_ready runs again after a reconnect)
+    global scheduler_task
+    if scheduler_task is None:
+        scheduler_task = bot.loop.create_task(schedule_daily_tasks())
+        log.info("Scheduler started")
     
-    # Start background tasks
-    bot.loop.create_task(schedule_daily_tasks())
-    print("Scheduler started!")
+    # Without a member cache, load today's players' names up front
+    if LEAN_MEMBERS:
+        bot.loop.create_task(warm_member_names())
 
-async def schedule_daily_tasks():
-    while True:
+# Lean member caching: request the members in each Globle channel's score store
+async def warm_member_names():
+    for partition in partitions.partitions():
+        channel = partition_channel(partition)
+        if channel is None or getattr(channel, 'guild', None) is None:
+            continue
         try:
-            # Get current time
-            now = datetime.datetime.now(pytz.UTC)
-            
-            # Check if it's midnight UTC to declare winner
-            if now.hour == 0 and now.minute == 0:
-                await declare_winner()
-            
-            # Check reminders every hour
-            if now.minute == 0:
-                await check_reminders()
-                
-            # Wait until the next minute
-            seconds_until_next_minute = 60 - now.second
-            await asyncio.sleep(seconds_until_next_minute)
-        except Exception as e:
-            print(f"Error in schedule_daily_tasks: {e}")
-            await asyncio.sleep(60)  # Wait a minute before trying again
+            await user_resolver.warm(channel.guild, list(partition.scores.scores()))
+        except Exception:
+            log.exception("Error loading member names", extra={'channel_id': partition.channel_id})
+    log.info("Loaded member names", extra={'cached': len(user_resolver), 'queries': user_resolver.stats['queries']})
+
+# Each partition's midnight rollover and reminders, and saving the handled message IDs
+def schedule_partition(partition):
+    name = partition.channel_id or 'default'
+    scheduler.add(f"rollover:{name}", partition.next_rollover,
+                  lambda due: declare_winner(partition, partition.closing_day(due)), persist=True)
+    reminders = f"reminders:{name}"
+    scheduler.add(reminders, lambda after: partition.reminders.next_due(), lambda due: check_reminders(partition))
+    partition.reminders.on_change = lambda: scheduler.reschedule(reminders)
+
+async def schedule_daily_tasks():
+    # Channels set up from now on (!setupgloble) are scheduled as they are added
+    partitions.on_register = schedule_partition
+    for partition in partitions.partitions():
+        schedule_partition(partition)
+    scheduler.add("dedupe-save", lambda after: after + datetime.timedelta(seconds=DEDUPE_SAVE_INTERVAL),
+                  lambda due: bot.loop.run_in_executor(None, message_dedupe.save))
+    # Sleeps until the next deadline; rollovers missed while the bot was down run first
+    await scheduler.run_async()
 
 @bot.event
 async def on_message(message):
@@ -88,66 +215,69 @@ async def on_message(message):
     if message.author == bot.user:
         return
     
-    # Only process messages in the Globle channel
-    if GLOBLE_CHANNEL_ID and message.channel.id != GLOBLE_CHANNEL_ID:
+    # Skip messages the gateway replays after a reconnect, before any parsing or I/O
+    if message_dedupe.seen(message.id):
+        DUPLICATES.inc()
+        return
+    
+    # Only process messages in a Globle channel
+    guild_id = message.guild.id if message.guild else None
+    partition = partitions.for_channel(guild_id, message.channel.id, guild_fallback=False)
+    if partition is None:
         await bot.process_commands(message)
         return
     
+    # Keep the author's name so leaderboards don't have to fetch it
+    user_resolver.remember(message.author)
+    
+    if message.content.startswith('!'):
+        MESSAGES.labels('command').inc()
+    
     # Check if the message contains a Globle score
-    if "Globle" in message.content and "guesses" in message.content.lower():
-        # Try to extract the number of guesses
+    with PARSE_SECONDS.time():
+        guesses = parse_globle_score(message.content)
+    MESSAGES.labels('score' if guesses is not None else 'no_score').inc()
+    if guesses is not None:
         try:
-            # Look for patterns like "I got it in X guesses" or "X/6" or similar
-            content = message.content.lower()
-            guesses = None
-            
-            # Check for common patterns
-            if "i got it in " in content:
-                parts = content.split("i got it in ")
-                if len(parts) > 1:
-                    num_part = parts[1].split()[0]
-                    if num_part.isdigit():
-                        guesses = int(num_part)
-            
-            # Check for X/6 pattern
-            elif "/" in content:
-                for word in content.split():
-                    if "/" in word:
-                        num_part = word.split("/")[0]
-                        if num_part.isdigit():
-                            guesses = int(num_part)
-            
-            # If we found a valid guess count
-            if guesses is not None:
-                scores = load_scores()
-                
-                # Check if it's a new day
-                today = datetime.datetime.now().strftime('%Y-%m-%d')
-                if scores["date"] != today:
-                    scores = reset_daily_scores()
+            # Record the score; the partition's writer also starts a new day if needed
+            user_id = str(message.author.id)
+            with STORE_SECONDS.labels('write').time():
+                recorded, players = await asyncio.wrap_future(partition.record_score(user_id, guesses))
+            if recorded:
+                await message.add_reaction("🌎")
+                age = message_age(message.created_at)
+                if age is not None:
+                    ACK_DELAY.observe(age)
                 
-                # Record the score
-                user_id = str(message.author.id)
-                if user_id not in scores["scores"] or guesses < scores["scores"][user_id]:
-                    scores["scores"][user_id] = guesses
-                    save_scores(scores)
-                    await message.add_reaction("🌎")
-                    
-                    # Provide feedback
-                    if len(scores["scores"]) == 1:
-                        await message.channel.send(f"Recorded your Globle score of {guesses} guesses, {message.author.display_name}! You're the first to submit today.")
-                    else:
-                        await message.channel.send(f"Recorded your Globle score of {guesses} guesses, {message.author.display_name}!")
-        except Exception as e:
-            print(f"Error processing Globle score: {e}")
+                # Provide feedback; the reaction is instant, the reply is merged
+                # with other confirmations arriving around the same time
+                acks.add(message.channel, user_id, message.author.display_name, guesses, first=players == 1)
+        except Exception:
+            log.exception("Error processing Globle score", extra={'user_id': message.author.id, 'channel_id': message.channel.id})
     
     await bot.process_commands(message)
 
+# nextcord waits out 429s itself and retries; count them for the metrics
+@bot.event
+async def on_http_ratelimit(limit, remaining, reset_after, bucket, scope):
+    RATE_LIMITED.inc()
+    RETRIES.inc()
+
+@bot.event
+async def on_global_http_ratelimit(retry_after):
+    RATE_LIMITED.inc()
+    RETRIES.inc()
+
 # Commands
 @bot.command(name='settz', help='Set your timezone (e.g., !settz America/New_York)')
 async def set_timezone(ctx, timezone=None):
     if not timezone:
-        await ctx.send("Please provide a timezone. Example: `!settz America/New_York`")
+        await send(ctx, "Please provide a timezone. Example: `!settz America/New_York`")
+        return
+    
+    partition = partition_for(ctx)
+    if partition is None:
+        await send(ctx, NOT_SET_UP)
         return
     
     try:
@@ -155,123 +285,297 @@ async def set_timezone(ctx, timezone=None):
         pytz.timezone(timezone)
         
         # Save the user's timezone
-        timezones = load_user_timezones()
-        timezones[str(ctx.author.id)] = timezone
-        save_user_timezones(timezones)
+        await asyncio.wrap_future(partition.set_user_timezone(str(ctx.author.id), timezone))
         
-        await ctx.send(f"Your timezone has been set to {timezone}. You'll receive reminders at 8am and 9pm in your local time.")
+        await send(ctx, f"Your timezone has been set to {timezone}. You'll receive reminders at 8am and 9pm in your local time.")
     except pytz.exceptions.UnknownTimeZoneError:
-        await ctx.send(f"Unknown timezone: {timezone}. Please use a valid timezone from the IANA timezone database.")
+        await send(ctx, f"Unknown timezone: {timezone}. Please use a valid timezone from the IANA timezone database.")
 
 @bot.command(name='score', help='Check your current Globle score')
 async def check_score(ctx):
-    scores = load_scores()
-    user_id = str(ctx.author.id)
+    partition = partition_for(ctx)
+    if partition is None:
+        await send(ctx, NOT_SET_UP)
+        return
     
-    if user_id in scores["scores"]:
-        await ctx.send(f"Your best Globle score today is {scores['scores'][user_id]} guesses.")
+    with STORE_SECONDS.labels('read').time():
+        best = partition.scores.get(str(ctx.author.id))
+    
+    if best is not None:
+        await send(ctx, f"Your best Globle score today is {best} guesses.")
     else:
-        await ctx.send("You haven't submitted a Globle score today.")
+        await send(ctx, "You haven't submitted a Globle score today.")
 
 @bot.command(name='leaderboard', help='Show the current Globle leaderboard')
 async def show_leaderboard(ctx):
-    scores = load_scores()
+    partition = partition_for(ctx)
+    if partition is None:
+        await send(ctx, NOT_SET_UP)
+        return
     
-    if not scores["scores"]:
-        await ctx.send("No scores have been submitted today.")
+    leaderboard = partition.scores.leaderboard
+    
+    if not len(leaderboard):
+        await send(ctx, "No scores have been submitted today.")
         return
     
-    # Sort scores by number of guesses (ascending)
-    sorted_scores = sorted(scores["scores"].items(), key=lambda x: x[1])
+    # Pages are cached until the next score is recorded, so repeat calls skip name lookups
+    pages = await render_leaderboard(partition, "leaderboard", f"**Globle Leaderboard for {partition.scores.date}**\n\n", ctx.guild)
+    for page in pages:
+        await send(ctx, page)
+
+# Render the leaderboard with display names, resolving names only when the board changed
+async def render_leaderboard(partition, key, header, guild):
+    leaderboard = partition.scores.leaderboard
+    with STORE_SECONDS.labels('read').time():
+        pages = leaderboard.cached_pages(key)
+    if pages is None:
+        names = await user_resolver.display_names([user_id for user_id, _ in leaderboard.ranked()], guild)
+        with STORE_SECONDS.labels('read').time():
+            pages = leaderboard.render(key, header, lambda user_id: names.get(user_id) or f"<@{user_id}>")
+    return pages
+
+@bot.command(name='history', help='Show your Globle scores from the last 30 days')
+async def show_history(ctx):
+    partition = partition_for(ctx)
+    if partition is None:
+        await send(ctx, NOT_SET_UP)
+        return
     
-    # Create leaderboard message
-    leaderboard = f"**Globle Leaderboard for {scores['date']}**\n\n"
+    rows = partition.history.user_history(ctx.author.id, HISTORY_DAYS)
     
-    for i, (user_id, guesses) in enumerate(sorted_scores, 1):
-        user = await bot.fetch_user(int(user_id))
-        leaderboard += f"{i}. {user.display_name}: {guesses} guesses\n"
+    if not rows:
+        await send(ctx, "You don't have any past Globle scores yet.")
+        return
     
-    await ctx.send(leaderboard)
+    history = f"**{ctx.author.display_name}'s last {len(rows)} Globle days**\n\n"
+    history += "\n".join(f"{day}: {guesses} guesses" for day, guesses in rows)
+    await send(ctx, history)
+
+@bot.command(name='winners', help="Show this month's daily Globle winners")
+async def show_winners(ctx):
+    partition = partition_for(ctx)
+    if partition is None:
+        await send(ctx, NOT_SET_UP)
+        return
+    
+    today = partition.today()
+    rows = partition.history.winners_between(today[:8] + "01", today)
+    
+    if not rows:
+        await send(ctx, "No Globle winners have been declared this month.")
+        return
+    
+    winners = f"**Globle Winners for {today[:7]}**\n\n"
+    winners += "\n".join(f"{day}: <@{winner_id}> ({guesses} guesses)" for day, winner_id, guesses in rows)
+    await send(ctx, winners)
+
+@bot.command(name='setupgloble', help='Use this channel for Globle scores (e.g., !setupgloble Europe/London)')
+@commands.guild_only()
+@commands.has_guild_permissions(manage_guild=True)
+async def setup_globle(ctx, timezone=None):
+    try:
+        partition = partitions.register(ctx.guild.id, ctx.channel.id, timezone)
+    except pytz.exceptions.UnknownTimeZoneError:
+        await send(ctx, f"Unknown timezone: {timezone}. Please use a valid timezone from the IANA timezone database.")
+        return
+    
+    # Its rollover follows the (possibly new) timezone from now on; the
+    # scheduler picks it up through partitions.on_register
+    await send(ctx, f"This channel now tracks Globle scores. The daily winner is declared at midnight {partition.timezone}.")
+
+# Text for a user's !stats reply
+def stats_text(name, stats):
+    lines = [
+        f"**{name}'s Globle stats**\n",
+        f"Days played: {stats['days']}",
+        f"Average: {stats['average']:.2f} guesses",
+        f"Best: {stats['best']} guesses",
+        f"Wins: {stats['wins']}",
+        f"Current streak: {stats['current_streak']} days (longest: {stats['longest_streak']})",
+    ]
+    for span, window in sorted(stats['windows'].items()):
+        lines.append(f"Last {span} days: {window['average']:.2f} average over {window['days']} days")
+    return "\n".join(lines)
+
+@bot.command(name='stats', help='Show your all-time Globle stats and streaks')
+async def show_stats(ctx):
+    partition = partition_for(ctx)
+    if partition is None:
+        await send(ctx, NOT_SET_UP)
+        return
+    
+    stats = partition.history.user_stats(ctx.author.id, partition.today())
+    if stats is None:
+        await send(ctx, "You don't have any past Globle scores yet.")
+        return
+    
+    await send(ctx, stats_text(ctx.author.display_name, stats))
+
+@bot.command(name='weekly', help='Show the best Globle averages over the last 7 days')
+async def show_weekly(ctx):
+    await show_window_board(ctx, *WEEKLY_BOARD)
+
+@bot.command(name='monthly', help='Show the best Globle averages over the last 30 days')
+async def show_monthly(ctx):
+    await show_window_board(ctx, *MONTHLY_BOARD)
+
+# Top users of a rolling window, read straight from the aggregates
+async def show_window_board(ctx, span, min_days):
+    partition = partition_for(ctx)
+    if partition is None:
+        await send(ctx, NOT_SET_UP)
+        return
+    
+    rows = partition.history.window_board(span, BOARD_SIZE, min_days)
+    if not rows:
+        await send(ctx, f"No one has played Globle on {min_days} of the last {span} days yet.")
+        return
+    
+    names = await user_resolver.display_names([user_id for user_id, _, _, _ in rows], ctx.guild)
+    header = f"**Globle Leaderboard for the last {span} days** (at least {min_days} days played)\n\n"
+    lines = [f"{i}. {names.get(user_id) or f'<@{user_id}>'}: {average:.2f} average over {days} days, {wins} wins"
+             for i, (user_id, average, days, wins) in enumerate(rows, 1)]
+    for page in paginate(header, lines):
+        await send(ctx, page)
+
+@bot.command(name='distribution', help="Show today's spread of Globle guesses and the last 30 days' percentiles")
+async def show_distribution(ctx):
+    partition = partition_for(ctx)
+    if partition is None:
+        await send(ctx, NOT_SET_UP)
+        return
+    
+    # Aggregating a month of history is CPU work; keep it off the event loop
+    day, today, window = await bot.loop.run_in_executor(None, partition.score_columns, DISTRIBUTION_DAYS)
+    await send(ctx, distribution_text(day, today, window, DISTRIBUTION_DAYS))
+
+# Channels with a backfill in progress
+backfills = {}
+
+@bot.command(name='backfill', help='Import Globle scores already posted in this channel (e.g., !backfill 5000)')
+@commands.guild_only()
+@commands.has_guild_permissions(manage_guild=True)
+async def backfill_channel(ctx, limit: int = None):
+    partition = partitions.for_channel(ctx.guild.id, ctx.channel.id, guild_fallback=False)
+    if partition is None:
+        await send(ctx, NOT_SET_UP)
+        return
+    if ctx.channel.id in backfills:
+        await send(ctx, "A backfill is already running in this channel.")
+        return
+    
+    # Resumes from the last checkpoint if an earlier backfill was interrupted
+    checkpoint = os.path.join(partition.data_dir, f"backfill_{ctx.channel.id}.json")
+    backfill = Backfill(partition.history, partition.tz, store=partition.scores,
+                        writer=partition.writer, checkpoint_path=checkpoint)
+    await send(ctx, "Importing Globle scores from this channel's history...")
+    backfills[ctx.channel.id] = backfill
+    try:
+        stats = await backfill.run_channel(ctx.channel, limit=limit)
+    except Exception:
+        log.exception("Error backfilling channel", extra={'channel_id': ctx.channel.id})
+        await send(ctx, "The backfill stopped with an error. Run `!backfill` again to resume it.")
+        return
+    finally:
+        del backfills[ctx.channel.id]
+    
+    await send(ctx, f"Backfill finished: scanned {stats['messages']} messages and imported {stats['scores']} scores "
+                    f"({stats['today']} from today, the rest across {stats['days']} earlier days).")
 
 # Scheduled tasks
-async def declare_winner():
+async def declare_winner(partition, day=None):
     try:
-        scores = load_scores()
+        score_store = partition.scores
         
-        # If no scores, nothing to do
-        if not scores["scores"]:
-            channel = bot.get_channel(GLOBLE_CHANNEL_ID)
-            if channel:
-                await channel.send("No Globle scores were submitted today.")
-            return
-        
-        # Sort scores by number of guesses (ascending)
-        sorted_scores = sorted(scores["scores"].items(), key=lambda x: x[1])
-        winner_id, winner_score = sorted_scores[0]
+        # Pending confirmations close with the day; they queue behind the announcement
+        channel = partition_channel(partition)
+        if channel:
+            await acks.flush(channel, wait=False)
         
-        # Get the winner's user object
-        winner = await bot.fetch_user(int(winner_id))
+        # A score posted after midnight may already have archived the day being
+        # closed (e.g. when catching up after a restart); announce it from history
+        archived = day is not None and score_store.date > day
+        if archived:
+            leaderboard = await bot.loop.run_in_executor(None, partition.archived_leaderboard, day)
+        else:
+            day = score_store.date
+            leaderboard = score_store.leaderboard
         
-        # Send winner announcement
-        channel = bot.get_channel(GLOBLE_CHANNEL_ID)
-        if channel:
-            await channel.send(f"🏆 **Today's Globle Winner** 🏆\n\nCongratulations to {winner.mention} who solved today's Globle in just {winner_score} guesses!")
+        if not len(leaderboard):
+            if channel:
+                await send(channel, "No Globle scores were submitted today.", ANNOUNCEMENT)
+        elif channel:
+            # The board is already ranked by number of guesses (ascending)
+            winner_id, winner_score = leaderboard.top(1)[0]
+            
+            # Send winner announcement (a mention needs only the ID, no fetch)
+            await send(channel, f"🏆 **Today's Globle Winner** 🏆\n\nCongratulations to <@{winner_id}> who solved today's Globle in just {winner_score} guesses!", ANNOUNCEMENT)
             
             # If there are more participants, show the full leaderboard
-            if len(sorted_scores) > 1:
-                leaderboard = "**Final Leaderboard**\n\n"
-                for i, (user_id, guesses) in enumerate(sorted_scores, 1):
-                    user = await bot.fetch_user(int(user_id))
-                    leaderboard += f"{i}. {user.display_name}: {guesses} guesses\n"
-                
-                await channel.send(leaderboard)
+            if len(leaderboard) > 1:
+                for page in await render_leaderboard(partition, "final", "**Final Leaderboard**\n\n", channel.guild):
+                    await send(channel, page, ANNOUNCEMENT)
         
-        # Reset for the next day
-        reset_daily_scores()
-    except Exception as e:
-        print(f"Error in declare_winner: {e}")
+        # Reset for the next day, unless a score posted while announcing has
+        # already rolled the day over
+        await reset_daily_scores(partition, day)
+    except Exception:
+        log.exception("Error in declare_winner", extra={'channel_id': partition.channel_id})
+
+# Reminder texts; {mentions} is replaced by the users being reminded
+REMINDER_TEXTS = {
+    "morning": "Good morning {mentions}! Don't forget to play Globle today: https://globle-game.com/",
+    "evening": "Hey {mentions}! Have you played Globle today? If so, share your score!",
+}
 
-async def check_reminders():
+async def check_reminders(partition):
     try:
-        now = datetime.datetime.now(pytz.UTC)
-        timezones = load_user_timezones()
-        channel = bot.get_channel(GLOBLE_CHANNEL_ID)
-        
+        # Only zones whose reminder hour has arrived are touched. Taking them
+        # moves the index on to the next reminder, even when there is no
+        # channel to send to; otherwise the job would run again straight away.
+        due = partition.reminders.due()
+        channel = partition_channel(partition)
         if not channel:
             return
         
-        morning_users = []
-        evening_users = []
-        
-        for user_id, timezone_str in timezones.items():
-            try:
-                # Convert UTC time to user's local time
-                user_tz = pytz.timezone(timezone_str)
-                user_time = now.astimezone(user_tz)
-                user_hour = user_time.hour
-                
-                # Morning reminder at 8am local time
-                if user_hour == 8 and user_time.minute < 5:
-                    morning_users.append(user_id)
-                
-                # Evening reminder at 9pm local time
-                elif user_hour == 21 and user_time.minute < 5:
-                    evening_users.append(user_id)
-            except Exception as e:
-                print(f"Error processing timezone for user {user_id}: {e}")
-        
-        # Send morning reminders
-        if morning_users:
-            morning_mentions = " ".join([f"<@{user_id}>" for user_id in morning_users])
-            await channel.send(f"Good morning {morning_mentions}! Don't forget to play Globle today: https://globle-game.com/")
-        
-        # Send evening reminders
-        if evening_users:
-            evening_mentions = " ".join([f"<@{user_id}>" for user_id in evening_users])
-            await channel.send(f"Hey {evening_mentions}! Have you played Globle today? If so, share your score!")
-    except Exception as e:
-        print(f"Error in check_reminders: {e}")
+        await asyncio.gather(*(remind(channel, f"{reminder}:{partition.channel_id}", text, due[reminder])
+                               for reminder, text in REMINDER_TEXTS.items() if due.get(reminder)))
+    except Exception:
+        log.exception("Error in check_reminders", extra={'channel_id': partition.channel_id})
+
+# Send one reminder to its users: as direct messages in DM mode, otherwise
+# as mentions packed into as many channel messages as it takes. The channel
+# messages are queued together and paced by the channel's send queue; only
+# messages that fail are retried.
+async def remind(channel, name, text, user_ids):
+    if REMINDER_DMS:
+        batch = fanout.FanoutBatch(f"{name}:dm", fanout.direct_messages(text, user_ids))
+        await fanout.deliver(batch, send_direct_message, concurrency=REMINDER_DM_WORKERS)
+        user_ids = batch.undeliverable_users()
+        if not user_ids:
+            return
+    
+    async def send_chunk(chunk):
+        return await send(channel, chunk.content, REMINDER)
+    
+    await fanout.deliver(fanout.FanoutBatch(name, fanout.pack_mentions(text, user_ids)), send_chunk)
+
+# Send a reminder chunk to its one user as a direct message
+async def send_direct_message(chunk):
+    user_id = int(chunk.user_ids[0])
+    try:
+        user = bot.get_user(user_id) or await bot.fetch_user(user_id)
+        await deliver(user, chunk.content)
+    except (nextcord.Forbidden, nextcord.NotFound) as e:
+        # DMs closed, or the user is gone; retrying won't help
+        raise fanout.Undeliverable(str(e)) from e
+    return True
 
 # Run the bot
 if __name__ == '__main__':
+    setup_logging()
+    if METRICS_PORT:
+        metrics.serve(int(METRICS_PORT))
+        log.info("Serving metrics", extra={'port': int(METRICS_PORT)})
     bot.run(TOKEN)
@@ -0,0 +1,249 @@
+import os
+import time
+import uuid
+import socket
+import sqlite3
+import logging
+import threading
+
+# Coordination between webhook workers sharing a data directory.
+#
+# When the webhook bot runs as several processes (WEBHOOK_PROCESSES, or
+# replicas started with WEBHOOK_SHARED=1 on the same host), any worker may
+# receive any event, so the handled message IDs are kept in a small SQLite
+# database they all use instead of in each worker's memory. Scores and
+# timezones are already shared through their journaled files and locks.
+#
+# Timed work (the midnight rollover and the reminders) must run in exactly
+# one worker. Workers campaign for a lease row in the same database; the
+# holder renews it every third of its lifetime and is the only one that runs
+# the scheduler. If the leader dies or stalls, the lease expires and another
+# worker takes it over. Each change of holder bumps the lease's term, which
+# is logged.
+#
+# A leader that fails to renew in time starts no new jobs. A job already
+# running checks with confirm() that its term is still current right before
+# each announcement or reset, and stops if it isn't. That is as far as the
+# guarantee goes: a job can still be overtaken between a check and the step
+# after it, and messages it has already queued are still sent, so a rollover
+# can be announced twice. The reset itself only ever happens once, because
+# it does nothing once the day it closes has been closed.
+
+# Default lifetime of a leader lease, in seconds
+LEASE_SECONDS = 15
+# A leader treats its lease as lost this many seconds (at most a quarter of its
+# lifetime) before it really expires, to allow for clock reads and a slow renewal
+LEASE_MARGIN = 2
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS leases (
+    name TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    expires REAL NOT NULL,
+    term INTEGER NOT NULL
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS seen_messages (
+    message_id TEXT PRIMARY KEY,
+    expires REAL NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_seen_messages_expires ON seen_messages (expires);
+"""
+
+log = logging.getLogger(__name__)
+
+
+# Raised by a job that finds it is no longer run by the current leader
+class LeaseLost(Exception):
+    pass
+
+
+# Identifies this process among the workers, e.g. in the leases table
+def worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+class CoordinationStore:
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        # Workers wait for each other's short transactions instead of failing
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+
+    # Run fn(conn) in a write transaction taken up front, so a read followed
+    # by a write can't interleave with another worker's
+    def transaction(self, fn):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = fn(self._conn)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            return result
+
+    # Run one statement on its own; returns the number of rows it changed
+    def execute(self, sql, params=()):
+        with self._lock:
+            return self._conn.execute(sql, params).rowcount
+
+    # First row of a query, or None
+    def fetchone(self, sql, params=()):
+        with self._lock:
+            return self._conn.execute(sql, params).fetchone()
+
+    # First column of the first row of a query
+    def scalar(self, sql, params=()):
+        with self._lock:
+            return self._conn.execute(sql, params).fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class LeaderLease:
+    def __init__(self, store, name, owner=None, ttl=LEASE_SECONDS, clock=time.time):
+        self.store = store
+        self.name = name
+        self.owner = owner or worker_id()
+        self.ttl = ttl
+        self.clock = clock
+        self.term = None
+        self.margin = min(LEASE_MARGIN, ttl / 4)
+        # Local time until which this worker may act as the leader
+        self._valid_until = 0
+
+    # Take the lease if it is free, expired or already ours. True if we hold it.
+    def acquire(self):
+        now = self.clock()
+
+        def claim(conn):
+            row = conn.execute("SELECT owner, expires, term FROM leases WHERE name = ?", (self.name,)).fetchone()
+            if row is not None and row[0] != self.owner and row[1] > now:
+                return None
+            term = 1 if row is None else row[2] + (row[0] != self.owner)
+            conn.execute("INSERT OR REPLACE INTO leases (name, owner, expires, term) VALUES (?, ?, ?, ?)",
+                         (self.name, self.owner, now + self.ttl, term))
+            return term
+
+        try:
+            term = self.store.transaction(claim)
+        except sqlite3.Error as e:
+            log.error("Error claiming the %s lease: %s", self.name, e)
+            term = None
+        if term is None:
+            self._valid_until = 0
+            return False
+        self.term = term
+        self._valid_until = now + self.ttl - self.margin
+        return True
+
+    # Whether this worker still holds the lease, without asking the database
+    def held(self):
+        return self.clock() < self._valid_until
+
+    # Raise LeaseLost unless this worker still holds the lease in `term`,
+    # according to the database
+    def confirm(self, term):
+        if not self.held() or term != self.term:
+            raise LeaseLost(f"{self.name} lease term {term} is over")
+        try:
+            row = self.store.fetchone("SELECT owner, expires, term FROM leases WHERE name = ?", (self.name,))
+        except sqlite3.Error as e:
+            raise LeaseLost(f"can't check the {self.name} lease: {e}") from e
+        if row is None or row[0] != self.owner or row[2] != term or row[1] <= self.clock():
+            raise LeaseLost(f"{self.name} lease term {term} is over")
+
+    # Give the lease up so another worker can take over right away
+    def release(self):
+        if not self._valid_until:
+            return
+        self._valid_until = 0
+        try:
+            self.store.execute("UPDATE leases SET expires = 0 WHERE name = ? AND owner = ?", (self.name, self.owner))
+        except sqlite3.Error as e:
+            log.error("Error releasing the %s lease: %s", self.name, e)
+
+    # Campaign for the lease until `stop` is set, calling run(lost) for each
+    # term won. `lost` is set when the lease can't be renewed; run should then
+    # return, after which the worker campaigns again. on_lost() is also called,
+    # e.g. to wake run up.
+    def lead(self, run, on_lost=None, stop=None):
+        stop = stop or threading.Event()
+        while not stop.is_set():
+            if not self.acquire():
+                stop.wait(self.ttl / 3)
+                continue
+            log.info("Elected leader", extra={'lease': self.name, 'owner': self.owner, 'term': self.term})
+            lost = threading.Event()
+            renewer = threading.Thread(target=self._renew, args=(lost, on_lost, stop), name=f"lease-{self.name}")
+            renewer.daemon = True
+            renewer.start()
+            try:
+                run(lost)
+            finally:
+                stepped_down = not lost.is_set()
+                lost.set()
+                renewer.join()
+                if stepped_down:
+                    self.release()
+            log.info("No longer leader", extra={'lease': self.name, 'owner': self.owner, 'term': self.term})
+
+    def _renew(self, lost, on_lost, stop):
+        while not lost.wait(self.ttl / 3):
+            if stop.is_set() or self.acquire():
+                continue
+            log.warning("Lost the leader lease", extra={'lease': self.name, 'owner': self.owner, 'term': self.term})
+            lost.set()
+            if on_lost is not None:
+                on_lost()
+
+
+# Handled message IDs shared by every worker using the same store. Same
+# interface as dedupe.MessageDedupe.
+class SharedDedupe:
+    def __init__(self, store, ttl, clock=time.time):
+        self.store = store
+        self.ttl = ttl
+        self.clock = clock
+        self.stats = {'duplicates': 0, 'expired': 0}
+
+    def __len__(self):
+        return self.store.scalar("SELECT COUNT(*) FROM seen_messages WHERE expires > ?", (self.clock(),))
+
+    # Record a message ID; True if any worker already handled it and it should be skipped
+    def seen(self, message_id):
+        if message_id is None:
+            return False
+        now = self.clock()
+        # One statement, so two workers given the same event can't both claim it;
+        # an expired entry is claimed again
+        claimed = self.store.execute(
+            "INSERT INTO seen_messages (message_id, expires) VALUES (?, ?) "
+            "ON CONFLICT (message_id) DO UPDATE SET expires = excluded.expires WHERE expires <= ?",
+            (str(message_id), now + self.ttl, now),
+        )
+        if not claimed:
+            self.stats['duplicates'] += 1
+            return True
+        return False
+
+    # Forget a message ID, e.g. when its event was turned away and will be redelivered
+    def forget(self, message_id):
+        if message_id is not None:
+            self.store.execute("DELETE FROM seen_messages WHERE message_id = ?", (str(message_id),))
+
+    # Drop expired IDs (the database itself is always up to date)
+    def save(self):
+        try:
+            self.stats['expired'] += self.store.execute("DELETE FROM seen_messages WHERE expires <= ?", (self.clock(),))
+        except sqlite3.Error as e:
+            log.error("Error pruning seen message IDs: %s", e)
+
+    close = save
@@ -0,0 +1,117 @@
+import os
+import json
+import time
+import logging
+import threading
+from collections import OrderedDict
+
+from score_store import write_json_atomic
+
+# Bounded memory of recently handled Discord message IDs.
+#
+# Discord redelivers webhook events and the gateway can replay messages after
+# a reconnect. Both bots check each message ID here before doing any parsing
+# or I/O. Entries expire after a TTL and the oldest are evicted once the
+# memory budget is used up. The IDs can be saved to a file and loaded on
+# startup, so a restart doesn't reprocess messages it already handled.
+
+# Default seconds a message ID is remembered
+DEDUPE_TTL = 6 * 60 * 60
+# Default memory budget for remembered IDs, in bytes
+DEDUPE_MEMORY = 4 * 1024 * 1024
+# Approximate memory used by one entry (snowflake int key and expiry float in an OrderedDict)
+ENTRY_BYTES = 170
+
+log = logging.getLogger(__name__)
+
+
+class MessageDedupe:
+    def __init__(self, ttl=DEDUPE_TTL, memory_budget=DEDUPE_MEMORY, path=None, clock=time.time):
+        self.ttl = ttl
+        self.max_entries = max(1, memory_budget // ENTRY_BYTES)
+        self.path = path
+        self.clock = clock
+        self._lock = threading.Lock()
+        # message ID -> expiry time, oldest first
+        self._seen = OrderedDict()
+        self._dirty = False
+        self.stats = {'duplicates': 0, 'evicted': 0}
+        if path:
+            self._load()
+
+    def __len__(self):
+        return len(self._seen)
+
+    # Record a message ID; True if it was already handled and should be skipped
+    def seen(self, message_id):
+        if message_id is None:
+            return False
+        key = self._key(message_id)
+        now = self.clock()
+        with self._lock:
+            expires = self._seen.get(key)
+            if expires is not None and expires > now:
+                self.stats['duplicates'] += 1
+                return True
+            self._seen[key] = now + self.ttl
+            self._seen.move_to_end(key)
+            self._dirty = True
+            self._evict(now)
+            return False
+
+    # Forget a message ID, e.g. when its event was turned away and will be redelivered
+    def forget(self, message_id):
+        if message_id is None:
+            return
+        with self._lock:
+            if self._seen.pop(self._key(message_id), None) is not None:
+                self._dirty = True
+
+    # Write the remembered IDs to the file if they changed since the last save
+    def save(self):
+        if not self.path:
+            return
+        with self._lock:
+            if not self._dirty:
+                return
+            self._evict(self.clock())
+            entries = [[key, expires] for key, expires in self._seen.items()]
+            self._dirty = False
+        try:
+            write_json_atomic(self.path, entries)
+        except OSError as e:
+            log.error("Error saving seen message IDs to %s: %s", self.path, e)
+
+    close = save
+
+    def _evict(self, now):
+        while self._seen:
+            key, expires = next(iter(self._seen.items()))
+            if expires > now and len(self._seen) <= self.max_entries:
+                break
+            del self._seen[key]
+            if expires > now:
+                self.stats['evicted'] += 1
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r') as f:
+                entries = json.load(f)
+        except (OSError, ValueError) as e:
+            log.error("Error loading seen message IDs from %s: %s", self.path, e)
+            return
+        now = self.clock()
+        for key, expires in sorted(entries, key=lambda entry: entry[1]):
+            if expires > now:
+                self._seen[key] = expires
+        self._evict(now)
+
+    # Snowflakes are kept as ints, which take less memory than their strings
+    @staticmethod
+    def _key(message_id):
+        try:
+            return int(message_id)
+        except (TypeError, ValueError):
+            return str(message_id)
@@ -0,0 +1,147 @@
+import logging
+
+from metrics import Counter
+
+# Reminder fan-out.
+#
+# A reminder can be due for hundreds of users at once, more mentions than
+# fit in one Discord message. The users are packed into as few messages as
+# fit under the length limit (or one direct message each), and the messages
+# of a batch are all handed to the sender at once, so they go out as fast as
+# the sender's rate limiting allows rather than one after another. Each
+# message's delivery is tracked; when some fail, only those are retried,
+# with a growing delay, and the batch's final status is logged.
+
+# Longest message Discord accepts
+MESSAGE_LIMIT = 2000
+# Attempts per message before it is given up on
+ATTEMPTS = 3
+# Seconds before the first retry of failed messages; doubled for each further retry
+RETRY_DELAY = 5
+
+# Delivery states of a message
+PENDING = 'pending'
+SENT = 'sent'
+FAILED = 'failed'
+# Won't succeed on retry, e.g. a user who doesn't accept direct messages
+UNDELIVERABLE = 'undeliverable'
+
+REMINDER_MESSAGES = Counter('globle_reminder_messages_total', 'Reminder messages, by delivery result', ['result'])
+
+log = logging.getLogger(__name__)
+
+
+# Raised by a sender for a message that can never be delivered
+class Undeliverable(Exception):
+    pass
+
+
+class Chunk:
+    def __init__(self, content, user_ids):
+        self.content = content
+        self.user_ids = user_ids
+        self.status = PENDING
+        self.attempts = 0
+        self.error = None
+
+
+class FanoutBatch:
+    def __init__(self, name, chunks):
+        self.name = name
+        self.chunks = chunks
+
+    # Messages that haven't been delivered and may still be retried
+    def pending(self):
+        return [chunk for chunk in self.chunks if chunk.status in (PENDING, FAILED)]
+
+    # Users whose messages could never be delivered
+    def undeliverable_users(self):
+        return [user_id for chunk in self.chunks if chunk.status == UNDELIVERABLE for user_id in chunk.user_ids]
+
+    # Number of messages and users in each delivery state
+    def status(self):
+        counts = {}
+        for chunk in self.chunks:
+            entry = counts.setdefault(chunk.status, {'messages': 0, 'users': 0})
+            entry['messages'] += 1
+            entry['users'] += len(chunk.user_ids)
+        return counts
+
+    def delivered(self):
+        return all(chunk.status == SENT for chunk in self.chunks)
+
+
+# Split users into messages of the form template.format(mentions=...) that
+# fit under `limit`, keeping the users in order
+def pack_mentions(template, user_ids, limit=MESSAGE_LIMIT):
+    room = limit - len(template.format(mentions=''))
+    chunks = []
+    current = []
+    length = 0
+    for user_id in user_ids:
+        mention = f"<@{user_id}>"
+        extra = len(mention) + (1 if current else 0)
+        if current and length + extra > room:
+            chunks.append(Chunk(template.format(mentions=" ".join(f"<@{user}>" for user in current)), current))
+            current = []
+            extra = len(mention)
+            length = 0
+        current.append(user_id)
+        length += extra
+    if current:
+        chunks.append(Chunk(template.format(mentions=" ".join(f"<@{user}>" for user in current)), current))
+    return chunks
+
+
+# One direct message per user
+def direct_messages(template, user_ids):
+    return [Chunk(template.format(mentions=f"<@{user_id}>"), [user_id]) for user_id in user_ids]
+
+
+# Deliver a batch with `send(chunk)`, a coroutine function returning True once
+# the message is sent and False (or raising) if it wasn't. With `concurrency`,
+# that many workers share the messages; otherwise they are all sent at once.
+# Failed messages are retried up to `attempts` times in all. Returns the batch.
+async def deliver(batch, send, attempts=None, retry_delay=None, concurrency=None):
+    import asyncio
+    attempts = ATTEMPTS if attempts is None else attempts
+    retry_delay = RETRY_DELAY if retry_delay is None else retry_delay
+    for attempt in range(attempts):
+        pending = batch.pending()
+        if not pending:
+            break
+        if attempt:
+            await asyncio.sleep(retry_delay * 2 ** (attempt - 1))
+            log.info("Retrying failed reminder messages", extra={
+                'batch': batch.name, 'messages': len(pending), 'attempt': attempt + 1,
+            })
+        if concurrency is None:
+            await asyncio.gather(*(_attempt(chunk, send) for chunk in pending))
+        else:
+            queue = list(reversed(pending))
+
+            async def worker():
+                while queue:
+                    await _attempt(queue.pop(), send)
+
+            await asyncio.gather(*(worker() for _ in range(min(concurrency, len(pending)))))
+
+    for chunk in batch.chunks:
+        REMINDER_MESSAGES.labels(chunk.status).inc()
+    level = logging.WARNING if any(chunk.status == FAILED for chunk in batch.chunks) else logging.INFO
+    log.log(level, "Reminder fan-out finished", extra={'batch': batch.name, 'status': batch.status()})
+    return batch
+
+
+async def _attempt(chunk, send):
+    chunk.attempts += 1
+    try:
+        sent = await send(chunk)
+    except Undeliverable as e:
+        chunk.status = UNDELIVERABLE
+        chunk.error = str(e)
+        return
+    except Exception as e:
+        sent = False
+        chunk.error = str(e)
+    chunk.status = SENT if sent else FAILED
@@ -0,0 +1,84 @@
+import os
+import threading
+
+try:
+    import fcntl
+except ImportError:
+    # No advisory locks on this platform; only one process may use a data directory
+    fcntl = None
+
+# Advisory lock shared between processes that use the same data directory.
+#
+# Writers hold it exclusively while they catch up with and append to the
+# shared files; readers that reload from disk hold it shared. Reads served
+# from memory never take it. Holding it is re-entrant within a process.
+
+
+class FileLock:
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.RLock()
+        self._fd = None
+        self._depth = 0
+        self._exclusive = False
+
+    # Take the lock (blocking); nested calls in the same thread just count depth
+    def acquire(self, shared=False):
+        self._lock.acquire()
+        if self._depth == 0 or (not shared and not self._exclusive):
+            try:
+                self._flock(shared)
+            except Exception:
+                self._lock.release()
+                raise
+        self._depth += 1
+
+    def release(self):
+        self._depth -= 1
+        if self._depth == 0 and self._fd is not None and fcntl is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            self._exclusive = False
+        self._lock.release()
+
+    def exclusive(self):
+        return _Held(self, shared=False)
+
+    def shared(self):
+        return _Held(self, shared=True)
+
+    def close(self):
+        with self._lock:
+            if self._fd is not None:
+                os.close(self._fd)
+                self._fd = None
+
+    def _flock(self, shared):
+        if fcntl is None:
+            return
+        if self._fd is None:
+            self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        fcntl.flock(self._fd, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        self._exclusive = not shared
+
+
+class _Held:
+    def __init__(self, lock, shared):
+        self.lock = lock
+        self.shared = shared
+
+    def __enter__(self):
+        self.lock.acquire(self.shared)
+        return self.lock
+
+    def __exit__(self, *exc):
+        self.lock.release()
+
+
+# Identifies one version of a file that is only ever replaced, never rewritten
+# in place; None if it doesn't exist
+def file_id(path):
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
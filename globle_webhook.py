@@ -1,200 +1,378 @@
+import time
+# Start of startup, for --profile-startup and the "listening" log line
+STARTUP_STARTED = time.perf_counter()
 import os
+import sys
 import json
-import requests
 import datetime
-import time
+import logging
+import threading
 import pytz
-import re
+import atexit
+from concurrent.futures import Future, ThreadPoolExecutor
 from dotenv import load_dotenv
-from flask import Flask, request, abort
+from score_parser import parse_globle_score
+from webhook_dispatcher import WebhookDispatcher
+from partitions import PartitionRegistry
+from leaderboard import paginate
+from score_columns import distribution_text
+from dedupe import MessageDedupe, DEDUPE_TTL
+from coordination import CoordinationStore, LeaderLease, LeaseLost, SharedDedupe, LEASE_SECONDS
+from acks import AckAggregator, ACK_WINDOW, ACK_MAX_ENTRIES
+from admission import IngressBudget, Overloaded, classify, READ
+from fanout import FanoutBatch, pack_mentions, deliver
+import interactions
+from interactions import SignatureVerifier, INTERACTIONS
+from logs import setup_logging
+from scheduler import DeadlineScheduler
+from metrics import REGISTRY, CONTENT_TYPE, Gauge, MESSAGES, DUPLICATES, PARSE_SECONDS, STORE_SECONDS, ACK_DELAY, message_age
+
+# Cold starts are frequent on Replit, so the time until the first request can
+# be served is kept short: Flask (or aiohttp) is imported only when the server
+# starts, requests only when the first message is sent, and the startup
+# messages go out after the port is already accepting connections. Each
+# startup phase is timed; run with --profile-startup to print the timings.
+
+# (phase, seconds) in the order the phases ran
+startup_phases = []
+_phase_started = STARTUP_STARTED
+
+# Record the time spent since the previous phase ended
+def startup_phase(name):
+    global _phase_started
+    now = time.perf_counter()
+    startup_phases.append((name, now - _phase_started))
+    _phase_started = now
+
+startup_phase('imports')
 
 # Load environment variables
 load_dotenv()
 WEBHOOK_URL = os.getenv('DISCORD_WEBHOOK_URL')
 DISCORD_BOT_TOKEN = os.getenv('DISCORD_BOT_TOKEN', '')
 DISCORD_PUBLIC_KEY = os.getenv('DISCORD_PUBLIC_KEY', '')
+# Needed only to register the slash commands (--register-commands)
+DISCORD_APPLICATION_ID = os.getenv('DISCORD_APPLICATION_ID', '')
 # Use PORT environment variable for Replit compatibility
 PORT = int(os.getenv('PORT', os.getenv('REPLIT_PORT', os.getenv('SERVER_PORT', '8080'))))
 
+# Webhook server: 'flask' (process events inside the request) or 'async'
+# (acknowledge immediately and process events on a worker pool)
+WEBHOOK_SERVER = os.getenv('WEBHOOK_SERVER', 'flask')
+
 # Default timezone (Eastern Time)
 DEFAULT_TIMEZONE = 'America/New_York'
 
 # Data storage
-SCORES_FILE = 'scores.json'
-USER_TIMEZONES_FILE = 'user_timezones.json'
-
-# Create Flask app for webhook listener
-app = Flask(__name__)
-
-# Load scores from file
-def load_scores():
-    if os.path.exists(SCORES_FILE):
-        with open(SCORES_FILE, 'r') as f:
-            return json.load(f)
-    return {"date": datetime.datetime.now(pytz.timezone(DEFAULT_TIMEZONE)).strftime('%Y-%m-%d'), "scores": {}}
-
-# Save scores to file
-def save_scores(scores):
-    with open(SCORES_FILE, 'w') as f:
-        json.dump(scores, f)
-
-# Load user timezones from file
-def load_user_timezones():
-    if os.path.exists(USER_TIMEZONES_FILE):
-        with open(USER_TIMEZONES_FILE, 'r') as f:
-            return json.load(f)
-    return {}
-
-# Save user timezones to file
-def save_user_timezones(timezones):
-    with open(USER_TIMEZONES_FILE, 'w') as f:
-        json.dump(timezones, f)
-
-# Reset scores for a new day
-def reset_daily_scores():
-    scores = {"date": datetime.datetime.now(pytz.timezone(DEFAULT_TIMEZONE)).strftime('%Y-%m-%d'), "scores": {}}
-    save_scores(scores)
-    return scores
-
-# Send message to Discord via webhook
-def send_discord_message(content):
-    if not WEBHOOK_URL:
-        print("Error: Discord webhook URL not set")
+# The original single channel keeps its files in the working directory;
+# channels listed in the partitions file get their own directory under DATA_DIR
+DATA_DIR = os.getenv('DATA_DIR', 'data')
+PARTITIONS_FILE = os.getenv('PARTITIONS_FILE', os.path.join(DATA_DIR, 'partitions.json'))
+GLOBLE_CHANNEL_ID = os.getenv('GLOBLE_CHANNEL_ID')
+
+# Message IDs already handled are remembered so redelivered events are skipped.
+# Set DEDUPE_FILE to an empty string to keep them in memory only.
+DEDUPE_FILE = os.getenv('DEDUPE_FILE', 'seen_messages.json')
+DEDUPE_MEMORY_MB = float(os.getenv('DEDUPE_MEMORY_MB', '4'))
+
+# Score confirmations within this many seconds are merged into one message
+# (0 sends each one on its own), up to ACK_BATCH_SIZE per message
+ACK_WINDOW_SECONDS = float(os.getenv('ACK_WINDOW', ACK_WINDOW))
+ACK_BATCH_SIZE = int(os.getenv('ACK_BATCH_SIZE', ACK_MAX_ENTRIES))
+
+# Number of days shown by !history
+HISTORY_DAYS = 30
+
+# Rolling boards: (window in days, days played needed to be ranked)
+WEEKLY_BOARD = (7, 3)
+MONTHLY_BOARD = (30, 10)
+# Number of users shown on the weekly and monthly boards
+BOARD_SIZE = 10
+
+# Archived days summarised by !distribution
+DISTRIBUTION_DAYS = 30
+
+# Number of scheduled jobs (e.g. partitions' midnight rollovers) that can run at the same time
+ROLLOVER_WORKERS = 8
+
+# Number of workers finishing deferred slash commands
+INTERACTION_WORKERS = int(os.getenv('INTERACTION_WORKERS', '4'))
+# Number of dispatchers sending the answers to deferred slash commands
+INTERACTION_DISPATCHERS = int(os.getenv('INTERACTION_DISPATCHERS', '8'))
+
+# Last completed rollover per partition, for catching up after a restart
+SCHEDULE_FILE = os.getenv('SCHEDULE_FILE', os.path.join(DATA_DIR, 'schedule.json'))
+
+# Several workers (webhook_workers.py, or replicas on the same host started
+# with WEBHOOK_SHARED=1) share the handled message IDs and elect one of
+# themselves to run the scheduled tasks, through COORDINATION_DB
+WEBHOOK_SHARED = os.getenv('WEBHOOK_SHARED', '0') == '1'
+COORDINATION_DB = os.getenv('COORDINATION_DB', os.path.join(DATA_DIR, 'workers.db'))
+LEADER_LEASE_SECONDS = float(os.getenv('LEADER_LEASE_SECONDS', LEASE_SECONDS))
+# Set by webhook_workers.py: the worker's number and the listening socket it inherits
+WEBHOOK_WORKER = os.getenv('WEBHOOK_WORKER')
+WEBHOOK_LISTEN_FD = os.getenv('WEBHOOK_LISTEN_FD')
+# Whether to post the "bot is now active" messages on startup (only one worker does)
+SEND_STARTUP_MESSAGES = os.getenv('WEBHOOK_STARTUP_MESSAGES', '1') == '1'
+
+log = logging.getLogger('globle_webhook')
+
+startup_phase('config')
+
+# Scores, timezones and history are kept per (guild, channel) partition
+partitions = PartitionRegistry(DATA_DIR, {"morning": 8, "evening": 23}, DEFAULT_TIMEZONE, PARTITIONS_FILE,
+                               shared=WEBHOOK_SHARED)
+partitions.set_default('.', channel_id=GLOBLE_CHANNEL_ID, timezone=DEFAULT_TIMEZONE, webhook_url=WEBHOOK_URL)
+atexit.register(partitions.close)
+
+startup_phase('partitions')
+
+if WEBHOOK_SHARED:
+    coordination = CoordinationStore(COORDINATION_DB)
+    message_dedupe = SharedDedupe(coordination, ttl=int(os.getenv('DEDUPE_TTL', DEDUPE_TTL)))
+    scheduler_lease = LeaderLease(coordination, 'scheduler', ttl=LEADER_LEASE_SECONDS)
+    # Exit handlers run in reverse, so the lease is released before the database is closed
+    atexit.register(coordination.close)
+    atexit.register(scheduler_lease.release)
+else:
+    coordination = scheduler_lease = None
+    message_dedupe = MessageDedupe(
+        ttl=int(os.getenv('DEDUPE_TTL', DEDUPE_TTL)),
+        memory_budget=int(DEDUPE_MEMORY_MB * 1024 * 1024),
+        path=DEDUPE_FILE or None,
+    )
+atexit.register(message_dedupe.close)
+
+startup_phase('dedupe')
+
+# Reset scores for a new day, unless the scores have already moved past
+# `day` (the current day by default)
+def reset_daily_scores(partition=None, day=None):
+    partition = partition or partitions.default
+    return partition.reset_scores(day or partition.scores.date).result()
+
+# Mention text for a user ID
+def mention(user_id):
+    return f"<@{user_id}>"
+
+# Text for a user's !stats reply
+def stats_text(name, stats):
+    lines = [
+        f"**{name}'s Globle stats**\n",
+        f"Days played: {stats['days']}",
+        f"Average: {stats['average']:.2f} guesses",
+        f"Best: {stats['best']} guesses",
+        f"Wins: {stats['wins']}",
+        f"Current streak: {stats['current_streak']} days (longest: {stats['longest_streak']})",
+    ]
+    for span, window in sorted(stats['windows'].items()):
+        lines.append(f"Last {span} days: {window['average']:.2f} average over {window['days']} days")
+    return "\n".join(lines)
+
+# Text for a user's !score reply
+def score_text(username, best):
+    if best is not None:
+        return f"{username}, your best Globle score today is {best} guesses."
+    return f"{username}, you haven't submitted a Globle score today."
+
+# Set a user's timezone; returns the reply
+def set_timezone(user_id, timezone_str, username, partition):
+    try:
+        # Validate the timezone
+        pytz.timezone(timezone_str)
+    except pytz.exceptions.UnknownTimeZoneError:
+        return f"Unknown timezone: {timezone_str}. Please use a valid timezone from the IANA timezone database."
+    
+    # Save the user's timezone
+    partition.set_user_timezone(user_id, timezone_str).result()
+    return f"{username}, your timezone has been set to {timezone_str}. You'll receive reminders at 8am and 11pm in your local time."
+
+# Pages of today's leaderboard
+def leaderboard_pages(partition):
+    score_store = partition.scores
+    leaderboard = score_store.leaderboard
+    if not len(leaderboard):
+        return ["No scores have been submitted today."]
+    
+    # Rendered pages are cached until the next score is recorded
+    with STORE_SECONDS.labels('read').time():
+        return leaderboard.render("leaderboard", f"**Globle Leaderboard for {score_store.date}**\n\n", mention)
+
+# Outbound messages are queued per webhook, so one busy channel's rate limit
+# doesn't hold up another's messages
+dispatchers = {}
+dispatchers_lock = threading.Lock()
+
+def dispatcher_for(url, key=None):
+    key = key or url
+    dispatcher = dispatchers.get(key)
+    if dispatcher is None:
+        with dispatchers_lock:
+            dispatcher = dispatchers.get(key)
+            if dispatcher is None:
+                dispatcher = dispatchers[key] = WebhookDispatcher(url)
+    return dispatcher
+
+# Dispatcher for an interaction's answers. Each interaction's webhook is a
+# rate-limit route of its own, so interactions are spread over a few
+# dispatchers: one that is rate limited or retrying only holds up the
+# interactions sharing its dispatcher, and its own messages stay in order.
+def interaction_dispatcher(interaction):
+    index = hash(interaction['token']) % INTERACTION_DISPATCHERS
+    return dispatcher_for(interactions.DISCORD_API, ('interactions', index))
+
+# Drain every dispatcher on exit (after the acknowledgements below are flushed into them)
+def stop_dispatchers():
+    for dispatcher in list(dispatchers.values()):
+        dispatcher.stop()
+
+atexit.register(stop_dispatchers)
+
+SEND_QUEUE_DEPTH = Gauge('globle_send_queue_depth', 'Outbound messages waiting to be sent')
+SEND_QUEUE_DEPTH.set_function(lambda: sum(dispatcher.pending() for dispatcher in list(dispatchers.values())))
+
+# Send message to Discord via webhook (queued; returns without waiting for Discord)
+def send_discord_message(content, partition=None):
+    url = (partition.webhook_url if partition else None) or WEBHOOK_URL
+    if not url:
+        log.error("Discord webhook URL not set")
         return False
     
     data = {
         "content": content
     }
     
-    response = requests.post(WEBHOOK_URL, json=data)
-    
-    if response.status_code == 204:
-        return True
-    else:
-        print(f"Error sending message: {response.status_code}, {response.text}")
-        return False
+    return dispatcher_for(url).send(data)
+
+# Send message to Discord via webhook; returns a Future that resolves to
+# whether it was delivered
+def deliver_discord_message(content, partition=None):
+    url = (partition.webhook_url if partition else None) or WEBHOOK_URL
+    if not url:
+        log.error("Discord webhook URL not set")
+        future = Future()
+        future.set_result(False)
+        return future
+    return dispatcher_for(url).submit({"content": content})
 
-# Parse Globle score from message content
-def parse_globle_score(content):
-    # Convert to lowercase for easier matching
-    content = content.lower()
-    
-    # Check if this is a Globle message
-    if "globle" not in content:
-        return None
-    
-    # Try different patterns to extract the score
-    
-    # Pattern 1: "I got it in X guesses"
-    match = re.search(r'(?:got|solved|finished)(?:\s+it)?\s+in\s+(\d+)', content)
-    if match:
-        return int(match.group(1))
-    
-    # Pattern 2: "X/6" or similar patterns
-    match = re.search(r'(\d+)\s*\/\s*\d+', content)
-    if match:
-        return int(match.group(1))
-    
-    # Pattern 3: "X guesses"
-    match = re.search(r'(\d+)\s+guess(?:es)?', content)
-    if match:
-        return int(match.group(1))
-    
-    # Pattern 4: Just look for "Globle" and a number close by
-    if "globle" in content:
-        # Find all numbers in the message
-        numbers = re.findall(r'\b(\d+)\b', content)
-        if numbers:
-            # Take the first number as the guess count (most likely to be the score)
-            # Could be improved with more context analysis
-            for num in numbers:
-                if int(num) < 100:  # Reasonable guess limit
-                    return int(num)
-    
-    return None
+# Events of each class (scores, commands, reads from memory) that may be
+# queued or in progress at once; see admission.py
+ingress = IngressBudget()
+
+# Score confirmations, merged per partition during bursts
+acks = AckAggregator(lambda partition, content: send_discord_message(content, partition), ACK_WINDOW_SECONDS, ACK_BATCH_SIZE)
+atexit.register(acks.close)
 
 # Process a message for Globle score
-def process_message(user_id, username, content):
+def process_message(user_id, username, content, partition=None):
+    partition = partition or partitions.default
     try:
         # Try to extract a score from the message
-        guesses = parse_globle_score(content)
+        with PARSE_SECONDS.time():
+            guesses = parse_globle_score(content)
+        MESSAGES.labels('score' if guesses is not None else 'no_score').inc()
         
         if guesses is not None:
-            scores = load_scores()
-            
-            # Check if it's a new day
-            today = datetime.datetime.now(pytz.timezone(DEFAULT_TIMEZONE)).strftime('%Y-%m-%d')
-            if scores["date"] != today:
-                scores = reset_daily_scores()
-            
-            # Record the score if it's better than their previous score or first submission
-            if user_id not in scores["scores"] or guesses < scores["scores"][user_id]:
-                scores["scores"][user_id] = guesses
-                save_scores(scores)
-                
-                # Provide feedback
-                if len(scores["scores"]) == 1:
-                    send_discord_message(f"Recorded your Globle score of {guesses} guesses, {username}! You're the first to submit today.")
-                else:
-                    send_discord_message(f"Recorded your Globle score of {guesses} guesses, {username}!")
+            # Record the score if it's better than their previous score or first
+            # submission; the partition's writer also starts a new day if needed
+            with STORE_SECONDS.labels('write').time():
+                recorded, players = partition.record_score(user_id, guesses).result()
+            if recorded:
+                # Provide feedback, merged with other confirmations arriving around the same time
+                acks.add(partition, user_id, username, guesses, first=players == 1)
                 
                 return True
-    except Exception as e:
-        print(f"Error processing message: {e}")
+    except Exception:
+        log.exception("Error processing message", extra={'user_id': user_id, 'channel_id': partition.channel_id})
     
     return False
 
 # Process a command message
-def process_command(user_id, username, content):
+def process_command(user_id, username, content, partition=None):
+    partition = partition or partitions.default
+    score_store = partition.scores
+    score_history = partition.history
     try:
         # Check for settz command
         if content.startswith("!settz "):
             # Extract timezone
             timezone_str = content[7:].strip()
             
-            try:
-                # Validate the timezone
-                pytz.timezone(timezone_str)
-                
-                # Save the user's timezone
-                timezones = load_user_timezones()
-                timezones[user_id] = timezone_str
-                save_user_timezones(timezones)
-                
-                send_discord_message(f"{username}, your timezone has been set to {timezone_str}. You'll receive reminders at 8am and 11pm in your local time.")
-                return True
-            except pytz.exceptions.UnknownTimeZoneError:
-                send_discord_message(f"Unknown timezone: {timezone_str}. Please use a valid timezone from the IANA timezone database.")
-                return True
+            send_discord_message(set_timezone(user_id, timezone_str, username, partition), partition)
+            return True
         
         # Check for score command
         elif content == "!score":
-            scores = load_scores()
+            with STORE_SECONDS.labels('read').time():
+                best = score_store.get(user_id)
             
-            if user_id in scores["scores"]:
-                send_discord_message(f"{username}, your best Globle score today is {scores['scores'][user_id]} guesses.")
-            else:
-                send_discord_message(f"{username}, you haven't submitted a Globle score today.")
+            send_discord_message(score_text(username, best), partition)
             return True
         
         # Check for leaderboard command
         elif content == "!leaderboard":
-            scores = load_scores()
+            for page in leaderboard_pages(partition):
+                send_discord_message(page, partition)
+            return True
+        
+        # Check for history command
+        elif content == "!history":
+            rows = score_history.user_history(user_id, HISTORY_DAYS)
             
-            if not scores["scores"]:
-                send_discord_message("No scores have been submitted today.")
+            if not rows:
+                send_discord_message(f"{username}, you don't have any past Globle scores yet.", partition)
                 return True
             
-            # Sort scores by number of guesses (ascending)
-            sorted_scores = sorted(scores["scores"].items(), key=lambda x: x[1])
+            history = f"**{username}'s last {len(rows)} Globle days**\n\n"
+            history += "\n".join(f"{day}: {guesses} guesses" for day, guesses in rows)
+            send_discord_message(history, partition)
+            return True
+        
+        # Check for winners command
+        elif content == "!winners":
+            today = partition.today()
+            rows = score_history.winners_between(today[:8] + "01", today)
             
-            # Create leaderboard message
-            leaderboard = f"**Globle Leaderboard for {scores['date']}**\n\n"
+            if not rows:
+                send_discord_message("No Globle winners have been declared this month.", partition)
+                return True
             
-            for i, (user_id, guesses) in enumerate(sorted_scores, 1):
-                leaderboard += f"{i}. <@{user_id}>: {guesses} guesses\n"
+            winners = f"**Globle Winners for {today[:7]}**\n\n"
+            winners += "\n".join(f"{day}: <@{winner_id}> ({guesses} guesses)" for day, winner_id, guesses in rows)
+            send_discord_message(winners, partition)
+            return True
+        
+        # Check for stats command
+        elif content == "!stats":
+            stats = score_history.user_stats(user_id, partition.today())
+            
+            if stats is None:
+                send_discord_message(f"{username}, you don't have any past Globle scores yet.", partition)
+                return True
+            
+            send_discord_message(stats_text(username, stats), partition)
+            return True
+        
+        # Check for weekly and monthly leaderboard commands
+        elif content in ("!weekly", "!monthly"):
+            span, min_days = WEEKLY_BOARD if content == "!weekly" else MONTHLY_BOARD
+            rows = score_history.window_board(span, BOARD_SIZE, min_days)
+            
+            if not rows:
+                send_discord_message(f"No one has played Globle on {min_days} of the last {span} days yet.", partition)
+                return True
             
-            send_discord_message(leaderboard)
+            header = f"**Globle Leaderboard for the last {span} days** (at least {min_days} days played)\n\n"
+            lines = [f"{i}. {mention(board_user)}: {average:.2f} average over {days} days, {wins} wins"
+                     for i, (board_user, average, days, wins) in enumerate(rows, 1)]
+            for page in paginate(header, lines):
+                send_discord_message(page, partition)
+            return True
+        
+        # Check for distribution command
+        elif content == "!distribution":
+            day, today, window = partition.score_columns(DISTRIBUTION_DAYS)
+            send_discord_message(distribution_text(day, today, window, DISTRIBUTION_DAYS), partition)
             return True
         
         # Check for help command
@@ -203,172 +381,493 @@ def process_command(user_id, username, content):
             help_text += "• `!settz <timezone>` - Set your timezone (e.g., `!settz America/New_York`)\n"
             help_text += "• `!score` - Check your current Globle score\n"
             help_text += "• `!leaderboard` - Show the current day's leaderboard\n"
+            help_text += "• `!history` - Show your scores from the last 30 days\n"
+            help_text += "• `!winners` - Show this month's daily winners\n"
+            help_text += "• `!stats` - Show your all-time stats and streaks\n"
+            help_text += "• `!weekly` / `!monthly` - Show the best averages over the last 7 or 30 days\n"
+            help_text += "• `!distribution` - Show today's spread of guesses and the last 30 days' percentiles\n"
             help_text += "• `!help` - Show this help message\n\n"
             help_text += "You can also simply share your Globle score in the channel and I'll record it automatically!"
             
-            send_discord_message(help_text)
+            send_discord_message(help_text, partition)
             return True
     
-    except Exception as e:
-        print(f"Error processing command: {e}")
+    except Exception:
+        log.exception("Error processing command", extra={'user_id': user_id, 'command': content.split(' ')[0]})
     
     return False
 
-# Declare winner for the day
-def declare_winner():
+# Declare winner for the day. fence() is called before the announcement and
+# before the reset, and raises LeaseLost if this worker is no longer the leader.
+def declare_winner(partition=None, day=None, fence=None):
+    partition = partition or partitions.default
+    fence = fence or (lambda: None)
     try:
-        scores = load_scores()
+        score_store = partition.scores
         
-        # If no scores, nothing to do
-        if not scores["scores"]:
-            send_discord_message("No Globle scores were submitted today.")
-            return
+        # Pending confirmations go out before the announcement
+        acks.flush(partition)
         
-        # Sort scores by number of guesses (ascending)
-        sorted_scores = sorted(scores["scores"].items(), key=lambda x: x[1])
-        winner_id, winner_score = sorted_scores[0]
+        # A score posted after midnight may already have archived the day being
+        # closed (e.g. when catching up after a restart); announce it from history
+        archived = day is not None and score_store.date > day
+        if archived:
+            leaderboard = partition.archived_leaderboard(day)
+        else:
+            day = score_store.date
+            leaderboard = score_store.leaderboard
         
-        # Get current date in Eastern Time
-        now_et = datetime.datetime.now(pytz.timezone(DEFAULT_TIMEZONE))
-        today_et = now_et.strftime('%Y-%m-%d')
+        fence()
+        if not len(leaderboard):
+            send_discord_message("No Globle scores were submitted today.", partition)
+        else:
+            # The board is already ranked by number of guesses (ascending)
+            winner_id, winner_score = leaderboard.top(1)[0]
+            
+            # Send winner announcement for the day being closed
+            winner_message = f"🏆 **Globle Winner for {day}** 🏆\n\nCongratulations to <@{winner_id}> who solved today's Globle in just {winner_score} guesses!"
+            send_discord_message(winner_message, partition)
+            
+            # If there are more participants, show the full leaderboard
+            if len(leaderboard) > 1:
+                for page in leaderboard.render("final", "**Final Leaderboard**\n\n", mention):
+                    send_discord_message(page, partition)
         
-        # Send winner announcement
-        winner_message = f"🏆 **Globle Winner for {today_et}** 🏆\n\nCongratulations to <@{winner_id}> who solved today's Globle in just {winner_score} guesses!"
-        send_discord_message(winner_message)
+        # Reset for the next day, unless a score posted while announcing has
+        # already rolled the day over
+        fence()
+        reset_daily_scores(partition, day)
+    except LeaseLost:
+        # The rollover isn't recorded as done, so the new leader catches up on it
+        raise
+    except Exception:
+        log.exception("Error in declare_winner", extra={'channel_id': partition.channel_id})
+
+# Reminder texts; {mentions} is replaced by the users being reminded
+REMINDER_TEXTS = {
+    "morning": "Good morning {mentions}! Don't forget to play Globle today: https://globle-game.com/",
+    "evening": "Hey {mentions}! Have you played Globle today? If so, share your score!",
+}
+
+# Check for reminders based on user timezones. fence() is called before each
+# message is queued; once this worker is no longer the leader, the rest fail.
+def check_reminders(partition=None, fence=None):
+    partition = partition or partitions.default
+    try:
+        # Only zones whose reminder hour has arrived are touched
+        due = partition.reminders.due()
         
-        # If there are more participants, show the full leaderboard
-        if len(sorted_scores) > 1:
-            leaderboard = "**Final Leaderboard**\n\n"
-            for i, (user_id, guesses) in enumerate(sorted_scores, 1):
-                leaderboard += f"{i}. <@{user_id}>: {guesses} guesses\n"
-            
-            send_discord_message(leaderboard)
+        # Mentions are packed into as many messages as it takes, which are
+        # queued together; the job waits until they are delivered or given up on
+        name = partition.channel_id or 'default'
+        batches = [FanoutBatch(f"{reminder}:{name}", pack_mentions(text, due[reminder]))
+                   for reminder, text in REMINDER_TEXTS.items() if due.get(reminder)]
+        if batches:
+            import asyncio
+            asyncio.run(deliver_reminders(batches, partition, fence))
+    except Exception:
+        log.exception("Error in check_reminders", extra={'channel_id': partition.channel_id})
+
+# Deliver reminder batches through the partition's webhook, retrying only the messages that failed
+async def deliver_reminders(batches, partition, fence=None):
+    import asyncio
+    
+    async def send(chunk):
+        if fence is not None:
+            fence()
+        return await asyncio.wrap_future(deliver_discord_message(chunk.content, partition))
+    
+    await asyncio.gather(*(deliver(batch, send) for batch in batches))
+
+# Check a webhook event. Returns the response to send right away and the
+# message to process, or None when there is nothing to process. Raises
+# Overloaded when the message's class is over budget; a message returned
+# holds a slot until handle_message is done with it.
+def read_event(data):
+    # Check if this is a ping event
+    if data.get('type') == 1:
+        return {'type': 1}, None  # Respond to Discord's ping with a pong
+    
+    # Handle message events
+    if data.get('type') == 0 and data.get('message'):
+        message = data['message']
+        
+        # Ignore messages from bots
+        if message.get('author', {}).get('bot', False):
+            return {'status': 'ignored bot message'}, None
+        
+        # Turn the event away before its ID is remembered, so the retry isn't skipped
+        kind = classify(message.get('content', ''))
+        ingress.admit(kind)
+        
+        # Skip events Discord has already delivered, before any parsing or I/O.
+        # The shared dedupe can fail (e.g. a locked database); the slot is
+        # given back and Discord retries the event.
+        try:
+            duplicate = message_dedupe.seen(message.get('id'))
+        except Exception:
+            ingress.release(kind)
+            raise
+        if duplicate:
+            ingress.release(kind)
+            DUPLICATES.inc()
+            return {'status': 'duplicate'}, None
         
-        # Reset for the next day
-        reset_daily_scores()
-    except Exception as e:
-        print(f"Error in declare_winner: {e}")
+        return {'status': 'ok'}, message
+    
+    return {'status': 'ok'}, None
 
-# Check for reminders based on user timezones
-def check_reminders():
+# Process a message event from read_event and give back its slot
+def handle_message(message):
+    started = time.perf_counter()
     try:
-        now = datetime.datetime.now(pytz.UTC)
-        timezones = load_user_timezones()
+        process_event(message)
+    finally:
+        ingress.release(classify(message.get('content', '')), time.perf_counter() - started)
+
+# Whether a message is a read answered from memory, cheap enough to handle
+# without waiting behind the queued writes
+def is_read(message):
+    return classify(message.get('content', '')) == READ
+
+# Drop a message read_event accepted but the server couldn't queue, so its redelivery is handled
+def shed_message(message):
+    ingress.release(classify(message.get('content', '')))
+    message_dedupe.forget(message.get('id'))
+
+# Process a message event: commands first, then a potential Globle score
+def process_event(message):
+    # Find the (guild, channel) partition; messages from other channels are ignored
+    partition = partitions.for_channel(message.get('guild_id'), message.get('channel_id'), guild_fallback=False)
+    if partition is None:
+        return
+    
+    content = message.get('content', '')
+    user_id = message.get('author', {}).get('id')
+    username = message.get('author', {}).get('username')
+    
+    # Process commands
+    if content.startswith('!'):
+        MESSAGES.labels('command').inc()
+        process_command(user_id, username, content, partition)
+    
+    # Process potential Globle score, tracking how long after posting it was acknowledged
+    if process_message(user_id, username, content, partition):
+        age = message_age(message.get('timestamp'))
+        if age is not None:
+            ACK_DELAY.observe(age)
+
+# Slash commands arrive signed at /interactions; see interactions.py
+verifier = SignatureVerifier(DISCORD_PUBLIC_KEY)
+
+# Workers finishing deferred commands, started by the first one
+_interaction_pool = None
+_interaction_pool_lock = threading.Lock()
+
+def interaction_pool():
+    global _interaction_pool
+    with _interaction_pool_lock:
+        if _interaction_pool is None:
+            _interaction_pool = ThreadPoolExecutor(max_workers=INTERACTION_WORKERS, thread_name_prefix='interaction')
+        return _interaction_pool
+
+# Check and answer an interaction request; `body` is the raw request body the
+# signature headers are checked against. Returns (HTTP status, response).
+# /score is answered from memory right away. Slower commands are deferred,
+# taking a slot of their class until a worker has finished them.
+def read_interaction(body, signature, timestamp):
+    if not verifier.verify(signature, timestamp, body):
+        return 401, {'error': 'invalid request signature'}
+    try:
+        interaction = json.loads(body)
+    except ValueError:
+        return 400, {'error': 'invalid json'}
+    
+    # Respond to Discord's ping with a pong
+    if interaction.get('type') == interactions.PING:
+        return 200, {'type': interactions.PONG}
+    if interaction.get('type') != interactions.APPLICATION_COMMAND:
+        return 400, {'error': 'unsupported interaction type'}
+    
+    name = interaction.get('data', {}).get('name')
+    partition = partitions.for_channel(interaction.get('guild_id'), interactions.channel_id(interaction), guild_fallback=False)
+    if partition is None:
+        INTERACTIONS.labels(name, 'ignored').inc()
+        return 200, interactions.message("Globle scores aren't tracked in this channel.", ephemeral=True)
+    user = interactions.user(interaction)
+    user_id = user.get('id')
+    username = user.get('global_name') or user.get('username')
+    
+    if name == 'score':
+        with STORE_SECONDS.labels('read').time():
+            best = partition.scores.get(user_id)
+        INTERACTIONS.labels(name, 'inline').inc()
+        return 200, interactions.message(score_text(username, best))
+    elif name == 'settz':
+        timezone_str = str(interactions.options(interaction).get('timezone', '')).strip()
+        work = lambda: [set_timezone(user_id, timezone_str, username, partition)]
+    elif name == 'leaderboard':
+        work = lambda: leaderboard_pages(partition)
+    else:
+        return 400, {'error': 'unknown command'}
+    
+    # Discord doesn't retry an interaction, so one over budget is answered with a message
+    kind = classify(f"!{name}")
+    try:
+        ingress.admit(kind)
+    except Overloaded as e:
+        INTERACTIONS.labels(name, 'busy').inc()
+        return 200, interactions.message(f"The bot is busy right now, please try again in {e.retry_after} seconds.", ephemeral=True)
+    interaction_pool().submit(follow_up, interaction, kind, work)
+    INTERACTIONS.labels(name, 'deferred').inc()
+    return 200, interactions.deferred()
+
+# Finish a deferred command: the "thinking..." message is replaced by the
+# first page of the answer, and any further pages are posted as follow-ups
+def follow_up(interaction, kind, work):
+    started = time.perf_counter()
+    try:
+        try:
+            pages = work()
+        except Exception:
+            log.exception("Error processing interaction", extra={'command': interaction.get('data', {}).get('name')})
+            pages = ["Something went wrong, please try again."]
         
-        morning_users = []
-        evening_users = []
+        dispatcher = interaction_dispatcher(interaction)
+        dispatcher.send({"content": pages[0]}, interactions.original_url(interaction), method='PATCH')
+        for page in pages[1:]:
+            dispatcher.send({"content": page}, interactions.followup_url(interaction))
+    finally:
+        ingress.release(kind, time.perf_counter() - started)
+
+# Build the Flask app for the webhook listener
+def create_app():
+    from flask import Flask, request
+    
+    app = Flask(__name__)
+    
+    # Flask route to handle Discord webhook events
+    @app.route('/discord-webhook', methods=['POST'])
+    def discord_webhook():
+        # Verify the request is from Discord (simplified for this example)
+        # In production, you should verify the signature using DISCORD_PUBLIC_KEY
         
-        for user_id, timezone_str in timezones.items():
-            try:
-                # Convert UTC time to user's local time
-                user_tz = pytz.timezone(timezone_str)
-                user_time = now.astimezone(user_tz)
-                user_hour = user_time.hour
-                
-                # Morning reminder at 8am local time
-                if user_hour == 8 and user_time.minute < 5:
-                    morning_users.append(user_id)
-                
-                # Evening reminder at 11pm local time
-                elif user_hour == 23 and user_time.minute < 5:
-                    evening_users.append(user_id)
-            except Exception as e:
-                print(f"Error processing timezone for user {user_id}: {e}")
+        # Get the JSON data from the request
+        data = request.json
         
-        # Send morning reminders
-        if morning_users:
-            morning_mentions = " ".join([f"<@{user_id}>" for user_id in morning_users])
-            send_discord_message(f"Good morning {morning_mentions}! Don't forget to play Globle today: https://globle-game.com/")
+        try:
+            response, message = read_event(data)
+        except Overloaded as e:
+            return {'status': 'busy'}, 429, {'Retry-After': str(e.retry_after)}
+        if message is not None:
+            handle_message(message)
         
-        # Send evening reminders
-        if evening_users:
-            evening_mentions = " ".join([f"<@{user_id}>" for user_id in evening_users])
-            send_discord_message(f"Hey {evening_mentions}! Have you played Globle today? If so, share your score!")
-    except Exception as e:
-        print(f"Error in check_reminders: {e}")
-
-# Flask route to handle Discord webhook events
-@app.route('/discord-webhook', methods=['POST'])
-def discord_webhook():
-    # Verify the request is from Discord (simplified for this example)
-    # In production, you should verify the signature using DISCORD_PUBLIC_KEY
-    
-    # Get the JSON data from the request
-    data = request.json
+        return response
     
-    # Check if this is a ping event
-    if data.get('type') == 1:
-        return {'type': 1}  # Respond to Discord's ping with a pong
+    # Flask route to handle slash-command interactions
+    @app.route('/interactions', methods=['POST'])
+    def discord_interactions():
+        status, response = read_interaction(request.get_data(), request.headers.get('X-Signature-Ed25519'),
+                                            request.headers.get('X-Signature-Timestamp'))
+        return response, status
     
-    # Handle message events
-    if data.get('type') == 0:
-        # Check if this is a message
-        if data.get('message'):
-            message = data['message']
-            content = message.get('content', '')
-            user_id = message.get('author', {}).get('id')
-            username = message.get('author', {}).get('username')
-            
-            # Ignore messages from bots
-            if message.get('author', {}).get('bot', False):
-                return {'status': 'ignored bot message'}
-            
-            # Process commands
-            if content.startswith('!'):
-                process_command(user_id, username, content)
-            
-            # Process potential Globle score
-            process_message(user_id, username, content)
+    # Metrics in the Prometheus text format
+    @app.route('/metrics', methods=['GET'])
+    def metrics():
+        return REGISTRY.render(), 200, {'Content-Type': CONTENT_TYPE}
     
-    return {'status': 'ok'}
+    return app
 
 # Main loop for scheduled tasks
-def scheduled_tasks_loop():
-    print("Starting scheduled tasks loop")
+# Timed work: each partition's midnight rollover and reminders, and saving the
+# handled message IDs. Rollovers missed while the bot was down run on startup.
+scheduler = DeadlineScheduler(SCHEDULE_FILE)
+
+# Seconds between saves of the handled message IDs
+DEDUPE_SAVE_INTERVAL = 60
+
+# 1 while this worker runs the scheduled tasks
+SCHEDULER_LEADER = Gauge('globle_scheduler_leader', 'Whether this worker holds the scheduler lease')
+SCHEDULER_LEADER.set_function(lambda: 1 if scheduler_lease is None or scheduler_lease.held() else 0)
+
+# Wrap a job so it only starts while this worker holds the scheduler lease,
+# and is called as run(due, fence) with a fence() that raises LeaseLost once
+# the term it started in is over. A skipped or fenced run counts as failed,
+# so a rollover isn't recorded as done and the next leader catches up on it.
+def leader_only(run):
+    def guarded(due):
+        if scheduler_lease is None:
+            return run(due, lambda: None)
+        term = scheduler_lease.term
+        if not scheduler_lease.held():
+            raise LeaseLost("scheduler lease lost before the job ran")
+        return run(due, lambda: scheduler_lease.confirm(term))
+    return guarded
+
+def schedule_partition(partition):
+    name = partition.channel_id or 'default'
+    scheduler.add(f"rollover:{name}", partition.next_rollover,
+                  leader_only(lambda due, fence: declare_winner(partition, partition.closing_day(due), fence)),
+                  persist=True)
+    reminders = f"reminders:{name}"
+    scheduler.add(reminders, lambda after: partition.reminders.next_due(),
+                  leader_only(lambda due, fence: check_reminders(partition, fence)))
+    partition.reminders.on_change = lambda: scheduler.reschedule(reminders)
+
+# Run the scheduled tasks until `stop` is set (or forever)
+def scheduled_tasks_loop(stop=None):
+    log.info("Starting scheduled tasks loop")
+    
+    # Channels registered from now on are scheduled as they are added
+    partitions.on_register = schedule_partition
+    for partition in partitions.partitions():
+        schedule_partition(partition)
+    scheduler.add("dedupe-save", lambda after: after + datetime.timedelta(seconds=DEDUPE_SAVE_INTERVAL),
+                  lambda due: message_dedupe.save())
+    
+    # Jobs run in a pool so a slow rollover doesn't delay the other partitions
+    pool = ThreadPoolExecutor(max_workers=ROLLOVER_WORKERS, thread_name_prefix='scheduled')
     
     try:
-        while True:
-            # Get current time in Eastern Time
-            now_utc = datetime.datetime.now(pytz.UTC)
-            now_et = now_utc.astimezone(pytz.timezone(DEFAULT_TIMEZONE))
-            
-            # Check if it's midnight Eastern Time to declare winner
-            if now_et.hour == 0 and now_et.minute == 0:
-                declare_winner()
-            
-            # Check reminders every hour
-            if now_utc.minute == 0:
-                check_reminders()
-                
-            # Wait until the next minute
-            seconds_until_next_minute = 60 - datetime.datetime.now().second
-            time.sleep(seconds_until_next_minute)
+        scheduler.run_forever(pool, stop)
     except KeyboardInterrupt:
-        print("Scheduled tasks loop stopped by user")
-    except Exception as e:
-        print(f"Error in scheduled tasks loop: {e}")
+        log.info("Scheduled tasks loop stopped by user")
+    except Exception:
+        log.exception("Error in scheduled tasks loop")
+    finally:
+        partitions.on_register = None
+        # Let jobs already running finish before another term can start
+        pool.shutdown(wait=True)
 
-# Main function
-def main():
-    print("Starting Globle Discord Webhook Bot")
-    print(f"Webhook URL: {'Set' if WEBHOOK_URL else 'Not Set'}")
-    print(f"Default timezone: {DEFAULT_TIMEZONE}")
+# With several workers, run the scheduled tasks only while this worker holds
+# the scheduler lease, campaigning for it again whenever it is lost. Each term
+# starts a fresh scheduler, which reads the rollovers the previous leader
+# completed from SCHEDULE_FILE and catches up on any it missed.
+def lead_scheduled_tasks():
+    def run(lost):
+        global scheduler
+        scheduler = DeadlineScheduler(SCHEDULE_FILE)
+        scheduled_tasks_loop(lost)
+    
+    scheduler_lease.lead(run, on_lost=lambda: scheduler.wake())
+
+# Serve webhook events until interrupted. on_listening(port) is called from
+# the serving thread once the port accepts connections.
+# Workers started by webhook_workers.py accept on the socket they inherit.
+def serve(port=PORT, on_listening=None):
+    fd = int(WEBHOOK_LISTEN_FD) if WEBHOOK_LISTEN_FD else None
+    if WEBHOOK_SERVER == 'async':
+        import async_webhook
+        # Queued scores and commands share the worker pool
+        ingress.concurrency = async_webhook.WORKERS
+        # The shared dedupe is a SQLite write that can wait on other workers
+        async_webhook.run(read_event, handle_message, host='0.0.0.0', port=port, on_listening=on_listening, fd=fd,
+                          inline=is_read, on_shed=shed_message, read_interaction=read_interaction,
+                          blocking_read=coordination is not None)
+    else:
+        from werkzeug.serving import make_server
+        server = make_server('0.0.0.0', port, create_app(), threaded=True, fd=fd)
+        if on_listening is not None:
+            on_listening(server.socket.getsockname()[1])
+        server.serve_forever()
+
+# Called once the server is listening; the rest of startup runs on its own
+# thread so the server isn't held up
+def after_listening(port):
+    startup_phase('listen')
+    log.info("Listening for webhook events", extra={
+        'port': port,
+        'worker': WEBHOOK_WORKER,
+        'startup_ms': round((time.perf_counter() - STARTUP_STARTED) * 1000, 1),
+        'startup_phases': {name: round(seconds * 1000, 1) for name, seconds in startup_phases},
+    })
     
+    startup_thread = threading.Thread(target=finish_startup, name='startup')
+    startup_thread.daemon = True
+    startup_thread.start()
+
+# Startup work that can wait until requests are being served
+def finish_startup():
     # Send startup message
-    if WEBHOOK_URL:
+    if WEBHOOK_URL and SEND_STARTUP_MESSAGES:
         send_discord_message("Globle Bot is now active! Default timezone is Eastern Time (ET).")
         send_discord_message("Use `!help` to see available commands.")
     
-    import threading
+    if scheduler_lease is not None:
+        lead_scheduled_tasks()
+    else:
+        scheduled_tasks_loop()
+
+# Time startup up to the first answered request, print the phases and exit.
+# Nothing is sent to Discord and the scheduler isn't started.
+def profile_startup():
+    import urllib.request
+    
+    listening = []
+    ready = threading.Event()
+    
+    def on_listening(port):
+        listening.append(port)
+        ready.set()
+    
+    server_thread = threading.Thread(target=serve, args=(0, on_listening))
+    server_thread.daemon = True
+    server_thread.start()
+    if not ready.wait(60):
+        print("Server did not start listening within 60 seconds")
+        sys.exit(1)
+    startup_phase('listen')
+    
+    # A ping is answered without touching the scores
+    ping = urllib.request.Request(
+        f"http://127.0.0.1:{listening[0]}/discord-webhook",
+        data=json.dumps({'type': 1}).encode(),
+        headers={'Content-Type': 'application/json'},
+    )
+    with urllib.request.urlopen(ping, timeout=30) as response:
+        response.read()
+    startup_phase('first request')
+    to_first_request = time.perf_counter() - STARTUP_STARTED
     
-    # Start the scheduled tasks in a separate thread
-    scheduler_thread = threading.Thread(target=scheduled_tasks_loop)
-    scheduler_thread.daemon = True
-    scheduler_thread.start()
+    # Imports deferred until the first outbound message
+    import requests
+    startup_phase('deferred imports')
     
-    # Start the Flask app to listen for Discord webhook events
-    print(f"Starting webhook listener on port {PORT}")
-    app.run(host='0.0.0.0', port=PORT)
+    print(f"Startup profile ({WEBHOOK_SERVER} server)")
+    for name, seconds in startup_phases:
+        print(f"  {name:<18}{seconds * 1000:9.1f} ms")
+    print(f"  {'to first request':<18}{to_first_request * 1000:9.1f} ms")
+
+# Main function
+def main():
+    setup_logging()
+    startup_phase('logging')
+    
+    if '--profile-startup' in sys.argv[1:]:
+        profile_startup()
+        return
+    
+    # Register the slash commands, on one server if a guild ID follows
+    if '--register-commands' in sys.argv[1:]:
+        args = sys.argv[sys.argv.index('--register-commands') + 1:]
+        names = interactions.register_commands(DISCORD_APPLICATION_ID, DISCORD_BOT_TOKEN, args[0] if args else None)
+        print(f"Registered commands: {', '.join(names)}")
+        return
+    
+    log.info("Starting Globle Discord Webhook Bot", extra={
+        'webhook_url_set': bool(WEBHOOK_URL),
+        'default_timezone': DEFAULT_TIMEZONE,
+        'webhook_server': WEBHOOK_SERVER,
+        'worker': WEBHOOK_WORKER,
+        'shared': WEBHOOK_SHARED,
+    })
+    
+    # Start the webhook listener; startup messages and scheduled tasks follow once it is listening
+    log.info("Starting webhook listener", extra={'port': PORT})
+    try:
+        serve(PORT, after_listening)
+    except KeyboardInterrupt:
+        log.info("Webhook listener stopped by user")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,152 @@
+import logging
+import threading
+
+from metrics import Counter
+
+# Discord slash-command interactions for the webhook bot.
+#
+# Discord posts each interaction to the bot's interactions endpoint, signed
+# with the application's Ed25519 key, and gives up on it if it isn't answered
+# within 3 seconds. Commands answered from memory (/score) are answered in
+# the response itself. Anything slower is acknowledged with a deferred
+# response, which shows "thinking..." in Discord, and finished by a
+# background worker, which replaces that message with the real answer (and
+# posts further pages as follow-ups) through the interaction's webhook.
+#
+# Signatures are verified with PyNaCl (in requirements.txt). It is imported,
+# and the public key parsed, by the first interaction, not at startup.
+
+DISCORD_API = 'https://discord.com/api/v10'
+
+# Interaction types
+PING = 1
+APPLICATION_COMMAND = 2
+
+# Interaction response types
+PONG = 1
+CHANNEL_MESSAGE = 4
+DEFERRED_CHANNEL_MESSAGE = 5
+
+# Message flag: only the user who ran the command sees the reply
+EPHEMERAL = 64
+
+# Option type of a string argument
+STRING_OPTION = 3
+
+# The bot's slash commands, as registered with Discord
+COMMANDS = [
+    {
+        'name': 'settz',
+        'description': "Set your timezone for reminders",
+        'options': [{
+            'type': STRING_OPTION,
+            'name': 'timezone',
+            'description': "IANA timezone, e.g. America/New_York",
+            'required': True,
+        }],
+    },
+    {'name': 'score', 'description': "Check your Globle score today"},
+    {'name': 'leaderboard', 'description': "Show today's Globle leaderboard"},
+]
+
+INTERACTIONS = Counter('globle_interactions_total', 'Slash-command interactions, by command and how they were answered',
+                       ['command', 'response'])
+
+log = logging.getLogger(__name__)
+
+
+# Checks Discord's signature on interaction requests. The key is parsed once,
+# by the first request, and reused for every request after it.
+class SignatureVerifier:
+    def __init__(self, public_key):
+        self.public_key = public_key
+        # VerifyKey, or False when requests can't be verified
+        self._key = None
+        self._bad_signature = None
+        self._lock = threading.Lock()
+
+    def _verify_key(self):
+        if self._key is None:
+            with self._lock:
+                if self._key is None:
+                    self._key = self._load_key()
+        return self._key
+
+    def _load_key(self):
+        if not self.public_key:
+            log.error("DISCORD_PUBLIC_KEY not set; rejecting interactions")
+            return False
+        try:
+            from nacl.signing import VerifyKey
+            from nacl.exceptions import BadSignatureError
+        except ImportError:
+            log.error("PyNaCl is not installed; rejecting interactions")
+            return False
+        self._bad_signature = BadSignatureError
+        try:
+            return VerifyKey(bytes.fromhex(self.public_key))
+        except Exception:
+            log.exception("Invalid DISCORD_PUBLIC_KEY; rejecting interactions")
+            return False
+
+    # Whether `body` (bytes) was signed by Discord at `timestamp`
+    def verify(self, signature, timestamp, body):
+        key = self._verify_key()
+        if not key or not signature or not timestamp:
+            return False
+        try:
+            key.verify(timestamp.encode() + body, bytes.fromhex(signature))
+        except (self._bad_signature, ValueError):
+            return False
+        return True
+
+
+# Response with a message; ephemeral messages are only shown to the user who ran the command
+def message(content, ephemeral=False):
+    data = {'content': content}
+    if ephemeral:
+        data['flags'] = EPHEMERAL
+    return {'type': CHANNEL_MESSAGE, 'data': data}
+
+
+# Response acknowledging a command whose answer follows later
+def deferred():
+    return {'type': DEFERRED_CHANNEL_MESSAGE}
+
+
+# Values of a command's options, by name
+def options(interaction):
+    return {option['name']: option.get('value') for option in interaction.get('data', {}).get('options', [])}
+
+
+# The user who ran a command: the member's user in a server, the user in a DM
+def user(interaction):
+    return interaction.get('member', {}).get('user') or interaction.get('user') or {}
+
+
+def channel_id(interaction):
+    return interaction.get('channel_id') or interaction.get('channel', {}).get('id')
+
+
+# Webhook URL for editing the deferred response into the answer
+def original_url(interaction):
+    return f"{DISCORD_API}/webhooks/{interaction['application_id']}/{interaction['token']}/messages/@original"
+
+
+# Webhook URL for further messages in answer to the command
+def followup_url(interaction):
+    return f"{DISCORD_API}/webhooks/{interaction['application_id']}/{interaction['token']}"
+
+
+# Register the slash commands with Discord, replacing any registered before.
+# Global commands can take a while to appear; pass a guild ID to register
+# them on one server, where they appear immediately.
+def register_commands(application_id, bot_token, guild_id=None):
+    import requests
+    url = f"{DISCORD_API}/applications/{application_id}"
+    if guild_id:
+        url += f"/guilds/{guild_id}"
+    response = requests.put(f"{url}/commands", json=COMMANDS,
+                            headers={'Authorization': f"Bot {bot_token}"}, timeout=30)
+    response.raise_for_status()
+    return [command['name'] for command in response.json()]
@@ -0,0 +1,134 @@
+import bisect
+import threading
+
+# Incrementally maintained daily leaderboard.
+#
+# Users are kept in buckets keyed by guess count, with a sorted list of the
+# non-empty guess counts as the rank index, so recording a score only moves
+# one user between two buckets. Rendered text is cached per board version
+# and split into pages that fit in a Discord message.
+
+# Discord's maximum message length
+MESSAGE_LIMIT = 2000
+
+
+# Split a header and lines into messages no longer than `limit`
+def paginate(header, lines, limit=MESSAGE_LIMIT):
+    pages = []
+    current = header
+    for line in lines:
+        line = line[:limit - 1] + "\n"
+        if len(current) + len(line) > limit:
+            pages.append(current.rstrip("\n"))
+            current = ""
+        current += line
+    if current.strip() or not pages:
+        pages.append(current.rstrip("\n"))
+    return pages
+
+
+class Leaderboard:
+    def __init__(self):
+        self._lock = threading.RLock()
+        # guesses -> {user_id: None}, an insertion-ordered set
+        self._buckets = {}
+        # Sorted guess counts that have at least one user
+        self._keys = []
+        self._scores = {}
+        # Bumped on every change; rendered pages are cached against it
+        self.version = 0
+        self._pages = {}
+
+    def __len__(self):
+        return len(self._scores)
+
+    # Set a user's score, moving them between buckets if needed
+    def update(self, user_id, guesses):
+        with self._lock:
+            old = self._scores.get(user_id)
+            if old == guesses:
+                return
+            if old is not None:
+                self._discard(user_id, old)
+            bucket = self._buckets.get(guesses)
+            if bucket is None:
+                bucket = self._buckets[guesses] = {}
+                bisect.insort(self._keys, guesses)
+            bucket[user_id] = None
+            self._scores[user_id] = guesses
+            self.version += 1
+
+    # Replace the board with a {user_id: guesses} mapping
+    def load(self, scores):
+        with self._lock:
+            self._buckets = {}
+            self._keys = []
+            self._scores = {}
+            for user_id, guesses in scores.items():
+                self.update(user_id, guesses)
+            self.version += 1
+
+    def clear(self):
+        self.load({})
+
+    # (user_id, guesses) pairs, best first; ties keep the order scores were reached
+    def ranked(self):
+        with self._lock:
+            return [(user_id, guesses) for guesses in self._keys for user_id in self._buckets[guesses]]
+
+    # The first k entries of ranked(), without walking the rest of the board
+    def top(self, k):
+        result = []
+        with self._lock:
+            for guesses in self._keys:
+                for user_id in self._buckets[guesses]:
+                    if len(result) == k:
+                        return result
+                    result.append((user_id, guesses))
+        return result
+
+    # 1-based position of a user, or None
+    def rank(self, user_id):
+        with self._lock:
+            guesses = self._scores.get(user_id)
+            if guesses is None:
+                return None
+            position = 1
+            for key in self._keys:
+                if key == guesses:
+                    break
+                position += len(self._buckets[key])
+            for other in self._buckets[guesses]:
+                if other == user_id:
+                    return position
+                position += 1
+
+    # Number of users per guess count
+    def counts(self):
+        with self._lock:
+            return {guesses: len(self._buckets[guesses]) for guesses in self._keys}
+
+    # Pages rendered under `key` at the current version, or None if stale
+    def cached_pages(self, key):
+        entry = self._pages.get(key)
+        if entry is not None and entry[0] == self.version:
+            return entry[1]
+        return None
+
+    # Render the board as message-sized pages, reusing the cache when unchanged.
+    # `name_for` maps a user ID to the text shown for that user.
+    def render(self, key, header, name_for):
+        with self._lock:
+            pages = self.cached_pages(key)
+            if pages is None:
+                lines = [f"{i}. {name_for(user_id)}: {guesses} guesses" for i, (user_id, guesses) in enumerate(self.ranked(), 1)]
+                pages = paginate(header, lines)
+                self._pages[key] = (self.version, pages)
+            return pages
+
+    def _discard(self, user_id, guesses):
+        bucket = self._buckets[guesses]
+        del bucket[user_id]
+        if not bucket:
+            del self._buckets[guesses]
+            del self._keys[bisect.bisect_left(self._keys, guesses)]
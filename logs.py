@@ -0,0 +1,73 @@
+import os
+import sys
+import copy
+import json
+import queue
+import atexit
+import logging
+import datetime
+from logging.handlers import QueueHandler, QueueListener
+
+# Structured, non-blocking logging for both bots.
+#
+# Log calls only put the record on an in-memory queue; a listener thread
+# formats each record as one JSON object per line and writes it to stdout.
+# Extra fields passed with `extra={...}` become keys of the JSON object.
+
+# Minimum level that is logged, e.g. DEBUG, INFO, WARNING
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+
+# Attributes every LogRecord has; anything else came from `extra`
+_RECORD_FIELDS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+_listener = None
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'ts': datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_FIELDS and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+# Hands records to the listener thread; only the message is rendered here
+class _QueueHandler(QueueHandler):
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+# Route all logging through the queue; safe to call more than once
+def setup_logging(level=None, stream=None):
+    global _listener
+    root = logging.getLogger()
+    root.setLevel(level or LOG_LEVEL)
+    if _listener is not None:
+        return
+
+    output = logging.StreamHandler(stream or sys.stdout)
+    output.setFormatter(JsonFormatter())
+    records = queue.SimpleQueue()
+    _listener = QueueListener(records, output, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(_QueueHandler(records))
@@ -1,6 +1,14 @@
 #!/usr/bin/env python3
 # This is a wrapper file for Replit to run our bot
-from globle_webhook import main
+import os
+
+from dotenv import load_dotenv
 
 if __name__ == "__main__":
+    # WEBHOOK_PROCESSES > 1 runs several webhook workers under a supervisor
+    load_dotenv()
+    if int(os.getenv('WEBHOOK_PROCESSES', '1')) > 1 and not os.getenv('WEBHOOK_WORKER'):
+        from webhook_workers import main
+    else:
+        from globle_webhook import main
     main()
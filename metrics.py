@@ -0,0 +1,279 @@
+import abc
+import time
+import bisect
+import datetime
+import threading
+
+# In-process metrics in the Prometheus text format.
+#
+# Counters, gauges and histograms are plain objects guarded by a lock, so
+# recording a sample on the hot path is a dictionary lookup and an addition.
+# The webhook bot serves them on its /metrics route; the gateway bot has no
+# HTTP server of its own, so serve() starts a small one on a side thread.
+
+# Default histogram buckets, in seconds
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}
+
+    def register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} is already registered")
+            self._metrics[metric.name] = metric
+
+    def get(self, name):
+        return self._metrics.get(name)
+
+    # All metrics in the Prometheus text exposition format
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+class _Metric(abc.ABC):
+    type = None
+
+    def __init__(self, name, help, labels=(), registry=REGISTRY):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+        # label values -> child holding the value
+        self._children = {}
+        registry.register(self)
+
+    # The child for one combination of label values
+    def labels(self, *values):
+        key = tuple(str(value) for value in values)
+        child = self._children.get(key)
+        if child is None:
+            if len(key) != len(self.label_names):
+                raise ValueError(f"{self.name} expects labels {self.label_names}")
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def _label_text(self, key, extra=()):
+        pairs = list(zip(self.label_names, key)) + list(extra)
+        if not pairs:
+            return ''
+        return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+    # A new holder for one combination of label values
+    @abc.abstractmethod
+    def _new_child(self):
+        pass
+
+    def samples(self):
+        with self._lock:
+            children = sorted(self._children.items())
+        lines = []
+        for key, child in children:
+            lines.extend(child.samples(self, key))
+        return lines
+
+
+class _Value:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.value = 0.0
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def samples(self, metric, key):
+        return [f"{metric.name}{metric._label_text(key)} {_format_value(self.value)}"]
+
+
+class _GaugeValue(_Value):
+    def __init__(self):
+        super().__init__()
+        self._function = None
+
+    def dec(self, amount=1):
+        self.inc(-amount)
+
+    def set(self, value):
+        self.value = value
+
+    # Read the value from `function` whenever metrics are rendered
+    def set_function(self, function):
+        self._function = function
+
+    def samples(self, metric, key):
+        if self._function is not None:
+            try:
+                self.value = self._function()
+            except Exception:
+                pass
+        return super().samples(metric, key)
+
+
+class _HistogramValue:
+    def __init__(self, buckets):
+        self._lock = threading.Lock()
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            if index < len(self.counts):
+                self.counts[index] += 1
+            self.count += 1
+            self.sum += value
+
+    # Context manager observing the time spent inside it
+    def time(self):
+        return _Timer(self)
+
+    def samples(self, metric, key):
+        with self._lock:
+            counts, count, total = list(self.counts), self.count, self.sum
+        lines = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets, counts):
+            cumulative += bucket_count
+            lines.append(f"{metric.name}_bucket{metric._label_text(key, [('le', _format_value(bound))])} {cumulative}")
+        lines.append(f"{metric.name}_bucket{metric._label_text(key, [('le', '+Inf')])} {count}")
+        lines.append(f"{metric.name}_sum{metric._label_text(key)} {_format_value(total)}")
+        lines.append(f"{metric.name}_count{metric._label_text(key)} {count}")
+        return lines
+
+
+class _Timer:
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start)
+
+
+class Counter(_Metric):
+    type = 'counter'
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+
+class Gauge(_Metric):
+    type = 'gauge'
+
+    def _new_child(self):
+        return _GaugeValue()
+
+    def set(self, value):
+        self.labels().set(value)
+
+    def set_function(self, function):
+        self.labels().set_function(function)
+
+
+class Histogram(_Metric):
+    type = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS, registry=REGISTRY):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, help, labels, registry)
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+    def time(self):
+        return self.labels().time()
+
+
+# Serve the registry on http://host:port/metrics from a daemon thread
+def serve(port, host='0.0.0.0', registry=REGISTRY):
+    # Only the gateway bot serves metrics this way; the webhook bot doesn't pay for the import
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] != '/metrics':
+                self.send_error(404)
+                return
+            body = registry.render().encode()
+            self.send_response(200)
+            self.send_header('Content-Type', CONTENT_TYPE)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, name='metrics-server')
+    thread.daemon = True
+    thread.start()
+    return server
+
+
+# Delay from a Discord message's creation time (datetime or ISO 8601 string) to now
+def message_age(created):
+    if created is None:
+        return None
+    if isinstance(created, str):
+        try:
+            created = datetime.datetime.fromisoformat(created.replace('Z', '+00:00'))
+        except ValueError:
+            return None
+    if created.tzinfo is None:
+        created = created.replace(tzinfo=datetime.timezone.utc)
+    return (datetime.datetime.now(datetime.timezone.utc) - created).total_seconds()
+
+
+# Metrics shared by both bots
+MESSAGES = Counter('globle_messages_total', 'Messages handled, by outcome', ['result'])
+PARSE_SECONDS = Histogram('globle_parse_seconds', 'Time spent looking for a Globle score in a message')
+STORE_SECONDS = Histogram('globle_store_seconds', 'Time spent in score store reads and writes', ['op'])
+SENDS = Counter('globle_sends_total', 'Outbound Discord messages, by result', ['result'])
+SEND_SECONDS = Histogram('globle_send_seconds', 'Time for one outbound Discord request')
+RATE_LIMITED = Counter('globle_send_rate_limited_total', '429 responses received from Discord')
+RETRIES = Counter('globle_send_retries_total', 'Outbound requests retried after a failure or 429')
+TICK_SECONDS = Histogram('globle_scheduler_tick_seconds', 'Duration of one scheduled job run')
+DUPLICATES = Counter('globle_duplicate_messages_total', 'Redelivered or replayed messages skipped by message ID')
+ACK_DELAY = Histogram('globle_ack_delay_seconds', 'Delay from a score message being posted to its acknowledgement')
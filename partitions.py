@@ -0,0 +1,300 @@
+import os
+import json
+import datetime
+import threading
+
+import pytz
+
+from file_lock import FileLock, file_id
+from score_store import ScoreStore, write_json_atomic
+from score_history import ScoreHistory, days_before
+from score_columns import ScoreColumns
+from state_writer import StateWriter, default_refresher
+from reminder_index import ReminderIndex, next_local_hour
+from leaderboard import Leaderboard
+
+# Per-(guild, channel) partitions of the bot's state.
+#
+# Every Globle channel gets its own score store, history database,
+# timezone list, reminder index and announcement timezone, under its own
+# data directory and behind its own locks, so one server's traffic or
+# midnight work never waits on another's. Partitions are described in a
+# small config file and opened lazily the first time they are needed.
+#
+# A partition's scores and timezone list are only changed through its
+# StateWriter, one thread that applies changes in order. Other processes
+# using the same data directory are kept consistent with file locks.
+
+# File names inside a partition's data directory
+SCORES_FILE = 'scores.json'
+SCORES_JOURNAL_FILE = 'scores.journal'
+USER_TIMEZONES_FILE = 'user_timezones.json'
+HISTORY_DB_FILE = 'globle.db'
+
+
+# Load a JSON file, or return `default` if it doesn't exist
+def load_json(path, default):
+    if os.path.exists(path):
+        with open(path, 'r') as f:
+            return json.load(f)
+    return default
+
+
+class Partition:
+    def __init__(self, guild_id, channel_id, data_dir, timezone, reminders, webhook_url=None, shared=False):
+        self.guild_id = guild_id
+        self.channel_id = channel_id
+        # Resolved now, so the files stay where they were opened if the working directory changes
+        data_dir = os.path.abspath(data_dir)
+        self.data_dir = data_dir
+        # Timezone whose midnight closes the day and dates the scores
+        self.timezone = timezone
+        self.tz = pytz.timezone(timezone)
+        self.webhook_url = webhook_url
+
+        os.makedirs(data_dir, exist_ok=True)
+        self.timezones_file = os.path.join(data_dir, USER_TIMEZONES_FILE)
+
+        # Finished days are archived to SQLite
+        self.history = ScoreHistory(os.path.join(data_dir, HISTORY_DB_FILE))
+        # Scores live in memory and are journaled to disk
+        self.scores = ScoreStore(
+            os.path.join(data_dir, SCORES_FILE),
+            os.path.join(data_dir, SCORES_JOURNAL_FILE),
+            today=self.today,
+            on_rollover=self.history.record_day,
+        )
+        # Users grouped by timezone with each zone's next reminder precomputed
+        self.reminders = ReminderIndex(reminders)
+        self._timezones_lock = FileLock(f"{self.timezones_file}.lock")
+        self._timezones_id = None
+        with self._timezones_lock.shared():
+            self._load_timezones()
+        # Applies every change to the scores and timezones, in order
+        self.writer = StateWriter(channel_id or 'default', batch=self.scores.batch)
+        # Other processes write the same files; pick up their changes while idle
+        self.shared = shared
+        if shared:
+            default_refresher.watch(self.writer, self.stale, self.refresh)
+
+    @property
+    def key(self):
+        return (self.guild_id, self.channel_id)
+
+    # Today's date in the partition's timezone
+    def today(self):
+        return datetime.datetime.now(self.tz).strftime('%Y-%m-%d')
+
+    # Next local midnight in UTC, when the day's winner is declared
+    def next_rollover(self, after):
+        return next_local_hour(self.tz, 0, after)
+
+    # Date of the day that ends at a rollover instant
+    def closing_day(self, rollover):
+        return (rollover - datetime.timedelta(seconds=1)).astimezone(self.tz).strftime('%Y-%m-%d')
+
+    # Final leaderboard of a day that has already been archived, with the
+    # recorded winner first
+    def archived_leaderboard(self, day):
+        scores = {}
+        for _, user_id, guesses in self.history.winners_between(day, day):
+            scores[user_id] = guesses
+        for user_id, guesses in self.history.day_scores(day):
+            scores.setdefault(user_id, guesses)
+        board = Leaderboard()
+        board.load(scores)
+        return board
+
+    # The store's current day, its scores and the scores of the last `days`
+    # archived days, as (day, columns, columns)
+    def score_columns(self, days):
+        current = self.scores.export()
+        today = current["date"]
+        window = self.history.score_columns(days_before(today, days), today)
+        return today, ScoreColumns.from_scores(current["scores"], today), window
+
+    # Record a score for today through the writer. The Future resolves to
+    # (recorded, number of players today).
+    def record_score(self, user_id, guesses):
+        return self.writer.submit(self._record_score, user_id, guesses)
+
+    # Archive `day`'s scores and start a new day through the writer, unless
+    # the store has moved past `day` by the time the writer gets to it
+    def reset_scores(self, day, date=None):
+        return self.writer.submit(self.scores.reset, day, date)
+
+    # Set a user's reminder timezone and save the timezone list through the writer
+    def set_user_timezone(self, user_id, zone):
+        return self.writer.submit(self._set_user_timezone, user_id, zone)
+
+    # Whether other processes have changed the partition's files since they were last read
+    def stale(self):
+        return self.scores.stale() or file_id(self.timezones_file) != self._timezones_id
+
+    # Pick up changes other processes made to the partition's files
+    def refresh(self):
+        self.scores.refresh()
+        with self._timezones_lock.shared():
+            self._load_timezones()
+
+    def close(self):
+        if self.shared:
+            default_refresher.unwatch(self.writer)
+        self.writer.close()
+        self.scores.close()
+        self.history.close()
+        self._timezones_lock.close()
+
+    def _record_score(self, user_id, guesses):
+        self.scores.ensure_today()
+        recorded = self.scores.record(user_id, guesses)
+        return recorded, len(self.scores)
+
+    def _set_user_timezone(self, user_id, zone):
+        with self._timezones_lock.exclusive():
+            # Merge into the newest list on disk so another process's changes aren't lost
+            self._load_timezones()
+            self.reminders.set_user(user_id, zone)
+            write_json_atomic(self.timezones_file, self.reminders.timezones())
+            self._timezones_id = file_id(self.timezones_file)
+
+    # Reload the timezone list if the file changed. Only users whose zone
+    # changed are touched, so reminders already scheduled stay as they are.
+    def _load_timezones(self):
+        current_id = file_id(self.timezones_file)
+        if current_id == self._timezones_id:
+            return
+        timezones = load_json(self.timezones_file, {})
+        current = self.reminders.timezones()
+        if not current:
+            self.reminders.load(timezones)
+        else:
+            for user_id in current.keys() - timezones.keys():
+                self.reminders.remove_user(user_id)
+            for user_id, zone in timezones.items():
+                if current.get(user_id) != zone:
+                    try:
+                        self.reminders.set_user(user_id, zone)
+                    except pytz.exceptions.UnknownTimeZoneError:
+                        continue
+        self._timezones_id = current_id
+
+
+class PartitionRegistry:
+    def __init__(self, data_dir, reminders, default_timezone, config_file=None, shared=False):
+        self.data_dir = data_dir
+        self.reminders = dict(reminders)
+        self.default_timezone = default_timezone
+        # Whether other processes use the same data directory
+        self.shared = shared
+        self.config_file = config_file or os.path.join(data_dir, 'partitions.json')
+        self._lock = threading.Lock()
+        # channel_id -> config dict, and channel_id -> open Partition
+        self._config = {}
+        self._open = {}
+        # Partition for messages that don't match a configured channel
+        self._default = None
+        # Called with each partition added or changed by register(), e.g. to schedule its jobs
+        self.on_register = None
+        for entry in load_json(self.config_file, []):
+            self._config[str(entry["channel_id"])] = entry
+
+    # Use a partition for the single-channel setup that predates partitioning.
+    # Its files stay where they always were; a channel_id of None catches every channel.
+    def set_default(self, data_dir, channel_id=None, guild_id=None, timezone=None, webhook_url=None):
+        self._default = Partition(
+            str(guild_id) if guild_id else None,
+            str(channel_id) if channel_id else None,
+            data_dir,
+            timezone or self.default_timezone,
+            self.reminders,
+            webhook_url,
+            self.shared,
+        )
+        return self._default
+
+    @property
+    def default(self):
+        return self._default
+
+    # Partition for a channel, falling back to the guild's only partition (unless
+    # guild_fallback is False) and then to the default partition; None if the
+    # channel isn't a Globle channel
+    def for_channel(self, guild_id, channel_id, guild_fallback=True):
+        channel_id = str(channel_id) if channel_id else None
+        guild_id = str(guild_id) if guild_id else None
+        if channel_id:
+            partition = self.get(channel_id)
+            if partition is not None:
+                return partition
+        if guild_id and guild_fallback:
+            in_guild = [channel for channel, entry in self._config.items() if entry.get("guild_id") == guild_id]
+            if self._default is not None and self._default.guild_id == guild_id:
+                in_guild.append(self._default.channel_id)
+            if len(in_guild) == 1:
+                return self.get(in_guild[0])
+        # Events without channel information belong to the default partition
+        if self._default is not None and (self._default.channel_id is None or channel_id is None):
+            return self._default
+        return None
+
+    # Open (if needed) and return the partition for a channel ID, or None
+    def get(self, channel_id):
+        channel_id = str(channel_id)
+        partition = self._open.get(channel_id)
+        if partition is not None:
+            return partition
+        if self._default is not None and self._default.channel_id == channel_id:
+            return self._default
+        entry = self._config.get(channel_id)
+        if entry is None:
+            return None
+        with self._lock:
+            partition = self._open.get(channel_id)
+            if partition is None:
+                partition = self._open[channel_id] = Partition(
+                    entry.get("guild_id"),
+                    channel_id,
+                    os.path.join(self.data_dir, str(entry.get("guild_id") or "dm"), channel_id),
+                    entry.get("timezone") or self.default_timezone,
+                    self.reminders,
+                    entry.get("webhook_url"),
+                    self.shared,
+                )
+            return partition
+
+    # Add or update a channel's partition and save the config
+    def register(self, guild_id, channel_id, timezone=None, webhook_url=None):
+        channel_id = str(channel_id)
+        timezone = timezone or self.default_timezone
+        pytz.timezone(timezone)
+        with self._lock:
+            entry = dict(self._config.get(channel_id, {}))
+            entry.update({"guild_id": str(guild_id) if guild_id else None, "channel_id": channel_id, "timezone": timezone})
+            if webhook_url:
+                entry["webhook_url"] = webhook_url
+            self._config[channel_id] = entry
+            os.makedirs(os.path.dirname(os.path.abspath(self.config_file)), exist_ok=True)
+            write_json_atomic(self.config_file, list(self._config.values()))
+            partition = self._open.get(channel_id)
+        if partition is not None:
+            # Apply the new settings to the open partition; its scores stay in memory
+            partition.timezone = timezone
+            partition.tz = pytz.timezone(timezone)
+            partition.webhook_url = entry.get("webhook_url")
+        else:
+            partition = self.get(channel_id)
+        if self.on_register is not None:
+            self.on_register(partition)
+        return partition
+
+    # Every partition, opening the configured ones that aren't open yet
+    def partitions(self):
+        result = [self.get(channel_id) for channel_id in list(self._config)]
+        if self._default is not None and self._default.channel_id not in self._config:
+            result.append(self._default)
+        return result
+
+    def close(self):
+        for partition in list(self._open.values()) + ([self._default] if self._default else []):
+            partition.close()
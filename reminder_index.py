@@ -0,0 +1,145 @@
+import heapq
+import logging
+import datetime
+import threading
+
+import pytz
+
+# Timezone-bucketed reminder index.
+#
+# Users are grouped by timezone, and each (zone, reminder) pair has its next
+# firing instant precomputed in UTC, DST transitions included, on a heap.
+# A tick only pops the pairs that are due, so its cost depends on how many
+# zones hit a reminder hour rather than on how many users are registered.
+
+# Reminders that are overdue by more than this are skipped, not sent late
+DEFAULT_GRACE = datetime.timedelta(hours=1)
+
+log = logging.getLogger(__name__)
+
+
+# Next UTC instant after `after` when it is `hour`:00 local time in `tz`
+def next_local_hour(tz, hour, after):
+    local_date = after.astimezone(tz).date()
+    for offset in range(3):
+        naive = datetime.datetime.combine(local_date + datetime.timedelta(days=offset), datetime.time(hour))
+        try:
+            local = tz.localize(naive, is_dst=None)
+        except pytz.exceptions.AmbiguousTimeError:
+            # Clocks fall back over this hour; use the first occurrence
+            local = tz.localize(naive, is_dst=True)
+        except pytz.exceptions.NonExistentTimeError:
+            # Clocks spring forward over this hour; fire when the gap ends
+            local = tz.normalize(tz.localize(naive, is_dst=False))
+        due = local.astimezone(pytz.UTC)
+        if due > after:
+            return due
+    raise ValueError(f"No {hour}:00 in {tz} after {after}")
+
+
+class ReminderIndex:
+    def __init__(self, reminders, grace=DEFAULT_GRACE, now=None):
+        # Reminder name -> local hour, e.g. {"morning": 8, "evening": 23}
+        self.reminders = dict(reminders)
+        self.grace = grace
+        self._now = now or (lambda: datetime.datetime.now(pytz.UTC))
+        self._lock = threading.Lock()
+        self._zone_users = {}
+        self._user_zone = {}
+        # Heap of (due, zone, reminder); _scheduled holds the live entry per pair
+        self._heap = []
+        self._scheduled = {}
+        # Called after users are added, moved or removed, since the next due reminder may have changed
+        self.on_change = None
+
+    def __len__(self):
+        return len(self._user_zone)
+
+    # Copy of the {user_id: timezone} mapping, for saving to disk
+    def timezones(self):
+        with self._lock:
+            return dict(self._user_zone)
+
+    # Replace the index contents with a {user_id: timezone} mapping
+    def load(self, timezones):
+        with self._lock:
+            self._zone_users = {}
+            self._user_zone = {}
+            self._heap = []
+            self._scheduled = {}
+            for user_id, zone in timezones.items():
+                try:
+                    self._add(user_id, zone)
+                except pytz.exceptions.UnknownTimeZoneError:
+                    log.warning("Unknown timezone %s for user %s", zone, user_id)
+        self._changed()
+
+    # Set or change one user's timezone
+    def set_user(self, user_id, zone):
+        with self._lock:
+            self._remove(user_id)
+            self._add(user_id, zone)
+        self._changed()
+
+    def remove_user(self, user_id):
+        with self._lock:
+            self._remove(user_id)
+        self._changed()
+
+    # Time of the next scheduled reminder in UTC, or None
+    def next_due(self):
+        with self._lock:
+            while self._heap and not self._is_live(self._heap[0]):
+                heapq.heappop(self._heap)
+            return self._heap[0][0] if self._heap else None
+
+    # Pop every reminder due at `now` and return {reminder: [user_id, ...]}
+    def due(self, now=None):
+        now = now or self._now()
+        due_users = {}
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                entry = heapq.heappop(self._heap)
+                if not self._is_live(entry):
+                    continue
+                due, zone, reminder = entry
+                if now - due <= self.grace:
+                    due_users.setdefault(reminder, []).extend(self._zone_users[zone])
+                self._schedule(zone, reminder, now)
+        return due_users
+
+    def _changed(self):
+        if self.on_change is not None:
+            self.on_change()
+
+    def _is_live(self, entry):
+        due, zone, reminder = entry
+        return self._scheduled.get((zone, reminder)) == due and zone in self._zone_users
+
+    def _add(self, user_id, zone):
+        users = self._zone_users.get(zone)
+        if users is None:
+            tz = pytz.timezone(zone)
+            users = self._zone_users[zone] = set()
+            now = self._now()
+            for reminder in self.reminders:
+                self._schedule(zone, reminder, now, tz)
+        users.add(user_id)
+        self._user_zone[user_id] = zone
+
+    def _remove(self, user_id):
+        zone = self._user_zone.pop(user_id, None)
+        if zone is None:
+            return
+        users = self._zone_users[zone]
+        users.discard(user_id)
+        if not users:
+            # Heap entries for the zone are dropped lazily when they surface
+            del self._zone_users[zone]
+            for reminder in self.reminders:
+                self._scheduled.pop((zone, reminder), None)
+
+    def _schedule(self, zone, reminder, after, tz=None):
+        due = next_local_hour(tz or pytz.timezone(zone), self.reminders[reminder], after)
+        self._scheduled[(zone, reminder)] = due
+        heapq.heappush(self._heap, (due, zone, reminder))
@@ -0,0 +1,229 @@
+import os
+import heapq
+import inspect
+import logging
+import datetime
+import itertools
+import threading
+
+import pytz
+
+from score_store import write_json_atomic
+from partitions import load_json
+from metrics import TICK_SECONDS
+
+# Deadline scheduler for the bots' timed work.
+#
+# Each job knows when it is next due; the scheduler keeps the deadlines on a
+# heap and sleeps until the earliest one (or until it is woken because a job
+# changed), instead of waking every minute and checking whether it happens to
+# be midnight. A job is rescheduled when its run finishes, so a slow run
+# never makes the next deadline slip past unnoticed, and the same job never
+# runs twice at once.
+#
+# For jobs that must not be missed, such as the midnight rollover, the last
+# completed deadline is saved to a state file. On startup any deadline missed
+# while the bot was down is run once, right away; several missed ones are
+# folded into a single catch-up run for the latest of them.
+#
+# The clock is injectable: tests can pass a fake clock and call run_pending()
+# instead of running the scheduler loop.
+
+log = logging.getLogger(__name__)
+
+
+# Current time as an aware UTC datetime
+def utc_now():
+    return datetime.datetime.now(pytz.UTC)
+
+
+class Job:
+    def __init__(self, name, next_due, run, persist):
+        self.name = name
+        # next_due(after) -> first deadline strictly after `after`, or None if there is none yet
+        self.next_due = next_due
+        # run(due) does the work; it may return an awaitable for the async runner
+        self.run = run
+        self.persist = persist
+        self.due = None
+        self.running = False
+
+
+class DeadlineScheduler:
+    def __init__(self, state_path=None, clock=utc_now):
+        self.state_path = state_path
+        self.clock = clock
+        self._lock = threading.RLock()
+        self._jobs = {}
+        # Heap of (due, seq, name); entries whose due no longer matches the job are stale
+        self._heap = []
+        self._seq = itertools.count()
+        # Job name -> ISO time of its last completed deadline
+        self._state = {}
+        if state_path:
+            os.makedirs(os.path.dirname(os.path.abspath(state_path)), exist_ok=True)
+            self._state = load_json(state_path, {})
+        self._wakeup = threading.Event()
+        self._loop = None
+        self._async_wakeup = None
+        self.stats = {'runs': 0, 'failed': 0, 'caught_up': 0}
+
+    # Add (or replace) a job. Persisted jobs catch up on a deadline missed since their last completed run.
+    def add(self, name, next_due, run, persist=False):
+        job = Job(name, next_due, run, persist)
+        now = self.clock()
+        with self._lock:
+            self._jobs[name] = job
+            last = self._last_run(name) if persist else None
+            if persist and last is None:
+                # Nothing before now is owed; remember that in case we go down before the first run
+                self._save_run(name, now)
+            due = job.next_due(last if last is not None else now)
+            if due is not None and due <= now:
+                missed = 1
+                while True:
+                    following = job.next_due(due)
+                    if following is None or following > now:
+                        break
+                    due = following
+                    missed += 1
+                self.stats['caught_up'] += 1
+                log.info("Catching up on a missed scheduled run",
+                         extra={'job': name, 'due': due.isoformat(), 'missed': missed})
+            self._push(job, due)
+        self.wake()
+        return job
+
+    def remove(self, name):
+        with self._lock:
+            self._jobs.pop(name, None)
+        self.wake()
+
+    # Recompute a job's deadline from now, e.g. after what it depends on changed
+    def reschedule(self, name):
+        with self._lock:
+            job = self._jobs.get(name)
+            if job is None or job.running:
+                return
+            self._push(job, job.next_due(self.clock()))
+        self.wake()
+
+    # Make a sleeping run loop look at the heap again
+    def wake(self):
+        self._wakeup.set()
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._async_wakeup.set)
+
+    # Earliest deadline, or None if nothing is scheduled
+    def next_deadline(self):
+        with self._lock:
+            while self._heap and not self._is_live(self._heap[0]):
+                heapq.heappop(self._heap)
+            return self._heap[0][0] if self._heap else None
+
+    # Take every job that is due, as (job, due) pairs
+    def pop_due(self):
+        now = self.clock()
+        due_jobs = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                entry = heapq.heappop(self._heap)
+                if not self._is_live(entry):
+                    continue
+                job = self._jobs[entry[2]]
+                job.due = None
+                job.running = True
+                due_jobs.append((job, entry[0]))
+        return due_jobs
+
+    # Run every due job, in this thread or on `executor`
+    def run_pending(self, executor=None):
+        for job, due in self.pop_due():
+            if executor is not None:
+                executor.submit(self._run_job, job, due)
+            else:
+                self._run_job(job, due)
+
+    # Run due jobs until `stop` is set, sleeping until the next deadline in between
+    def run_forever(self, executor=None, stop=None):
+        while stop is None or not stop.is_set():
+            self._wakeup.clear()
+            self.run_pending(executor)
+            self._wakeup.wait(self._seconds_until_next())
+
+    # Run due jobs as tasks on the running event loop, forever
+    async def run_async(self):
+        import asyncio
+        self._loop = asyncio.get_running_loop()
+        self._async_wakeup = asyncio.Event()
+        while True:
+            self._async_wakeup.clear()
+            for job, due in self.pop_due():
+                self._loop.create_task(self._run_job_async(job, due))
+            try:
+                await asyncio.wait_for(self._async_wakeup.wait(), self._seconds_until_next())
+            except asyncio.TimeoutError:
+                pass
+
+    def _seconds_until_next(self):
+        deadline = self.next_deadline()
+        if deadline is None:
+            return None
+        return max(0.0, (deadline - self.clock()).total_seconds())
+
+    def _run_job(self, job, due):
+        start = self.clock()
+        try:
+            job.run(due)
+        except Exception:
+            self._finish(job, due, start, False)
+            log.exception("Error in scheduled job", extra={'job': job.name})
+            return
+        self._finish(job, due, start, True)
+
+    async def _run_job_async(self, job, due):
+        start = self.clock()
+        try:
+            result = job.run(due)
+            if inspect.isawaitable(result):
+                await result
+        except Exception:
+            self._finish(job, due, start, False)
+            log.exception("Error in scheduled job", extra={'job': job.name})
+            return
+        self._finish(job, due, start, True)
+
+    # Record a finished run and schedule the job's next deadline
+    def _finish(self, job, due, start, ok):
+        TICK_SECONDS.observe((self.clock() - start).total_seconds())
+        with self._lock:
+            job.running = False
+            self.stats['runs' if ok else 'failed'] += 1
+            if ok and job.persist:
+                self._save_run(job.name, due)
+            if self._jobs.get(job.name) is job:
+                self._push(job, job.next_due(due))
+        self.wake()
+
+    def _push(self, job, due):
+        job.due = due
+        if due is not None:
+            heapq.heappush(self._heap, (due, next(self._seq), job.name))
+
+    def _is_live(self, entry):
+        job = self._jobs.get(entry[2])
+        return job is not None and job.due == entry[0]
+
+    def _last_run(self, name):
+        value = self._state.get(name)
+        if value is None:
+            return None
+        return datetime.datetime.fromisoformat(value)
+
+    def _save_run(self, name, when):
+        self._state[name] = when.isoformat()
+        if self.state_path:
+            try:
+                write_json_atomic(self.state_path, self._state)
+            except OSError as e:
+                log.error("Error saving scheduler state to %s: %s", self.state_path, e)
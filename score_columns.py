@@ -0,0 +1,214 @@
+import math
+import array
+import datetime
+
+# Columnar score tables for analytics.
+#
+# Scores are held as three parallel arrays instead of a dict per day: user
+# IDs as 64-bit ints, guess counts as 16-bit ints and a day index, about 12
+# bytes a score. Guess distributions, percentiles and per-user averages are
+# computed over whole columns, with NumPy when it is installed (the arrays
+# are shared with NumPy without copying) and with plain loops otherwise.
+# Both give the same results. NumPy is only imported by the first
+# aggregation, so it doesn't add to the bots' startup time.
+
+# Day index 0; days are stored as days since this date
+EPOCH = datetime.date(2000, 1, 1)
+# Largest guess count a column can hold; higher counts are capped
+MAX_GUESSES = 65535
+# Most rows in the distribution chart; wider spreads are grouped into ranges
+CHART_ROWS = 12
+# Length of the longest bar in the distribution chart
+BAR_WIDTH = 20
+# Set to False to use the pure-Python aggregations even when NumPy is installed
+USE_NUMPY = True
+
+# The numpy module once imported, or False if it isn't installed
+_numpy_module = None
+
+
+# numpy, or None to aggregate in pure Python
+def _numpy():
+    global _numpy_module
+    if not USE_NUMPY:
+        return None
+    if _numpy_module is None:
+        try:
+            import numpy
+            _numpy_module = numpy
+        except ImportError:
+            _numpy_module = False
+    return _numpy_module or None
+
+
+# Whether aggregations run with NumPy
+def using_numpy():
+    return _numpy() is not None
+
+
+# Index of a YYYY-MM-DD day
+def day_index(day):
+    return (datetime.date.fromisoformat(day) - EPOCH).days
+
+
+# YYYY-MM-DD day of an index
+def index_day(index):
+    return (EPOCH + datetime.timedelta(days=index)).isoformat()
+
+
+class ScoreColumns:
+    def __init__(self):
+        self.user_ids = array.array('q')
+        self.guesses = array.array('H')
+        self.days = array.array('H')
+
+    def __len__(self):
+        return len(self.guesses)
+
+    # Columns for one day's {user_id: guesses}
+    @classmethod
+    def from_scores(cls, scores, day):
+        columns = cls()
+        columns.user_ids.extend(int(user_id) for user_id in scores)
+        columns.guesses.extend(min(guesses, MAX_GUESSES) for guesses in scores.values())
+        columns.days.extend(array.array('H', [day_index(day)]) * len(scores))
+        return columns
+
+    # Columns for (day, user_id, guesses) rows, such as a history query
+    @classmethod
+    def from_rows(cls, rows):
+        columns = cls()
+        indexes = {}
+        for day, user_id, guesses in rows:
+            index = indexes.get(day)
+            if index is None:
+                index = indexes[day] = day_index(day)
+            columns.days.append(index)
+            columns.user_ids.append(int(user_id))
+            columns.guesses.append(min(guesses, MAX_GUESSES))
+        return columns
+
+    def append(self, day, user_id, guesses):
+        self.days.append(day_index(day))
+        self.user_ids.append(int(user_id))
+        self.guesses.append(min(guesses, MAX_GUESSES))
+
+    # Bytes held by the three columns
+    @property
+    def nbytes(self):
+        return sum(column.itemsize * len(column) for column in (self.user_ids, self.guesses, self.days))
+
+    # (guesses, number of scores) for each guess count that occurs, fewest guesses first
+    def distribution(self):
+        return distribution(self.guesses)
+
+    # Guess counts at the given percentiles (0-100)
+    def percentiles(self, qs):
+        return percentiles(self.guesses, qs)
+
+    # {user_id: average guesses} over every score in the columns
+    def user_averages(self):
+        return user_averages(self.user_ids, self.guesses)
+
+
+# (value, count) for each value that occurs in a column of small non-negative ints
+def distribution(values):
+    if not len(values):
+        return []
+    numpy = _numpy()
+    if numpy is not None:
+        counts = numpy.bincount(_vector(numpy, values))
+        found = numpy.flatnonzero(counts)
+        return list(zip(found.tolist(), counts[found].tolist()))
+    counts = {}
+    for value in values:
+        counts[value] = counts.get(value, 0) + 1
+    return sorted(counts.items())
+
+
+# Values at the given percentiles (0-100), interpolating linearly between
+# neighbouring values like numpy.percentile
+def percentiles(values, qs):
+    if not len(values):
+        return [None for _ in qs]
+    numpy = _numpy()
+    if numpy is not None:
+        return numpy.percentile(_vector(numpy, values), qs).tolist()
+    ordered = sorted(values)
+    result = []
+    for q in qs:
+        position = (len(ordered) - 1) * q / 100
+        low = math.floor(position)
+        high = min(low + 1, len(ordered) - 1)
+        result.append(ordered[low] + (ordered[high] - ordered[low]) * (position - low))
+    return result
+
+
+# {user_id: average value} for parallel user ID and value columns
+def user_averages(user_ids, values):
+    if not len(values):
+        return {}
+    numpy = _numpy()
+    if numpy is not None:
+        users, inverse = numpy.unique(_vector(numpy, user_ids), return_inverse=True)
+        totals = numpy.bincount(inverse, weights=_vector(numpy, values))
+        counts = numpy.bincount(inverse)
+        return dict(zip(users.tolist(), (totals / counts).tolist()))
+    totals = {}
+    counts = {}
+    for user_id, value in zip(user_ids, values):
+        totals[user_id] = totals.get(user_id, 0) + value
+        counts[user_id] = counts.get(user_id, 0) + 1
+    return {user_id: totals[user_id] / counts[user_id] for user_id in totals}
+
+
+# NumPy view of a column without copying it
+def _vector(numpy, values):
+    if isinstance(values, array.array):
+        return numpy.frombuffer(values, dtype=values.typecode)
+    return numpy.asarray(values)
+
+
+# A percentile or average without a trailing ".0"
+def _number(value):
+    return f"{value:.1f}".rstrip('0').rstrip('.')
+
+
+# Bar chart lines for a (guesses, count) distribution, grouping guess counts
+# into equal ranges when there are more than CHART_ROWS of them
+def chart_lines(counts):
+    lowest, highest = counts[0][0], counts[-1][0]
+    width = max(1, math.ceil((highest - lowest + 1) / CHART_ROWS))
+    rows = {}
+    for guesses, count in counts:
+        start = (guesses - 1) // width * width + 1
+        rows[start] = rows.get(start, 0) + count
+    starts = range(min(rows), max(rows) + 1, width)
+    labels = [str(start) if width == 1 else f"{start}-{start + width - 1}" for start in starts]
+    label_width = max(len(label) for label in labels)
+    most = max(rows.values())
+    lines = []
+    for start, label in zip(starts, labels):
+        count = rows.get(start, 0)
+        bar = "█" * max(1, round(count * BAR_WIDTH / most)) + " " if count else ""
+        lines.append(f"{label:>{label_width}} {bar}{count}")
+    return lines
+
+
+# Text for the !distribution reply: today's guess distribution and
+# percentiles, then the same over the last `span` archived days
+def distribution_text(day, today, window, span):
+    if len(today):
+        players = len(today)
+        median, upper, top = today.percentiles((50, 75, 90))
+        text = f"**Globle guesses for {day}** ({players} player{'s' if players != 1 else ''})\n"
+        text += "```\n" + "\n".join(chart_lines(today.distribution())) + "\n```\n"
+        text += f"Median {_number(median)}, 75th percentile {_number(upper)}, 90th percentile {_number(top)}"
+    else:
+        text = "No scores have been submitted today."
+    if len(window):
+        median, = window.percentiles((50,))
+        player_median, = percentiles(list(window.user_averages().values()), (50,))
+        text += (f"\nLast {span} days: median {_number(median)} over {len(window)} scores; "
+                 f"the median player averaged {_number(player_median)} guesses")
+    return text
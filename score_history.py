@@ -0,0 +1,392 @@
+import os
+import sys
+import json
+import sqlite3
+import datetime
+import threading
+
+from score_columns import ScoreColumns
+
+# Multi-day score history kept in SQLite.
+#
+# Each finished day is archived into a (day, user_id) keyed table, and the
+# day's winner into a separate table, so per-user and per-month lookups are
+# answered from an index instead of scanning every day.
+#
+# All-time and rolling-window aggregates (sums, counts, best score, streaks,
+# wins) are updated in the same transaction as each archived day, so stats
+# are a primary-key lookup and boards are an index walk, however long the
+# history gets. A day that closes with no scores still moves the rolling
+# windows on, so quiet channels don't keep counting days that slid out.
+
+# Rolling windows kept per user, in days
+WINDOWS = (7, 30)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS scores (
+    day TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    guesses INTEGER NOT NULL,
+    PRIMARY KEY (day, user_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_scores_user_day ON scores (user_id, day);
+CREATE INDEX IF NOT EXISTS idx_scores_day_guesses ON scores (day, guesses);
+
+CREATE TABLE IF NOT EXISTS winners (
+    day TEXT PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    guesses INTEGER NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_winners_user_day ON winners (user_id, day);
+
+CREATE TABLE IF NOT EXISTS user_stats (
+    user_id TEXT PRIMARY KEY,
+    days INTEGER NOT NULL,
+    total INTEGER NOT NULL,
+    best INTEGER NOT NULL,
+    wins INTEGER NOT NULL,
+    current_streak INTEGER NOT NULL,
+    longest_streak INTEGER NOT NULL,
+    last_day TEXT NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_user_stats_wins ON user_stats (wins);
+CREATE INDEX IF NOT EXISTS idx_user_stats_average ON user_stats ((CAST(total AS REAL) / days));
+
+CREATE TABLE IF NOT EXISTS window_stats (
+    span INTEGER NOT NULL,
+    user_id TEXT NOT NULL,
+    days INTEGER NOT NULL,
+    total INTEGER NOT NULL,
+    wins INTEGER NOT NULL,
+    PRIMARY KEY (span, user_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_window_stats_average ON window_stats (span, (CAST(total AS REAL) / days));
+
+CREATE TABLE IF NOT EXISTS stats_meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+) WITHOUT ROWID;
+"""
+
+UPSERT_USER_STATS = """
+INSERT INTO user_stats (user_id, days, total, best, wins, current_streak, longest_streak, last_day)
+VALUES (?, 1, ?, ?, 0, 1, 1, ?)
+ON CONFLICT (user_id) DO UPDATE SET
+    days = days + 1,
+    total = total + excluded.total,
+    best = MIN(best, excluded.best),
+    current_streak = CASE WHEN last_day = ? THEN current_streak + 1 ELSE 1 END,
+    longest_streak = MAX(longest_streak, CASE WHEN last_day = ? THEN current_streak + 1 ELSE 1 END),
+    last_day = excluded.last_day
+"""
+
+UPSERT_WINDOW_STATS = """
+INSERT INTO window_stats (span, user_id, days, total, wins) VALUES (?, ?, 1, ?, 0)
+ON CONFLICT (span, user_id) DO UPDATE SET days = days + 1, total = total + excluded.total
+"""
+
+
+# The day `n` days before a YYYY-MM-DD day
+def days_before(day, n):
+    return (datetime.date.fromisoformat(day) - datetime.timedelta(days=n)).isoformat()
+
+
+class ScoreHistory:
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        # Databases from before the stats tables existed get them filled once,
+        # and stats left stale by a deferred import are recomputed
+        if self._stale() or (self._through() is None and self._conn.execute("SELECT 1 FROM scores LIMIT 1").fetchone()):
+            self.rebuild_stats()
+
+    # Archive one day's scores and its winner in a single transaction. A day
+    # with no scores only moves the rolling windows on.
+    def record_day(self, day, scores):
+        if not scores:
+            self.advance(day)
+            return None
+        return self.record_days({day: scores})[day]
+
+    # Slide the rolling windows forward to end on `day`, which closed with no scores
+    def advance(self, day):
+        def slide():
+            through = self._through()
+            if through is not None and day > through:
+                self._slide_windows(through, day)
+                self._set_through(day)
+
+        with self._lock:
+            self._transaction(slide)
+
+    # Archive many days' scores and winners in a single transaction; returns {day: (winner_id, guesses)}.
+    # With merge, scores already stored for a day are kept where they are better.
+    # With defer_stats, the aggregates are marked stale instead of updated, and are
+    # recomputed by rebuild_stats(), by the next call without defer_stats, or the
+    # next time the database is opened.
+    def record_days(self, days, merge=False, defer_stats=False):
+        days = {day: [(str(user_id), int(guesses)) for user_id, guesses in scores.items()]
+                for day, scores in sorted(days.items()) if scores}
+        winners = {}
+
+        def archive():
+            through = self._through()
+            for day, rows in days.items():
+                if merge:
+                    rows = self._merge_day(day, rows)
+                # The first submitter wins ties, matching the daily announcement
+                winners[day] = min(rows, key=lambda row: row[1])
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO scores (day, user_id, guesses) VALUES (?, ?, ?)",
+                    [(day, user_id, guesses) for user_id, guesses in rows],
+                )
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO winners (day, user_id, guesses) VALUES (?, ?, ?)",
+                    (day,) + winners[day],
+                )
+                days[day] = rows
+
+            if defer_stats:
+                self._conn.execute("INSERT OR REPLACE INTO stats_meta (key, value) VALUES ('stale', '1')")
+            elif not self._stale() and (through is None or min(days) > through):
+                for day, rows in days.items():
+                    self._apply_day_stats(day, rows, winners[day][0], through)
+                    through = day
+            else:
+                # A past day was added or replaced (e.g. by a migration), or the
+                # stats are stale; recount everything
+                self._rebuild_stats()
+
+        if days:
+            with self._lock:
+                self._transaction(archive)
+        return winners
+
+    # Recompute the aggregates from every archived day
+    def rebuild_stats(self):
+        with self._lock:
+            self._transaction(self._rebuild_stats)
+
+    # A user's all-time and rolling-window stats, or None if they have no archived days.
+    # The current streak counts as broken once a day after `today`'s yesterday is missed.
+    def user_stats(self, user_id, today=None):
+        user_id = str(user_id)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT days, total, best, wins, current_streak, longest_streak, last_day FROM user_stats WHERE user_id = ?",
+                (user_id,),
+            ).fetchone()
+            if row is None:
+                return None
+            windows = {span: (days, total, wins) for span, days, total, wins in self._conn.execute(
+                "SELECT span, days, total, wins FROM window_stats WHERE user_id = ?", (user_id,)
+            )}
+        days, total, best, wins, current_streak, longest_streak, last_day = row
+        if today is not None and last_day < days_before(today, 1):
+            current_streak = 0
+        return {
+            "days": days,
+            "average": total / days,
+            "best": best,
+            "wins": wins,
+            "current_streak": current_streak,
+            "longest_streak": longest_streak,
+            "last_day": last_day,
+            "windows": {
+                span: {"days": w_days, "average": w_total / w_days, "wins": w_wins}
+                for span, (w_days, w_total, w_wins) in windows.items()
+            },
+        }
+
+    # Top k users by all-time wins as (user_id, wins, days)
+    def top_wins(self, k=10):
+        with self._lock:
+            return self._conn.execute(
+                "SELECT user_id, wins, days FROM user_stats WHERE wins > 0 ORDER BY wins DESC LIMIT ?",
+                (k,),
+            ).fetchall()
+
+    # Top k users by all-time average as (user_id, average, days), with at least min_days played
+    def top_average(self, k=10, min_days=1):
+        with self._lock:
+            return self._conn.execute(
+                "SELECT user_id, CAST(total AS REAL) / days, days FROM user_stats WHERE days >= ? "
+                "ORDER BY CAST(total AS REAL) / days LIMIT ?",
+                (min_days, k),
+            ).fetchall()
+
+    # Top k users of a rolling window by average as (user_id, average, days, wins),
+    # with at least min_days played in the window
+    def window_board(self, span, k=10, min_days=1):
+        with self._lock:
+            return self._conn.execute(
+                "SELECT user_id, CAST(total AS REAL) / days, days, wins FROM window_stats WHERE span = ? AND days >= ? "
+                "ORDER BY CAST(total AS REAL) / days LIMIT ?",
+                (span, min_days, k),
+            ).fetchall()
+
+    # Run fn inside a transaction; the caller holds the lock
+    def _transaction(self, fn):
+        self._conn.execute("BEGIN")
+        try:
+            fn()
+            self._conn.execute("COMMIT")
+        except Exception:
+            self._conn.execute("ROLLBACK")
+            raise
+
+    # Combine new rows for a day with what is stored: the stored winner first, so it
+    # keeps ties, then users in their stored or submission order, each with their best score
+    def _merge_day(self, day, rows):
+        stored = dict(self._conn.execute("SELECT user_id, guesses FROM scores WHERE day = ?", (day,)).fetchall())
+        if not stored:
+            return rows
+        winner = self._conn.execute("SELECT user_id FROM winners WHERE day = ?", (day,)).fetchone()
+        merged = {}
+        if winner and winner[0] in stored:
+            merged[winner[0]] = stored[winner[0]]
+        merged.update(stored)
+        for user_id, guesses in rows:
+            if user_id not in merged or guesses < merged[user_id]:
+                # Reached after everything already stored, so it loses ties to them
+                merged.pop(user_id, None)
+                merged[user_id] = guesses
+        return list(merged.items())
+
+    # Last day folded into the stats tables
+    def _through(self):
+        row = self._conn.execute("SELECT value FROM stats_meta WHERE key = 'through'").fetchone()
+        return row[0] if row else None
+
+    # Fold one day (later than `through`) into the all-time and window stats
+    def _apply_day_stats(self, day, rows, winner_id, through):
+        yesterday = days_before(day, 1)
+        self._conn.executemany(
+            UPSERT_USER_STATS,
+            [(user_id, guesses, guesses, day, yesterday, yesterday) for user_id, guesses in rows],
+        )
+        self._conn.execute("UPDATE user_stats SET wins = wins + 1 WHERE user_id = ?", (winner_id,))
+
+        for span in WINDOWS:
+            self._conn.executemany(UPSERT_WINDOW_STATS, [(span, user_id, guesses) for user_id, guesses in rows])
+            self._conn.execute("UPDATE window_stats SET wins = wins + 1 WHERE span = ? AND user_id = ?", (span, winner_id))
+        if through is not None:
+            self._slide_windows(through, day)
+        self._set_through(day)
+
+    # Take out of the window stats the days that slid out of each window as
+    # it moved from ending on `through` to ending on `day`
+    def _slide_windows(self, through, day):
+        for span in WINDOWS:
+            leaving = (days_before(through, span), days_before(day, span))
+            self._conn.executemany(
+                "UPDATE window_stats SET days = days - 1, total = total - ? WHERE span = ? AND user_id = ?",
+                [(guesses, span, user_id) for user_id, guesses in self._conn.execute(
+                    "SELECT user_id, guesses FROM scores WHERE day > ? AND day <= ?", leaving
+                ).fetchall()],
+            )
+            self._conn.executemany(
+                "UPDATE window_stats SET wins = wins - 1 WHERE span = ? AND user_id = ?",
+                [(span, user_id) for user_id, in self._conn.execute(
+                    "SELECT user_id FROM winners WHERE day > ? AND day <= ?", leaving
+                ).fetchall()],
+            )
+            self._conn.execute("DELETE FROM window_stats WHERE span = ? AND days <= 0", (span,))
+
+    # Whether archived days were left out of the stats tables (see record_days)
+    def _stale(self):
+        return self._conn.execute("SELECT 1 FROM stats_meta WHERE key = 'stale'").fetchone() is not None
+
+    def _set_through(self, day):
+        self._conn.execute("INSERT OR REPLACE INTO stats_meta (key, value) VALUES ('through', ?)", (day,))
+
+    # Recompute every aggregate from the archived days, oldest first. Windows
+    # already moved past the last archived day are moved there again.
+    def _rebuild_stats(self):
+        advanced = self._through()
+        self._conn.execute("DELETE FROM user_stats")
+        self._conn.execute("DELETE FROM window_stats")
+        self._conn.execute("DELETE FROM stats_meta WHERE key IN ('through', 'stale')")
+        through = None
+        winners = dict(self._conn.execute("SELECT day, user_id FROM winners").fetchall())
+        for day, in self._conn.execute("SELECT DISTINCT day FROM scores ORDER BY day").fetchall():
+            rows = self._conn.execute("SELECT user_id, guesses FROM scores WHERE day = ?", (day,)).fetchall()
+            self._apply_day_stats(day, rows, winners.get(day), through)
+            through = day
+        if through is not None and advanced is not None and advanced > through:
+            self._slide_windows(through, advanced)
+            self._set_through(advanced)
+
+    # A user's most recent days as (day, guesses), newest first
+    def user_history(self, user_id, limit=30):
+        with self._lock:
+            return self._conn.execute(
+                "SELECT day, guesses FROM scores WHERE user_id = ? ORDER BY day DESC LIMIT ?",
+                (str(user_id), limit),
+            ).fetchall()
+
+    # All scores for one day as (user_id, guesses), best first
+    def day_scores(self, day):
+        with self._lock:
+            return self._conn.execute(
+                "SELECT user_id, guesses FROM scores WHERE day = ? ORDER BY guesses",
+                (day,),
+            ).fetchall()
+
+    # Scores between two days inclusive as columns, for analytics
+    def score_columns(self, start_day, end_day):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT day, user_id, guesses FROM scores WHERE day BETWEEN ? AND ?",
+                (start_day, end_day),
+            )
+            return ScoreColumns.from_rows(rows)
+
+    # Winners between two days inclusive as (day, user_id, guesses)
+    def winners_between(self, start_day, end_day):
+        with self._lock:
+            return self._conn.execute(
+                "SELECT day, user_id, guesses FROM winners WHERE day BETWEEN ? AND ? ORDER BY day",
+                (start_day, end_day),
+            ).fetchall()
+
+    # Days a user has won between two days inclusive
+    def user_wins(self, user_id, start_day='0000-00-00', end_day='9999-99-99'):
+        with self._lock:
+            return self._conn.execute(
+                "SELECT day, guesses FROM winners WHERE user_id = ? AND day BETWEEN ? AND ? ORDER BY day",
+                (str(user_id), start_day, end_day),
+            ).fetchall()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+# Import existing scores.json-style files into the history database
+def migrate_json(history, paths):
+    imported = 0
+    for path in paths:
+        if not os.path.exists(path):
+            print(f"Skipping {path}: file not found")
+            continue
+        with open(path, 'r') as f:
+            data = json.load(f)
+        if data.get("scores"):
+            history.record_day(data["date"], data["scores"])
+            imported += len(data["scores"])
+            print(f"Imported {len(data['scores'])} scores for {data['date']} from {path}")
+    return imported
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 3 or sys.argv[1] != 'migrate':
+        print("Usage: python score_history.py migrate <history.db> [scores.json ...]")
+        sys.exit(1)
+    history = ScoreHistory(sys.argv[2])
+    migrate_json(history, sys.argv[3:] or ['scores.json'])
+    history.close()
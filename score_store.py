@@ -0,0 +1,372 @@
+import os
+import json
+import logging
+import threading
+import time
+import datetime
+import contextlib
+
+from leaderboard import Leaderboard
+from file_lock import FileLock, file_id
+
+log = logging.getLogger(__name__)
+
+# Resident score store shared by both frontends.
+#
+# Reads are served from memory. Every change is appended to a journal file
+# that is fsynced in batches, and the journal is periodically compacted into
+# a snapshot that keeps the old {"date", "scores"} shape of scores.json.
+# On startup the snapshot is loaded and the journal replayed on top of it.
+#
+# Several processes may share the files. Changes are made under an exclusive
+# advisory lock on a .lock file next to the snapshot, after first catching up
+# with whatever other processes appended to the journal since this one last
+# looked. A compaction by another process shows up as a new snapshot file, and
+# is followed by a full reload.
+
+# Default number of journal entries between fsyncs
+FSYNC_BATCH = 32
+# Default seconds between background fsyncs of a dirty journal
+FSYNC_INTERVAL = 1.0
+# Default number of journal entries before the journal is compacted
+SNAPSHOT_EVERY = 1000
+
+
+# Today's date in local time, used when no date function is given
+def _local_today():
+    return datetime.datetime.now().strftime('%Y-%m-%d')
+
+
+# Background thread that fsyncs dirty journals at most once per interval.
+# One flusher is shared by every store, so many partitions don't mean many threads.
+class JournalFlusher:
+    def __init__(self, interval=FSYNC_INTERVAL):
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._dirty = set()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    # Schedule a store's journal for the next background fsync
+    def mark(self, store):
+        with self._lock:
+            self._dirty.add(store)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='journal-flusher')
+                self._thread.daemon = True
+                self._thread.start()
+        self._wakeup.set()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait()
+            self._wakeup.clear()
+            # Let more appends accumulate so they share one fsync
+            time.sleep(self.interval)
+            with self._lock:
+                dirty, self._dirty = self._dirty, set()
+            for store in dirty:
+                try:
+                    store.sync()
+                except (OSError, ValueError) as e:
+                    log.error("Error syncing score journal %s: %s", store.journal_path, e)
+
+
+default_flusher = JournalFlusher()
+
+
+# Write a JSON document so that readers see either the old or the new file
+def write_json_atomic(path, data):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class ScoreStore:
+    def __init__(self, snapshot_path, journal_path=None, today=None,
+                 fsync_batch=FSYNC_BATCH, snapshot_every=SNAPSHOT_EVERY,
+                 on_rollover=None, flusher=None, lock_path=None):
+        self.snapshot_path = snapshot_path
+        self.journal_path = journal_path or f"{snapshot_path}.journal"
+        self.file_lock = FileLock(lock_path or f"{snapshot_path}.lock")
+        self.today = today or _local_today
+        self.fsync_batch = fsync_batch
+        self.flusher = flusher or default_flusher
+        self.snapshot_every = snapshot_every
+        # Called with (date, scores) for a finished day before it is cleared
+        self.on_rollover = on_rollover
+
+        self._lock = threading.RLock()
+        self._date = self.today()
+        self._scores = {}
+        # Ranked view of today's scores, updated as scores are recorded
+        self.leaderboard = Leaderboard()
+        self._journal = None
+        self._journal_entries = 0
+        self._unsynced = 0
+        self._closed = False
+        # Nesting depth of batch()
+        self._depth = 0
+        # Identity of the snapshot file last loaded or written, and how much of
+        # the journal after it has been applied
+        self._snapshot_id = None
+        self._journal_offset = 0
+        # The journal ends in a partial line left by a writer that crashed
+        self._torn_tail = False
+
+        with self._lock, self.file_lock.exclusive():
+            self._recover()
+
+    # Current day the store is collecting scores for
+    @property
+    def date(self):
+        return self._date
+
+    def __len__(self):
+        return len(self._scores)
+
+    def __contains__(self, user_id):
+        return user_id in self._scores
+
+    # Best score for a user today, or None
+    def get(self, user_id):
+        return self._scores.get(user_id)
+
+    # Copy of today's scores keyed by user ID
+    def scores(self):
+        with self._lock:
+            return dict(self._scores)
+
+    # Export the store in the scores.json shape
+    def export(self):
+        with self._lock:
+            return {"date": self._date, "scores": dict(self._scores)}
+
+    # Hold the store for a series of changes. Other processes are locked out,
+    # the store first catches up with their changes, and the journal is
+    # written out once when the outermost batch ends.
+    @contextlib.contextmanager
+    def batch(self):
+        with self._lock, self.file_lock.exclusive():
+            self._depth += 1
+            try:
+                if self._depth == 1:
+                    self._catch_up()
+                yield self
+            finally:
+                self._depth -= 1
+                if self._depth == 0:
+                    self._flush_journal()
+
+    # Catch up with changes other processes made to the shared files
+    def refresh(self):
+        with self._lock, self.file_lock.shared():
+            self._catch_up()
+
+    # Whether another process has changed the files since this one last read
+    # or wrote them. Doesn't take the lock, so the answer is only a hint.
+    def stale(self):
+        if file_id(self.snapshot_path) != self._snapshot_id:
+            return True
+        try:
+            return os.path.getsize(self.journal_path) != self._journal_offset
+        except FileNotFoundError:
+            return self._journal_offset != 0
+
+    # Replace the whole store with data in the scores.json shape
+    def import_scores(self, data):
+        with self.batch():
+            self._date = data.get("date") or self.today()
+            self._scores = {str(user_id): int(guesses) for user_id, guesses in data.get("scores", {}).items()}
+            self.leaderboard.load(self._scores)
+            self._compact()
+
+    # Start a new day if the date has moved on. Returns True on rollover.
+    # The store never goes back to an earlier day, e.g. for a process whose
+    # days end at a different midnight.
+    def ensure_today(self):
+        today = self.today()
+        if today <= self._date:
+            return False
+        with self.batch():
+            if today <= self._date:
+                return False
+            self._apply_reset(today)
+            self._append({"op": "reset", "date": today})
+            return True
+
+    # Record a score if it beats the user's previous one. Returns True if stored.
+    def record(self, user_id, guesses):
+        with self.batch():
+            existing = self._scores.get(user_id)
+            if existing is not None and guesses >= existing:
+                return False
+            self._set(user_id, guesses)
+            self._append({"op": "set", "user": user_id, "guesses": guesses})
+            return True
+
+    # Archive `day` and start the given day (today by default). Does nothing
+    # if the store has already moved past `day`, e.g. because a score posted
+    # after midnight rolled it over first. Returns True if the store was reset.
+    def reset(self, day, date=None):
+        with self.batch():
+            if self._date > day:
+                return False
+            self._apply_reset(date or self.today())
+            self._compact()
+            return True
+
+    # Force pending journal entries to disk
+    def sync(self):
+        with self._lock:
+            self._sync_journal()
+
+    # Flush the journal and write a final snapshot
+    def close(self):
+        with self.batch():
+            if self._closed:
+                return
+            self._compact()
+            if self._journal:
+                self._journal.close()
+                self._journal = None
+            self._closed = True
+        self.file_lock.close()
+
+    def _apply_reset(self, date):
+        # Called for a day without scores too, so the history knows it is over
+        if self.on_rollover and (self._scores or date != self._date):
+            try:
+                self.on_rollover(self._date, dict(self._scores))
+            except Exception:
+                log.exception("Error archiving scores for %s", self._date)
+        self._date = date
+        self._scores = {}
+        self.leaderboard.clear()
+
+    # Move the user to the end so dict order is the order scores were reached,
+    # which is how the leaderboard breaks ties
+    def _set(self, user_id, guesses):
+        self._scores.pop(user_id, None)
+        self._scores[user_id] = guesses
+        self.leaderboard.update(user_id, guesses)
+
+    def _apply(self, entry):
+        op = entry.get("op")
+        if op == "set":
+            self._set(str(entry["user"]), int(entry["guesses"]))
+        elif op == "reset":
+            self._date = entry["date"]
+            self._scores = {}
+            self.leaderboard.clear()
+
+    # Load the last snapshot and replay the journal written after it
+    def _load(self):
+        self._snapshot_id = file_id(self.snapshot_path)
+        if self._snapshot_id is not None:
+            try:
+                with open(self.snapshot_path, 'r') as f:
+                    data = json.load(f)
+                self._date = data.get("date") or self._date
+                self._scores = {str(user_id): int(guesses) for user_id, guesses in data.get("scores", {}).items()}
+            except (OSError, ValueError) as e:
+                log.error("Error loading score snapshot %s: %s", self.snapshot_path, e)
+        self.leaderboard.load(self._scores)
+        self._journal_offset = 0
+        self._replay()
+
+    # Apply the complete journal lines written since the last replay
+    def _replay(self):
+        try:
+            with open(self.journal_path, 'rb') as f:
+                f.seek(self._journal_offset)
+                data = f.read()
+        except FileNotFoundError:
+            return
+        end = data.rfind(b"\n") + 1
+        for line in data[:end].splitlines():
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # A line torn by a crash mid-append; everything around it is intact
+                log.warning("Skipping unreadable score journal entry in %s", self.journal_path)
+                continue
+            self._apply(entry)
+        self._journal_offset += end
+        self._torn_tail = end < len(data)
+
+    # Bring memory up to date with the files. Called with the file lock held.
+    def _catch_up(self):
+        if file_id(self.snapshot_path) != self._snapshot_id:
+            # Another process compacted: its snapshot replaces everything we had
+            self._load()
+            return
+        try:
+            size = os.path.getsize(self.journal_path)
+        except FileNotFoundError:
+            size = 0
+        if size < self._journal_offset:
+            self._load()
+        elif size > self._journal_offset:
+            self._replay()
+
+    def _recover(self):
+        self._load()
+        # Fold whatever was recovered into a fresh snapshot and start an empty journal
+        self._compact()
+
+    def _open_journal(self, truncate):
+        if self._journal:
+            self._journal.close()
+        # Always in append mode: other processes may truncate and append to the same file
+        self._journal = open(self.journal_path, 'ab')
+        if truncate:
+            self._journal.truncate(0)
+        self._journal_entries = 0
+        self._unsynced = 0
+
+    def _append(self, entry):
+        if self._journal is None:
+            self._open_journal(truncate=False)
+        if self._torn_tail:
+            # End the partial line so our entry starts on a line of its own
+            self._journal.write(b"\n")
+            self._torn_tail = False
+        self._journal.write(json.dumps(entry, separators=(',', ':')).encode() + b"\n")
+        self._journal_entries += 1
+        self._unsynced += 1
+        if self._journal_entries >= self.snapshot_every:
+            self._compact()
+        elif self._unsynced >= self.fsync_batch:
+            self._sync_journal()
+        else:
+            self.flusher.mark(self)
+
+    def _sync_journal(self):
+        if self._journal and self._unsynced:
+            self._journal.flush()
+            os.fsync(self._journal.fileno())
+            self._unsynced = 0
+
+    # Hand buffered entries to the OS, where other processes can read them.
+    # Called with the file lock held, after catching up, so everything in
+    # the journal has been applied. (The file's own position only moves when
+    # this process writes, so it can lag behind other processes' appends.)
+    def _flush_journal(self):
+        if self._journal:
+            self._journal.flush()
+            self._journal_offset = os.fstat(self._journal.fileno()).st_size
+
+    # Write a snapshot of the current state and truncate the journal.
+    # The snapshot is replaced atomically before the journal is cleared, and
+    # replaying an old journal over a newer snapshot yields the same state.
+    def _compact(self):
+        write_json_atomic(self.snapshot_path, {"date": self._date, "scores": self._scores})
+        self._snapshot_id = file_id(self.snapshot_path)
+        self._open_journal(truncate=True)
+        self._journal_offset = 0
+        self._torn_tail = False
+
@@ -0,0 +1,197 @@
+import time
+import heapq
+import asyncio
+import logging
+import itertools
+
+from metrics import Counter, Gauge, Histogram
+
+# Priority-aware outbound message scheduler for the gateway bot.
+#
+# Every channel message goes through a per-channel queue ordered by priority
+# class and then by arrival, drained by one task per busy channel at the rate
+# a token bucket allows. A winner announcement queued behind a burst of
+# confirmations goes out next, and the bucket keeps the bot under Discord's
+# per-channel limit instead of running into 429s. When a channel's queue is
+# full, a new confirmation or reminder is merged into one of the same class
+# that is already waiting, or the lowest-priority waiting message is dropped.
+# Announcements and command replies are never dropped.
+
+# Priority classes, most urgent first
+ANNOUNCEMENT = 0
+REPLY = 1
+ACK = 2
+REMINDER = 3
+PRIORITY_NAMES = {ANNOUNCEMENT: 'announcement', REPLY: 'reply', ACK: 'ack', REMINDER: 'reminder'}
+# Classes that may be merged or dropped when a queue is saturated
+DROPPABLE = (ACK, REMINDER)
+
+# Default per-channel token bucket: messages per second and burst size
+# (Discord allows 5 messages per 5 seconds in a channel)
+CHANNEL_RATE = 1.0
+CHANNEL_BURST = 5
+# Default messages waiting per channel before merging and dropping start
+MAX_QUEUE = 50
+# Discord's message length limit
+MAX_MESSAGE_LENGTH = 2000
+
+log = logging.getLogger(__name__)
+
+QUEUE_DEPTH = Gauge('globle_outbound_queue_depth', 'Channel messages waiting to be sent, by priority', ['priority'])
+QUEUE_WAIT = Histogram('globle_outbound_wait_seconds', 'Time channel messages spent queued, by priority', ['priority'])
+SHED = Counter('globle_outbound_shed_total', 'Queued channel messages merged or dropped under load', ['priority', 'action'])
+
+
+class _Outgoing:
+    def __init__(self, priority, seq, target, content, future, enqueued):
+        self.priority = priority
+        self.seq = seq
+        self.target = target
+        self.content = content
+        self.future = future
+        self.enqueued = enqueued
+
+    def __lt__(self, other):
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class _Channel:
+    def __init__(self, burst, now):
+        self.heap = []
+        self.tokens = float(burst)
+        self.updated = now
+        self.worker = None
+
+
+class SendScheduler:
+    def __init__(self, send, rate=CHANNEL_RATE, burst=CHANNEL_BURST, max_queue=MAX_QUEUE, clock=time.monotonic):
+        # Coroutine function doing the actual send(target, content)
+        self._send = send
+        self.rate = rate
+        self.burst = burst
+        self.max_queue = max_queue
+        self.clock = clock
+        self._channels = {}
+        self._seq = itertools.count()
+        self.stats = {'sent': 0, 'merged': 0, 'dropped': 0}
+        for priority, name in PRIORITY_NAMES.items():
+            QUEUE_DEPTH.labels(name).set_function(lambda priority=priority: self.pending(priority))
+
+    # Queue a message and wait until it is sent. Returns False if it was
+    # dropped to make room; send errors are raised to the caller.
+    async def send(self, target, content, priority=REPLY):
+        return await self.submit(target, content, priority)
+
+    # Queue a message; returns a future for the send. Must be called on the event loop.
+    def submit(self, target, content, priority=REPLY):
+        loop = asyncio.get_running_loop()
+        key = _channel_key(target)
+        channel = self._channels.get(key)
+        if channel is None:
+            channel = self._channels[key] = _Channel(self.burst, self.clock())
+        future = loop.create_future()
+        if len(channel.heap) >= self.max_queue and not self._make_room(channel, target, content, priority, future):
+            return future
+        heapq.heappush(channel.heap, _Outgoing(priority, next(self._seq), target, content, future, self.clock()))
+        if channel.worker is None:
+            channel.worker = loop.create_task(self._run(channel))
+        return future
+
+    # Messages waiting, in one priority class or in all of them
+    def pending(self, priority=None):
+        return sum(1 for channel in list(self._channels.values()) for item in channel.heap
+                   if priority is None or item.priority == priority)
+
+    # Wait until every queued message has been sent, or the timeout passes
+    async def drain(self, timeout=None):
+        workers = [channel.worker for channel in self._channels.values() if channel.worker is not None]
+        if workers:
+            await asyncio.wait(workers, timeout=timeout)
+
+    # Handle a full queue. Returns True if the new message should still be queued.
+    def _make_room(self, channel, target, content, priority, future):
+        name = PRIORITY_NAMES[priority]
+        if priority in DROPPABLE:
+            # Fold it into the newest waiting message of the same class if it fits
+            same = [item for item in channel.heap if item.priority == priority]
+            if same:
+                item = max(same, key=lambda item: item.seq)
+                merged = f"{item.content}\n{content}"
+                if len(merged) <= MAX_MESSAGE_LENGTH:
+                    item.content = merged
+                    _chain(item.future, future)
+                    self.stats['merged'] += 1
+                    SHED.labels(name, 'merged').inc()
+                    return False
+        # Drop the least urgent waiting message if it ranks below the new one;
+        # otherwise the new one is dropped, unless it may not be
+        droppable = [item for item in channel.heap if item.priority in DROPPABLE]
+        victim = max(droppable, key=lambda item: (item.priority, item.seq), default=None)
+        if victim is not None and victim.priority >= priority:
+            channel.heap.remove(victim)
+            heapq.heapify(channel.heap)
+            self._drop(victim.future, victim.priority)
+            return True
+        if priority in DROPPABLE:
+            self._drop(future, priority)
+            return False
+        return True
+
+    def _drop(self, future, priority):
+        if not future.done():
+            future.set_result(False)
+        self.stats['dropped'] += 1
+        SHED.labels(PRIORITY_NAMES[priority], 'dropped').inc()
+
+    async def _run(self, channel):
+        try:
+            while channel.heap:
+                delay = self._take_token(channel)
+                if delay > 0:
+                    # Something more urgent may arrive meanwhile; pick after the wait
+                    await asyncio.sleep(delay)
+                    continue
+                item = heapq.heappop(channel.heap)
+                QUEUE_WAIT.labels(PRIORITY_NAMES[item.priority]).observe(self.clock() - item.enqueued)
+                try:
+                    await self._send(item.target, item.content)
+                except Exception as e:
+                    if not item.future.done():
+                        item.future.set_exception(e)
+                    continue
+                self.stats['sent'] += 1
+                if not item.future.done():
+                    item.future.set_result(True)
+        finally:
+            # The channel's bucket is kept, so a new burst can't start from a full one
+            channel.worker = None
+
+    # Take a token from the channel's bucket; returns seconds to wait if there is none
+    def _take_token(self, channel):
+        now = self.clock()
+        channel.tokens = min(self.burst, channel.tokens + (now - channel.updated) * self.rate)
+        channel.updated = now
+        if channel.tokens >= 1:
+            channel.tokens -= 1
+            return 0
+        return (1 - channel.tokens) / self.rate
+
+
+# Commands reply through their context; queue by the channel underneath
+def _channel_key(target):
+    channel = getattr(target, 'channel', target)
+    return getattr(channel, 'id', id(channel))
+
+
+# Resolve `future` the same way as `source`
+def _chain(source, future):
+    def copy(source):
+        if future.done():
+            return
+        if source.cancelled():
+            future.cancel()
+        elif source.exception() is not None:
+            future.set_exception(source.exception())
+        else:
+            future.set_result(source.result())
+    source.add_done_callback(copy)
@@ -0,0 +1,165 @@
+import time
+import queue
+import logging
+import threading
+import contextlib
+from concurrent.futures import Future
+
+# Single writer for a partition's state.
+#
+# Every change to a partition's scores and timezone list is submitted here as
+# a function and applied by one owner thread, in the order it was submitted.
+# Whatever has queued up by the time the thread wakes is applied as one
+# batch: the store is locked against other processes and caught up once, and
+# the journal is written once, however many changes the batch holds. Callers
+# get a Future that resolves after the batch is written. Reads don't go
+# through the writer; they are served from memory.
+#
+# When other processes share the files, one refresher thread for all
+# partitions checks about once a second which of them changed on disk, and
+# has those partitions' writers pick up the changes. Idle partitions whose
+# files haven't changed cost a stat call, not a thread waking up.
+
+# Default seconds between checks for other processes' changes
+REFRESH_INTERVAL = 1.0
+# Most changes applied in one batch
+MAX_BATCH = 256
+
+log = logging.getLogger(__name__)
+
+
+class StateWriter:
+    def __init__(self, name, batch=None, max_batch=MAX_BATCH):
+        self.name = name
+        # Context manager factory held around each batch
+        self._batch = batch or contextlib.nullcontext
+        self.max_batch = max_batch
+        self._queue = queue.SimpleQueue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._closed = False
+        self.stats = {'batches': 0, 'changes': 0}
+
+    # Queue fn(*args) to run on the writer thread; returns a Future for its result
+    def submit(self, fn, *args):
+        future = Future()
+        if threading.current_thread() is self._thread:
+            # A change made from inside another change is applied in place
+            future.set_running_or_notify_cancel()
+            _resolve(future, *_call(fn, args))
+            return future
+        with self._lock:
+            if self._closed:
+                raise RuntimeError(f"State writer {self.name} is closed")
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=f"state-writer-{self.name}")
+                self._thread.daemon = True
+                self._thread.start()
+        self._queue.put((future, fn, args))
+        return future
+
+    # Run fn(*args) on the writer thread and wait for its result
+    def call(self, fn, *args):
+        return self.submit(fn, *args).result()
+
+    # Apply everything already queued, then stop the thread
+    def close(self):
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            thread = self._thread
+        if thread is not None and thread is not threading.current_thread():
+            self._queue.put(None)
+            thread.join()
+
+    def _run(self):
+        while True:
+            items = [self._queue.get()]
+            while len(items) < self.max_batch:
+                try:
+                    items.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            changes = [item for item in items if item is not None]
+            if changes:
+                self._apply(changes)
+            if len(changes) < len(items):
+                return
+
+    def _apply(self, changes):
+        results = []
+        try:
+            with self._batch():
+                for future, fn, args in changes:
+                    if future.set_running_or_notify_cancel():
+                        results.append((future,) + _call(fn, args))
+        except Exception as e:
+            # Taking the lock or writing the journal failed, so nothing in the batch is safely stored
+            log.exception("Error applying state changes for %s", self.name)
+            results = [(future, None, e) for future, fn, args in changes if future.running()]
+        self.stats['batches'] += 1
+        self.stats['changes'] += len(changes)
+        # Results are handed out only once the batch is written
+        for future, result, error in results:
+            _resolve(future, result, error)
+
+
+class StateRefresher:
+    def __init__(self, interval=REFRESH_INTERVAL):
+        self.interval = interval
+        self._lock = threading.Lock()
+        # writer -> (stale, refresh, Future of the refresh last submitted)
+        self._watched = {}
+        self._thread = None
+
+    # Check stale() every interval and, when it returns True, run refresh()
+    # on the writer
+    def watch(self, writer, stale, refresh):
+        with self._lock:
+            self._watched[writer] = (stale, refresh, None)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='state-refresher')
+                self._thread.daemon = True
+                self._thread.start()
+
+    def unwatch(self, writer):
+        with self._lock:
+            self._watched.pop(writer, None)
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                watched = list(self._watched.items())
+            for writer, (stale, refresh, pending) in watched:
+                # A refresh still waiting behind other changes covers this one
+                if pending is not None and not pending.done():
+                    continue
+                try:
+                    if not stale():
+                        continue
+                    future = writer.submit(refresh)
+                except Exception:
+                    log.exception("Error refreshing state for %s", writer.name)
+                    continue
+                with self._lock:
+                    if writer in self._watched:
+                        self._watched[writer] = (stale, refresh, future)
+
+
+default_refresher = StateRefresher()
+
+
+def _call(fn, args):
+    try:
+        return fn(*args), None
+    except Exception as e:
+        return None, e
+
+
+def _resolve(future, result, error):
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result(result)
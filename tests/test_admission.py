@@ -0,0 +1,128 @@
+# Ingress budgets of the webhook bot.
+#
+#   python -m pytest tests
+import os
+import sys
+import atexit
+import sqlite3
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from admission import IngressBudget, Overloaded, classify, SCORE, COMMAND, READ
+from dedupe import MessageDedupe
+
+
+@pytest.fixture(scope='module')
+def webhook(tmp_path_factory):
+    # Nothing is sent, but the webhook URL points nowhere in case it were
+    directory = tmp_path_factory.mktemp('webhook')
+    saved = dict(os.environ)
+    os.environ.update({
+        'DISCORD_WEBHOOK_URL': 'http://127.0.0.1:9/webhook',
+        'GLOBLE_CHANNEL_ID': '',
+        'DATA_DIR': str(directory / 'data'),
+        'DEDUPE_FILE': '',
+        'SCHEDULE_FILE': '',
+        'WEBHOOK_SHARED': '0',
+    })
+    cwd = os.getcwd()
+    os.chdir(directory)
+    try:
+        import globle_webhook
+    finally:
+        os.chdir(cwd)
+        os.environ.clear()
+        os.environ.update(saved)
+    yield globle_webhook
+    atexit.unregister(globle_webhook.partitions.close)
+    globle_webhook.partitions.close()
+
+
+def score_event(message_id):
+    return {'type': 0, 'message': {'id': message_id, 'content': "Globle: I got it in 4 guesses",
+                                   'author': {'id': '1', 'username': 'user1'}}}
+
+
+def test_failed_dedupe_check_gives_the_slot_back(webhook, monkeypatch):
+    def seen(message_id):
+        raise sqlite3.OperationalError("database is locked")
+
+    monkeypatch.setattr(webhook, 'ingress', IngressBudget({SCORE: 1, COMMAND: 1, READ: 1}))
+    monkeypatch.setattr(webhook.message_dedupe, 'seen', seen)
+    for _ in range(3):
+        with pytest.raises(sqlite3.OperationalError):
+            webhook.read_event(score_event('1'))
+    assert webhook.ingress.depth(SCORE) == 0
+
+
+def test_shed_event_is_handled_when_redelivered(webhook, monkeypatch):
+    monkeypatch.setattr(webhook, 'ingress', IngressBudget({SCORE: 1, COMMAND: 1, READ: 1}))
+    monkeypatch.setattr(webhook, 'message_dedupe', MessageDedupe())
+    response, message = webhook.read_event(score_event('2'))
+    assert message is not None
+
+    # Accepted, but the server couldn't queue it
+    webhook.shed_message(message)
+    assert webhook.ingress.depth(SCORE) == 0
+    response, message = webhook.read_event(score_event('2'))
+    assert message is not None
+    webhook.ingress.release(SCORE)
+    assert webhook.read_event(score_event('2')) == ({'status': 'duplicate'}, None)
+
+
+def test_slots_are_taken_and_given_back():
+    ingress = IngressBudget({SCORE: 2, COMMAND: 1, READ: 1})
+    ingress.admit(SCORE)
+    ingress.admit(SCORE)
+    with pytest.raises(Overloaded) as shed:
+        ingress.admit(SCORE)
+    assert shed.value.kind == SCORE
+    assert ingress.depth(SCORE) == 2
+    assert ingress.stats == {'admitted': 2, 'shed': 1}
+
+    ingress.release(SCORE)
+    ingress.admit(SCORE)
+    assert ingress.depth(SCORE) == 2
+    ingress.release(SCORE)
+    ingress.release(SCORE)
+    assert ingress.depth(SCORE) == 0
+
+
+def test_classes_have_separate_budgets():
+    ingress = IngressBudget({SCORE: 1, COMMAND: 1, READ: 1})
+    ingress.admit(classify("Globle: I got it in 4 guesses"))
+    with pytest.raises(Overloaded):
+        ingress.admit(SCORE)
+
+    # Scores over budget don't hold up commands or reads
+    ingress.admit(classify("!timezone UTC"))
+    ingress.admit(classify("!leaderboard"))
+    assert [ingress.depth(kind) for kind in (SCORE, COMMAND, READ)] == [1, 1, 1]
+
+
+def test_retry_after_follows_how_fast_the_class_drains():
+    ingress = IngressBudget({SCORE: 8, COMMAND: 1, READ: 1}, concurrency=2)
+    for _ in range(8):
+        ingress.admit(SCORE)
+    # Nothing has been timed yet: the shortest wait
+    with pytest.raises(Overloaded) as shed:
+        ingress.admit(SCORE)
+    assert shed.value.retry_after == 1
+
+    # A slow event moves the average to 0.1 * 40 = 4s, so the eight ahead
+    # take 8 * 4 / 2 = 16s across the two workers
+    ingress.release(SCORE, seconds=40)
+    ingress.admit(SCORE)
+    with pytest.raises(Overloaded) as shed:
+        ingress.admit(SCORE)
+    assert shed.value.retry_after == 16
+
+    # ...and never more than a minute
+    ingress.release(SCORE, seconds=10000)
+    ingress.admit(SCORE)
+    with pytest.raises(Overloaded) as shed:
+        ingress.admit(SCORE)
+    assert shed.value.retry_after == 60
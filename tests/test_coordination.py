@@ -0,0 +1,98 @@
+# Leader lease and shared dedupe of the webhook workers.
+#
+#   python -m pytest tests
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from coordination import CoordinationStore, LeaderLease, LeaseLost, SharedDedupe
+
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = CoordinationStore(str(tmp_path / 'workers.db'))
+    yield store
+    store.close()
+
+
+def test_lease_goes_to_one_worker_at_a_time(store, clock):
+    first = LeaderLease(store, 'scheduler', owner='a', ttl=15, clock=clock)
+    second = LeaderLease(store, 'scheduler', owner='b', ttl=15, clock=clock)
+    assert first.acquire()
+    assert not second.acquire()
+    first.confirm(first.term)
+
+    clock.now += 16
+    assert second.acquire()
+    assert second.term == first.term + 1
+    assert not first.held()
+
+
+def test_job_is_fenced_once_its_term_is_over(store, clock):
+    first = LeaderLease(store, 'scheduler', owner='a', ttl=15, clock=clock)
+    second = LeaderLease(store, 'scheduler', owner='b', ttl=15, clock=clock)
+    assert first.acquire()
+    term = first.term
+
+    # The leader stalls; another worker takes over and the first renews too late
+    clock.now += 16
+    assert second.acquire()
+    assert not first.acquire()
+    with pytest.raises(LeaseLost):
+        first.confirm(term)
+
+    # A later term of the same worker doesn't revive jobs started in an earlier one
+    clock.now += 16
+    assert first.acquire()
+    with pytest.raises(LeaseLost):
+        first.confirm(term)
+    first.confirm(first.term)
+
+
+def test_workers_share_handled_ids(tmp_path, store, clock):
+    other = CoordinationStore(str(tmp_path / 'workers.db'))
+    first = SharedDedupe(store, ttl=60, clock=clock)
+    second = SharedDedupe(other, ttl=60, clock=clock)
+    assert not first.seen('1')
+    assert second.seen('1')
+    assert second.stats['duplicates'] == 1
+
+    # Shed by the worker that claimed it, so the redelivery goes to whoever gets it
+    first.forget('1')
+    assert not second.seen('1')
+    assert first.seen('1')
+    other.close()
+
+
+def test_shared_ids_expire_after_the_ttl(store, clock):
+    dedupe = SharedDedupe(store, ttl=60, clock=clock)
+    dedupe.seen('1')
+    clock.now += 30
+    dedupe.seen('2')
+    clock.now += 30
+    assert len(dedupe) == 1
+    assert not dedupe.seen('1')
+
+    # Expired rows are claimed again in place, and pruned by save()
+    clock.now += 30
+    dedupe.save()
+    assert dedupe.stats['expired'] == 1
+    assert len(dedupe) == 1
+    assert store.scalar("SELECT COUNT(*) FROM seen_messages", ()) == 1
@@ -0,0 +1,73 @@
+# Expiry, eviction and persistence of the handled message IDs.
+#
+#   python -m pytest tests
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from dedupe import MessageDedupe, ENTRY_BYTES
+
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def test_ids_expire_after_the_ttl():
+    clock = FakeClock()
+    dedupe = MessageDedupe(ttl=60, clock=clock)
+    assert not dedupe.seen('1')
+    clock.now += 59
+    assert dedupe.seen('1')
+    assert dedupe.stats['duplicates'] == 1
+
+    # Redelivered after it was forgotten: handled again, and remembered anew
+    clock.now += 1
+    assert not dedupe.seen('1')
+    assert dedupe.seen('1')
+
+
+def test_oldest_ids_are_evicted_over_the_budget():
+    clock = FakeClock()
+    dedupe = MessageDedupe(ttl=60, memory_budget=3 * ENTRY_BYTES, clock=clock)
+    for message_id in ('1', '2', '3', '4'):
+        clock.now += 1
+        assert not dedupe.seen(message_id)
+    assert len(dedupe) == 3
+    assert dedupe.stats['evicted'] == 1
+
+    assert not dedupe.seen('1')
+    assert dedupe.seen('3')
+    assert dedupe.seen('4')
+
+
+def test_forgotten_ids_are_handled_again():
+    dedupe = MessageDedupe(clock=FakeClock())
+    assert not dedupe.seen('1')
+    # The event was shed after its ID was remembered; Discord will redeliver it
+    dedupe.forget('1')
+    dedupe.forget('2')
+    assert not dedupe.seen('1')
+    assert dedupe.seen('1')
+
+
+def test_ids_survive_a_restart(tmp_path):
+    path = str(tmp_path / 'seen_messages.json')
+    clock = FakeClock()
+    dedupe = MessageDedupe(ttl=60, path=path, clock=clock)
+    dedupe.seen('1')
+    clock.now += 30
+    dedupe.seen('2')
+    dedupe.close()
+
+    # By now the first ID has expired and isn't loaded
+    clock.now += 40
+    dedupe = MessageDedupe(ttl=60, path=path, clock=clock)
+    assert len(dedupe) == 1
+    assert dedupe.seen('2')
+    assert not dedupe.seen('1')
@@ -0,0 +1,187 @@
+# Scheduler tests, run against a fake clock.
+#
+#   python -m pytest tests
+import os
+import sys
+import atexit
+import asyncio
+import datetime
+
+import pytest
+import pytz
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from scheduler import DeadlineScheduler
+from partitions import Partition
+
+
+class FakeClock:
+    def __init__(self, now):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, **kwargs):
+        self.now += datetime.timedelta(**kwargs)
+
+
+def at(day, hour=0, minute=0):
+    return pytz.UTC.localize(datetime.datetime.strptime(day, '%Y-%m-%d').replace(hour=hour, minute=minute))
+
+
+# Run due jobs the way the gateway bot does, waiting for each to finish.
+# Returns how many ran; stops early if jobs keep falling due.
+def run_due(scheduler, rounds=10):
+    async def run():
+        count = 0
+        for _ in range(rounds):
+            jobs = scheduler.pop_due()
+            if not jobs:
+                break
+            for job, due in jobs:
+                await scheduler._run_job_async(job, due)
+            count += len(jobs)
+        return count
+    return asyncio.run(run())
+
+
+@pytest.fixture(scope='module')
+def bot(tmp_path_factory):
+    # The bot opens its default channel's files in the working directory
+    directory = tmp_path_factory.mktemp('bot')
+    os.environ.update({
+        'GLOBLE_CHANNEL_ID': '0',
+        'DATA_DIR': str(directory / 'data'),
+        'DEDUPE_FILE': '',
+        'SCHEDULE_FILE': '',
+    })
+    cwd = os.getcwd()
+    os.chdir(directory)
+    try:
+        import bot
+    finally:
+        os.chdir(cwd)
+    yield bot
+    # Close now rather than at exit
+    atexit.unregister(bot.partitions.close)
+    bot.partitions.close()
+
+
+@pytest.fixture
+def clock():
+    return FakeClock(at('2026-10-17', 6))
+
+
+# A channel in UTC whose scores and reminders follow the fake clock
+@pytest.fixture
+def partition(tmp_path, clock):
+    partition = Partition(None, None, str(tmp_path), 'UTC', {"morning": 8, "evening": 21})
+    partition.scores.today = lambda: clock().astimezone(partition.tz).strftime('%Y-%m-%d')
+    partition.scores.import_scores({'date': '2026-10-17', 'scores': {}})
+    partition.reminders._now = clock
+    yield partition
+    partition.close()
+
+
+@pytest.fixture
+def scheduler(bot, clock, monkeypatch):
+    scheduler = DeadlineScheduler(clock=clock)
+    monkeypatch.setattr(bot, 'scheduler', scheduler)
+    return scheduler
+
+
+def test_missed_deadlines_run_once_after_restart(tmp_path, clock):
+    state = str(tmp_path / 'schedule.json')
+    runs = []
+
+    def add(scheduler):
+        scheduler.add('rollover', lambda after: at(after.strftime('%Y-%m-%d')) + datetime.timedelta(days=1),
+                      runs.append, persist=True)
+
+    scheduler = DeadlineScheduler(state, clock=clock)
+    add(scheduler)
+    clock.advance(days=1)
+    scheduler.run_pending()
+    assert runs == [at('2026-10-18')]
+
+    # Down for two and a half days: the missed midnights fold into one run
+    clock.advance(days=2, hours=12)
+    scheduler = DeadlineScheduler(state, clock=clock)
+    add(scheduler)
+    assert scheduler.stats['caught_up'] == 1
+    scheduler.run_pending()
+    assert runs == [at('2026-10-18'), at('2026-10-20')]
+    assert scheduler.next_deadline() == at('2026-10-21')
+
+    # A restart after the catch-up owes nothing
+    scheduler = DeadlineScheduler(state, clock=clock)
+    add(scheduler)
+    scheduler.run_pending()
+    assert len(runs) == 2
+
+
+def test_reminders_without_a_channel_move_on(bot, scheduler, partition, clock):
+    partition.set_user_timezone('1', 'UTC').result()
+    bot.schedule_partition(partition)
+    assert scheduler.next_deadline() == at('2026-10-17', 8)
+
+    clock.advance(hours=2, seconds=30)
+    assert bot.partition_channel(partition) is None
+    assert run_due(scheduler) == 1
+    assert scheduler.next_deadline() == at('2026-10-17', 21)
+
+
+def test_score_during_announcement_is_kept(bot, scheduler, partition, clock, monkeypatch):
+    partition.record_score('1', 3).result()
+    bot.schedule_partition(partition)
+    sent = []
+
+    # A score posted just after midnight, while the winner is being announced
+    async def send(channel, content, priority=None):
+        sent.append(content)
+        if len(sent) == 1:
+            await asyncio.wrap_future(partition.record_score('2', 5))
+
+    monkeypatch.setattr(bot, 'partition_channel', lambda partition: object())
+    monkeypatch.setattr(bot, 'send', send)
+    clock.advance(hours=18)
+    run_due(scheduler)
+
+    assert "<@1>" in sent[0]
+    assert partition.history.day_scores('2026-10-17') == [('1', 3)]
+    assert partition.scores.date == '2026-10-18'
+    assert partition.scores.scores() == {'2': 5}
+    assert partition.history.day_scores('2026-10-18') == []
+
+
+def test_rollover_resets_scores(bot, scheduler, partition, clock, monkeypatch):
+    partition.record_score('1', 3).result()
+    bot.schedule_partition(partition)
+    monkeypatch.setattr(bot, 'partition_channel', lambda partition: None)
+    clock.advance(hours=18)
+    run_due(scheduler)
+
+    assert partition.history.day_scores('2026-10-17') == [('1', 3)]
+    assert partition.scores.date == '2026-10-18'
+    assert len(partition.scores) == 0
+
+
+def test_channels_set_up_later_are_scheduled(bot, scheduler, clock, monkeypatch):
+    monkeypatch.setattr(bot.partitions, 'on_register', None)
+
+    async def run():
+        task = asyncio.ensure_future(bot.schedule_daily_tasks())
+        await asyncio.sleep(0)
+        # 06:00 UTC is 15:00 in Tokyo, so the new channel's midnight comes first
+        bot.partitions.register('5', '6', 'Asia/Tokyo')
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+    asyncio.run(run())
+    assert scheduler._jobs['rollover:6'].due == at('2026-10-17', 15)
@@ -0,0 +1,62 @@
+# Rolling-window stats in the score history.
+#
+#   python -m pytest tests
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from score_history import ScoreHistory
+
+
+def test_quiet_days_move_windows_on(tmp_path):
+    history = ScoreHistory(str(tmp_path / 'history.db'))
+    history.record_day('2026-10-01', {'1': 3, '2': 4})
+    history.record_day('2026-10-02', {'1': 5})
+    for day in range(3, 9):
+        history.record_day(f'2026-10-0{day}', {})
+
+    # The week ending 10-08 starts on 10-02
+    assert history.window_board(7) == [('1', 5.0, 1, 1)]
+    assert history.user_stats('2')['windows'] == {30: {'days': 1, 'average': 4.0, 'wins': 0}}
+
+    history.record_day('2026-10-09', {})
+    assert history.window_board(7) == []
+    assert len(history.window_board(30)) == 2
+    history.close()
+
+
+def test_rebuild_keeps_windows_moved_on(tmp_path):
+    history = ScoreHistory(str(tmp_path / 'history.db'))
+    history.record_day('2026-10-01', {'1': 3})
+    history.record_day('2026-10-09', {})
+    history.rebuild_stats()
+    assert history.window_board(7) == []
+    assert history.window_board(30) == [('1', 3.0, 1, 1)]
+
+    history.record_day('2026-10-10', {'2': 4})
+    assert history.window_board(7) == [('2', 4.0, 1, 1)]
+    history.close()
+
+
+def test_stats_left_stale_by_an_import_are_recounted(tmp_path):
+    path = str(tmp_path / 'history.db')
+    history = ScoreHistory(path)
+    history.record_day('2026-10-05', {'1': 3})
+    history.record_days({'2026-10-01': {'2': 2}, '2026-10-02': {'2': 4}}, defer_stats=True)
+    assert history.user_stats('2') is None
+
+    # A live rollover during the import counts the imported days too
+    history.record_day('2026-10-06', {'1': 5})
+    assert history.user_stats('2')['days'] == 2
+    assert history.user_stats('1')['average'] == 4.0
+
+    # ...and one that happens before a crash leaves them to the next open
+    history.record_days({'2026-10-03': {'2': 6}}, defer_stats=True)
+    history.advance('2026-10-07')
+    history.close()
+    history = ScoreHistory(path)
+    assert history.user_stats('2')['average'] == 4.0
+    assert history.window_board(7) == [('1', 4.0, 2, 2), ('2', 4.0, 3, 3)]
+    history.close()
@@ -0,0 +1,93 @@
+# Journal recovery and multi-process sharing of the score store.
+#
+#   python -m pytest tests
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from score_store import ScoreStore
+
+
+class FakeDay:
+    def __init__(self, day):
+        self.day = day
+
+    def __call__(self):
+        return self.day
+
+
+@pytest.fixture
+def day():
+    return FakeDay('2026-10-17')
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / 'scores.json')
+
+
+def test_torn_journal_tail_is_skipped_and_closed(path, day):
+    store = ScoreStore(path, today=day, fsync_batch=1)
+    store.record('1', 4)
+    # Another process crashed halfway through an append
+    with open(store.journal_path, 'ab') as f:
+        f.write(b'{"op":"set","us')
+
+    store.record('2', 5)
+    with open(store.journal_path, 'rb') as f:
+        assert f.read().endswith(b'{"op":"set","us\n{"op":"set","user":"2","guesses":5}\n')
+
+    reopened = ScoreStore(path, today=day)
+    assert reopened.scores() == {'1': 4, '2': 5}
+    reopened.close()
+    store.close()
+
+
+def test_store_reloads_after_another_compacts(path, day):
+    first = ScoreStore(path, today=day)
+    second = ScoreStore(path, today=day, snapshot_every=2)
+    first.record('1', 4)
+    second.record('2', 5)
+    # The second store's journal fills up and is compacted into a new snapshot
+    second.record('3', 6)
+    assert os.path.getsize(second.journal_path) == 0
+
+    # The first store notices the new snapshot and reloads instead of replaying from its old offset
+    assert first.stale()
+    first.record('4', 3)
+    assert first.scores() == {'1': 4, '2': 5, '3': 6, '4': 3}
+    second.refresh()
+    assert second.scores() == first.scores()
+    first.close()
+    second.close()
+
+    reopened = ScoreStore(path, today=day)
+    assert reopened.scores() == {'1': 4, '2': 5, '3': 6, '4': 3}
+    reopened.close()
+
+
+def test_late_reset_does_not_roll_back(path, day):
+    archived = []
+    scheduled = ScoreStore(path, today=day, on_rollover=lambda date, scores: archived.append((date, scores)))
+    scheduled.record('1', 4)
+
+    # Another process takes a score just after midnight, before the midnight job runs
+    day.day = '2026-10-18'
+    other = ScoreStore(path, today=day, on_rollover=lambda date, scores: archived.append((date, scores)))
+    other.ensure_today()
+    other.record('2', 5)
+
+    assert not scheduled.reset('2026-10-17')
+    assert scheduled.date == '2026-10-18'
+    assert scheduled.scores() == {'2': 5}
+    assert archived == [('2026-10-17', {'1': 4})]
+
+    # ...and a store that rolled over itself doesn't go back either
+    assert not other.reset('2026-10-17')
+    assert other.scores() == {'2': 5}
+    scheduled.close()
+    other.close()
@@ -0,0 +1,150 @@
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+
+# Display-name resolver for the gateway bot.
+#
+# Names come from the guild's member cache when possible, then from a
+# TTL+LRU cache of names we have already seen or fetched. Whatever is left
+# is fetched from the REST API concurrently, bounded by a semaphore so a
+# big leaderboard can't burn through the rate limit in one go.
+#
+# In the lean member caching mode the library keeps no members at all, and
+# this cache is the only place players' names are kept. Missing members are
+# then requested from the guild over the gateway, up to 100 per request,
+# which returns their server nicknames and spares the REST rate limit.
+
+# Default seconds a cached name stays valid
+NAME_TTL = 6 * 60 * 60
+# Default maximum number of cached names
+MAX_NAMES = 5000
+# Default number of concurrent fetch_user calls
+FETCH_CONCURRENCY = 5
+# Most user IDs Discord accepts in one guild member request
+QUERY_BATCH = 100
+
+log = logging.getLogger(__name__)
+
+
+class UserResolver:
+    def __init__(self, bot, ttl=NAME_TTL, max_size=MAX_NAMES, concurrency=FETCH_CONCURRENCY,
+                 query_members=False, clock=time.monotonic):
+        self.bot = bot
+        self.ttl = ttl
+        self.max_size = max_size
+        self.concurrency = concurrency
+        # Ask the guild for members missing from the caches before fetching users
+        self.query_members = query_members
+        self.clock = clock
+        # user_id (str) -> (display name, expiry)
+        self._names = OrderedDict()
+        self._semaphore = None
+
+        self.stats = {'member_hits': 0, 'cache_hits': 0, 'queries': 0, 'fetches': 0, 'fetch_errors': 0}
+
+    def __len__(self):
+        return len(self._names)
+
+    # Cache the name of a user or member we have just seen
+    def remember(self, user):
+        self._store(str(user.id), user.display_name)
+
+    # Cached name for a user, or None if missing or expired
+    def cached(self, user_id):
+        entry = self._names.get(user_id)
+        if entry is None:
+            return None
+        name, expires = entry
+        if expires < self.clock():
+            del self._names[user_id]
+            return None
+        self._names.move_to_end(user_id)
+        return name
+
+    # Resolve one user's display name
+    async def display_name(self, user_id, guild=None):
+        names = await self.display_names([user_id], guild)
+        return names[str(user_id)]
+
+    # Resolve display names for many users; returns {user_id: name}
+    async def display_names(self, user_ids, guild=None):
+        names = {}
+        missing = []
+        for user_id in user_ids:
+            user_id = str(user_id)
+            if user_id in names:
+                continue
+            member = guild.get_member(int(user_id)) if guild else None
+            if member is not None:
+                self.stats['member_hits'] += 1
+                names[user_id] = member.display_name
+                continue
+            name = self.cached(user_id)
+            if name is None:
+                user = self.bot.get_user(int(user_id))
+                if user is not None:
+                    name = user.display_name
+                    self._store(user_id, name)
+            if name is not None:
+                self.stats['cache_hits'] += 1
+                names[user_id] = name
+            else:
+                missing.append(user_id)
+
+        if missing and guild is not None and self.query_members:
+            found = await self._query(guild, missing)
+            names.update(found)
+            missing = [user_id for user_id in missing if user_id not in found]
+        if missing:
+            fetched = await asyncio.gather(*(self._fetch(user_id) for user_id in missing))
+            names.update(zip(missing, fetched))
+        return names
+
+    # Load the names of members we expect to need (e.g. today's players) into
+    # the cache, skipping those already there
+    async def warm(self, guild, user_ids):
+        missing = [str(user_id) for user_id in user_ids if self.cached(str(user_id)) is None]
+        if missing:
+            await self._query(guild, missing[:self.max_size])
+
+    # Request members from the guild over the gateway; returns {user_id: name}
+    async def _query(self, guild, user_ids):
+        names = {}
+        for start in range(0, len(user_ids), QUERY_BATCH):
+            batch = user_ids[start:start + QUERY_BATCH]
+            self.stats['queries'] += 1
+            try:
+                members = await guild.query_members(user_ids=[int(user_id) for user_id in batch],
+                                                    limit=len(batch), cache=False)
+            except Exception as e:
+                log.warning("Error querying guild members: %s", e, extra={'guild_id': guild.id})
+                continue
+            for member in members:
+                self.remember(member)
+                names[str(member.id)] = member.display_name
+        return names
+
+    async def _fetch(self, user_id):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        async with self._semaphore:
+            # Another caller may have fetched it while we waited
+            name = self.cached(user_id)
+            if name is not None:
+                return name
+            self.stats['fetches'] += 1
+            try:
+                user = await self.bot.fetch_user(int(user_id))
+            except Exception as e:
+                self.stats['fetch_errors'] += 1
+                log.warning("Error fetching user %s: %s", user_id, e)
+                return f"User {user_id}"
+            self._store(user_id, user.display_name)
+            return user.display_name
+
+    def _store(self, user_id, name):
+        self._names[user_id] = (name, self.clock() + self.ttl)
+        self._names.move_to_end(user_id)
+        while len(self._names) > self.max_size:
+            self._names.popitem(last=False)
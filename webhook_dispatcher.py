@@ -0,0 +1,266 @@
+import time
+import queue
+import random
+import logging
+import threading
+from urllib.parse import urlsplit
+from concurrent.futures import Future
+
+from metrics import SENDS, SEND_SECONDS, RATE_LIMITED, RETRIES
+
+# Outbound Discord webhook dispatcher.
+#
+# Callers enqueue a payload and return immediately. A single background
+# worker drains the queue in order over one keep-alive session, waits out
+# Discord's per-route rate-limit buckets before sending, honours 429
+# Retry-After, and retries transient failures with exponential backoff.
+#
+# requests is one of the slowest imports at startup, so it is only imported
+# when the first dispatcher is created.
+
+# Default maximum number of payloads waiting to be sent
+MAX_QUEUE = 1000
+# Default attempts per payload before it is dropped
+MAX_ATTEMPTS = 5
+# Base delay for exponential backoff on transient errors, in seconds
+BACKOFF_BASE = 0.5
+# Upper bound on a single backoff delay, in seconds
+BACKOFF_MAX = 30.0
+# HTTP timeout for one request, in seconds
+REQUEST_TIMEOUT = 10
+# Rate-limit buckets kept before those already reset are dropped; every
+# interaction's webhook is a route of its own
+MAX_BUCKETS = 1000
+
+log = logging.getLogger(__name__)
+
+
+# State of one Discord rate-limit bucket
+class RateLimitBucket:
+    def __init__(self):
+        self.remaining = None
+        self.reset_at = 0.0
+
+    # Seconds to wait before this bucket allows another request
+    def delay(self, now):
+        if self.remaining == 0 and self.reset_at > now:
+            return self.reset_at - now
+        return 0.0
+
+    def update(self, headers, now):
+        remaining = headers.get('X-RateLimit-Remaining')
+        reset_after = headers.get('X-RateLimit-Reset-After')
+        if remaining is not None:
+            self.remaining = int(remaining)
+        if reset_after is not None:
+            self.reset_at = now + float(reset_after)
+
+
+class WebhookDispatcher:
+    def __init__(self, url, max_queue=MAX_QUEUE, max_attempts=MAX_ATTEMPTS,
+                 timeout=REQUEST_TIMEOUT, session=None, clock=time.monotonic, sleep=time.sleep):
+        self.url = url
+        self.max_attempts = max_attempts
+        self.timeout = timeout
+        if session is None:
+            import requests
+            session = requests.Session()
+        self.session = session
+        self.clock = clock
+        self.sleep = sleep
+
+        self._queue = queue.Queue(maxsize=max_queue)
+        # Route -> bucket ID announced by Discord, and bucket ID -> state
+        self._route_buckets = {}
+        self._buckets = {}
+        self._global_reset_at = 0.0
+        self._worker = None
+        self._lock = threading.Lock()
+
+        self.stats = {
+            'enqueued': 0,
+            'dropped': 0,
+            'sent': 0,
+            'failed': 0,
+            'retries': 0,
+            'rate_limited': 0,
+        }
+
+    # Start the background worker if it isn't running yet
+    def start(self):
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name='webhook-dispatcher')
+                self._worker.daemon = True
+                self._worker.start()
+
+    # Queue a payload for delivery. Returns False if it was dropped.
+    def send(self, payload, url=None, method='POST'):
+        return self._enqueue(payload, url, method, None)
+
+    # Queue a payload; returns a Future that resolves to True once it is
+    # delivered, or False if it was dropped or given up on
+    def submit(self, payload, url=None, method='POST'):
+        future = Future()
+        if not self._enqueue(payload, url, method, future):
+            future.set_result(False)
+        return future
+
+    def _enqueue(self, payload, url, method, future):
+        if not (url or self.url):
+            log.error("Discord webhook URL not set")
+            return False
+        self.start()
+        try:
+            self._queue.put_nowait((url or self.url, method, payload, future))
+        except queue.Full:
+            self.stats['dropped'] += 1
+            SENDS.labels('dropped').inc()
+            log.warning("Outbound queue is full, dropping message", extra={'queue_size': self._queue.maxsize})
+            return False
+        self.stats['enqueued'] += 1
+        return True
+
+    # Number of payloads waiting to be sent
+    def pending(self):
+        return self._queue.qsize()
+
+    # Block until everything queued so far has been sent or given up on
+    def flush(self, timeout=None):
+        deadline = None if timeout is None else self.clock() + timeout
+        while self._queue.unfinished_tasks:
+            if deadline is not None and self.clock() >= deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    # Drain the queue and stop the worker. Each step waits at most `timeout`
+    # seconds; if the queue is still full, the worker is left to end with the
+    # process rather than hold up exit.
+    def stop(self, timeout=5.0):
+        self.flush(timeout)
+        if self._worker is not None:
+            try:
+                self._queue.put((None, None, None, None), timeout=timeout)
+            except queue.Full:
+                log.warning("Outbound queue still full, not waiting for the dispatcher to stop",
+                            extra={'pending': self._queue.qsize()})
+                return
+            self._worker.join(timeout)
+
+    def _run(self):
+        while True:
+            url, method, payload, future = self._queue.get()
+            delivered = False
+            try:
+                if url is None:
+                    return
+                delivered = self._deliver(url, payload, method)
+            except Exception as e:
+                self.stats['failed'] += 1
+                SENDS.labels('failed').inc()
+                log.exception("Error sending message")
+            finally:
+                if future is not None:
+                    future.set_result(delivered)
+                self._queue.task_done()
+
+    # Route key used to look up a rate-limit bucket: method plus webhook path
+    @staticmethod
+    def _route(url, method='POST'):
+        return method + ' ' + urlsplit(url).path
+
+    def _bucket(self, route):
+        bucket_id = self._route_buckets.get(route, route)
+        bucket = self._buckets.get(bucket_id)
+        if bucket is None:
+            bucket = self._buckets[bucket_id] = RateLimitBucket()
+        return bucket
+
+    # Forget buckets that have already reset once there are too many; a
+    # route seen again starts over with a fresh bucket
+    def _prune(self, now):
+        if len(self._buckets) <= MAX_BUCKETS:
+            return
+        expired = {bucket_id for bucket_id, bucket in self._buckets.items() if bucket.reset_at <= now}
+        self._buckets = {bucket_id: bucket for bucket_id, bucket in self._buckets.items() if bucket_id not in expired}
+        self._route_buckets = {route: bucket_id for route, bucket_id in self._route_buckets.items()
+                               if bucket_id not in expired}
+
+    def _deliver(self, url, payload, method='POST'):
+        import requests
+        route = self._route(url, method)
+        for attempt in range(self.max_attempts):
+            if attempt:
+                self.stats['retries'] += 1
+                RETRIES.inc()
+
+            # Wait out a global or per-bucket limit before spending a request
+            now = self.clock()
+            delay = max(self._global_reset_at - now, self._bucket(route).delay(now))
+            if delay > 0:
+                self.sleep(delay)
+
+            try:
+                with SEND_SECONDS.time():
+                    response = self.session.request(method, url, json=payload, timeout=self.timeout)
+            except requests.RequestException as e:
+                log.warning("Error sending message: %s", e, extra={'attempt': attempt + 1})
+                self.sleep(self._backoff(attempt))
+                continue
+
+            now = self.clock()
+            bucket_id = response.headers.get('X-RateLimit-Bucket')
+            if bucket_id:
+                self._route_buckets[route] = bucket_id
+            self._bucket(route).update(response.headers, now)
+            self._prune(now)
+
+            if response.status_code == 429:
+                self.stats['rate_limited'] += 1
+                RATE_LIMITED.inc()
+                retry_after = self._retry_after(response)
+                if response.headers.get('X-RateLimit-Global') == 'true':
+                    self._global_reset_at = now + retry_after
+                else:
+                    bucket = self._bucket(route)
+                    bucket.remaining = 0
+                    bucket.reset_at = now + retry_after
+                continue
+
+            if response.status_code >= 500:
+                log.warning("Error sending message: HTTP %s", response.status_code, extra={'attempt': attempt + 1})
+                self.sleep(self._backoff(attempt))
+                continue
+
+            if response.status_code >= 400:
+                # Client errors won't succeed on retry
+                self.stats['failed'] += 1
+                SENDS.labels('failed').inc()
+                log.error("Error sending message: HTTP %s", response.status_code, extra={'response': response.text})
+                return False
+
+            self.stats['sent'] += 1
+            SENDS.labels('sent').inc()
+            return True
+
+        self.stats['failed'] += 1
+        SENDS.labels('failed').inc()
+        log.error("Error sending message: giving up after %d attempts", self.max_attempts)
+        return False
+
+    # Seconds Discord asked us to wait, from the header or the JSON body
+    @staticmethod
+    def _retry_after(response):
+        value = response.headers.get('Retry-After')
+        if value is not None:
+            return float(value)
+        try:
+            return float(response.json().get('retry_after', 1.0))
+        except ValueError:
+            return 1.0
+
+    @staticmethod
+    def _backoff(attempt):
+        delay = min(BACKOFF_MAX, BACKOFF_BASE * (2 ** attempt))
+        return delay * (0.5 + random.random() / 2)
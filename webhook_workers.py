@@ -0,0 +1,138 @@
+import os
+import sys
+import time
+import signal
+import socket
+import logging
+import subprocess
+
+from dotenv import load_dotenv
+
+from logs import setup_logging
+
+# Runs the webhook bot as several worker processes on one port.
+#
+# The supervisor binds the port once and starts WEBHOOK_PROCESSES copies of
+# globle_webhook.py that all accept connections on the inherited socket, so
+# events are spread over the workers by the kernel. The workers share the
+# data directory: scores and timezones through their locked files, handled
+# message IDs and the scheduler's leader lease through a SQLite database
+# (see coordination.py). Whichever worker holds the lease runs the midnight
+# rollover and the reminders; if it dies, another takes over once the lease
+# expires, and the supervisor starts a replacement.
+#
+#   WEBHOOK_PROCESSES=4 python webhook_workers.py
+#
+# Sockets are passed by file descriptor, so this needs a Unix-like system.
+
+load_dotenv()
+PORT = int(os.getenv('PORT', os.getenv('REPLIT_PORT', os.getenv('SERVER_PORT', '8080'))))
+# Number of worker processes
+WEBHOOK_PROCESSES = int(os.getenv('WEBHOOK_PROCESSES', '1'))
+
+# Seconds to wait before restarting a worker that exited, doubling up to
+# RESTART_DELAY_MAX while it keeps exiting within RESTART_RESET seconds
+RESTART_DELAY = 1
+RESTART_DELAY_MAX = 30
+RESTART_RESET = 60
+# Seconds workers get to finish up after being asked to stop
+STOP_TIMEOUT = 15
+
+WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'globle_webhook.py')
+
+log = logging.getLogger('webhook_workers')
+
+
+class Worker:
+    def __init__(self, index):
+        self.index = index
+        self.process = None
+        self.started = 0
+        self.starts = 0
+        self.delay = RESTART_DELAY
+        # Time the worker may be restarted, after it exited
+        self.restart_at = None
+
+
+# Start (or restart) a worker on the listening socket. Only the first worker's
+# first start sends the "bot is now active" messages.
+def start_worker(worker, listen_fd):
+    env = dict(os.environ)
+    env.update({
+        'WEBHOOK_WORKER': str(worker.index),
+        'WEBHOOK_LISTEN_FD': str(listen_fd),
+        'WEBHOOK_SHARED': '1',
+        'WEBHOOK_STARTUP_MESSAGES': '1' if worker.index == 0 and worker.starts == 0 else '0',
+    })
+    # Workers get their own session so a Ctrl-C reaches them once, through the supervisor
+    worker.process = subprocess.Popen([sys.executable, WORKER_SCRIPT], env=env, pass_fds=(listen_fd,),
+                                      start_new_session=True)
+    worker.started = time.monotonic()
+    worker.starts += 1
+    worker.restart_at = None
+    log.info("Started webhook worker", extra={'worker': worker.index, 'pid': worker.process.pid, 'starts': worker.starts})
+
+
+# Notice workers that exited and restart them after their backoff
+def check_workers(workers, listen_fd):
+    now = time.monotonic()
+    for worker in workers:
+        if worker.restart_at is None:
+            code = worker.process.poll()
+            if code is None:
+                continue
+            if now - worker.started > RESTART_RESET:
+                worker.delay = RESTART_DELAY
+            worker.restart_at = now + worker.delay
+            log.warning("Webhook worker exited", extra={
+                'worker': worker.index, 'pid': worker.process.pid, 'exit_code': code, 'restart_in': worker.delay,
+            })
+            worker.delay = min(worker.delay * 2, RESTART_DELAY_MAX)
+        elif now >= worker.restart_at:
+            start_worker(worker, listen_fd)
+
+
+# Ask every worker to shut down as if interrupted, then kill any that don't
+def stop_workers(workers):
+    running = [worker.process for worker in workers if worker.process.poll() is None]
+    for process in running:
+        process.send_signal(signal.SIGINT)
+    deadline = time.monotonic() + STOP_TIMEOUT
+    for process in running:
+        try:
+            process.wait(max(0.0, deadline - time.monotonic()))
+        except subprocess.TimeoutExpired:
+            log.warning("Killing webhook worker that didn't stop", extra={'pid': process.pid})
+            process.kill()
+            process.wait()
+
+
+def main(processes=WEBHOOK_PROCESSES, port=PORT):
+    setup_logging()
+    listener = socket.create_server(('0.0.0.0', port), backlog=128)
+    listener.set_inheritable(True)
+    log.info("Starting webhook workers", extra={'port': port, 'processes': processes})
+
+    stopping = []
+
+    def stop(signum, frame):
+        stopping.append(signum)
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    workers = [Worker(index) for index in range(max(1, processes))]
+    try:
+        for worker in workers:
+            start_worker(worker, listener.fileno())
+        while not stopping:
+            check_workers(workers, listener.fileno())
+            time.sleep(0.5)
+    finally:
+        log.info("Stopping webhook workers")
+        stop_workers([worker for worker in workers if worker.process is not None])
+        listener.close()
+
+
+if __name__ == "__main__":
+    main()